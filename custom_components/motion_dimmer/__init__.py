@@ -1,64 +1,149 @@
 """The Motion Dimmers integration."""
 
+from __future__ import annotations
+
 import logging
+from typing import TYPE_CHECKING
 
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform, EVENT_HOMEASSISTANT_STARTED
-from homeassistant.core import HomeAssistant, ServiceCall
-from homeassistant.helpers.typing import ConfigType
-from homeassistant.helpers.event import (
-    async_track_state_change,
-    async_track_state_change_event,
-)
 from .const import (
+    CONF_ADAPTIVE_INTERVAL,
     CONF_DIMMER,
+    CONF_EXTENSION_STRATEGY,
     CONF_FRIENDLY_NAME,
+    CONF_GROUP_BY,
     CONF_INPUT_SELECT,
+    CONF_MAX_IN_FLIGHT,
     CONF_PREDICTORS,
+    CONF_PUMP_MODE,
     CONF_SCRIPT,
     CONF_TRIGGERS,
     CONF_UNIQUE_NAME,
+    DATA_CONFIG,
+    DATA_LOAD,
+    DATA_SCHEDULER,
+    DEFAULT_EXTENSION_STRATEGY,
+    DEFAULT_GROUP_BY,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_PUMP_MODE,
     DOMAIN,
+    SERVICE_AUTOTUNE,
+    SERVICE_CAPTURE_TRACE,
     SERVICE_DISABLE,
     SERVICE_ENABLE,
     SERVICE_FINISH_TIMER,
+    SERVICE_GET_TRACE,
+    SERVICE_PROFILE,
+    SERVICE_TRACE_MEMORY,
 )
-from .models import MotionDimmer, MotionDimmerData, MotionDimmerHA
-from .services import (
-    async_service_enable,
-    service_finish_timer,
-    async_service_temporarily_disable,
-)
+
+# Home Assistant is only imported once the integration is set up, so the
+# decision logic in the core module can be used without it.
+if TYPE_CHECKING:
+    from homeassistant.config_entries import ConfigEntry
+    from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse
+    from homeassistant.helpers.typing import ConfigType
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [
-    Platform.DATETIME,
-    Platform.LIGHT,
-    Platform.NUMBER,
-    Platform.SENSOR,
-    Platform.SWITCH,
+PLATFORMS: list[str] = [
+    "datetime",
+    "light",
+    "number",
+    "sensor",
+    "switch",
 ]
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType):
     """Handle the setup tasks."""
+    from homeassistant.core import SupportsResponse
+
+    # The settings shared by every Motion Dimmer, validated by the config module.
+    hass.data[DATA_CONFIG] = config.get(DOMAIN, {})
+
+    # The service handlers are imported when a service is first called.
 
     async def async_temporarily_disable(call: ServiceCall):
+        from .services import async_service_temporarily_disable
+
         await async_service_temporarily_disable(hass, call)
 
     hass.services.async_register(DOMAIN, SERVICE_DISABLE, async_temporarily_disable)
 
     async def async_enable(call: ServiceCall):
+        from .services import async_service_enable
+
         await async_service_enable(hass, call)
 
     hass.services.async_register(DOMAIN, SERVICE_ENABLE, async_enable)
 
     def finish_timer(call: ServiceCall):
+        from .services import service_finish_timer
+
         service_finish_timer(hass, call)
 
     hass.services.async_register(DOMAIN, SERVICE_FINISH_TIMER, finish_timer)
 
+    def get_trace(call: ServiceCall) -> ServiceResponse:
+        from .services import service_get_trace
+
+        return service_get_trace(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_TRACE,
+        get_trace,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_capture_trace(call: ServiceCall) -> ServiceResponse:
+        from .services import async_service_capture_trace
+
+        return await async_service_capture_trace(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_CAPTURE_TRACE,
+        async_capture_trace,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_profile(call: ServiceCall) -> ServiceResponse:
+        from .services import async_service_profile
+
+        return await async_service_profile(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE,
+        async_profile,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+    async def async_trace_memory(call: ServiceCall) -> ServiceResponse:
+        from .services import async_service_trace_memory
+
+        return await async_service_trace_memory(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_TRACE_MEMORY,
+        async_trace_memory,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_autotune(call: ServiceCall) -> ServiceResponse:
+        from .services import async_service_autotune
+
+        return await async_service_autotune(hass, call)
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_AUTOTUNE,
+        async_autotune,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
     return True
 
 
@@ -67,64 +152,141 @@ async def async_setup_entry(
     entry: ConfigEntry,
 ) -> bool:
     """Set up Motion Dimmers from a config entry."""
+    from homeassistant.helpers import entity_registry as er
+    from homeassistant.helpers.start import async_at_started
+
+    from .models import (
+        CommandScheduler,
+        LoadMonitor,
+        MotionDimmer,
+        MotionDimmerData,
+        MotionDimmerHA,
+        async_track_dimmer,
+        async_track_predictors,
+        async_track_triggers,
+        entry_budgets,
+    )
+
     hass.data.setdefault(DOMAIN, {})
+    load: LoadMonitor = hass.data.setdefault(DATA_LOAD, LoadMonitor(hass))
+    load.async_start()
+    entry.async_on_unload(load.async_stop)
+    if DATA_SCHEDULER not in hass.data:
+        config = hass.data.get(DATA_CONFIG, {})
+        hass.data[DATA_SCHEDULER] = CommandScheduler(
+            hass,
+            config.get(CONF_MAX_IN_FLIGHT, DEFAULT_MAX_IN_FLIGHT),
+            config.get(CONF_GROUP_BY, DEFAULT_GROUP_BY),
+        )
 
     data = MotionDimmerData(
         device_id=entry.data[CONF_UNIQUE_NAME],
         device_name=entry.data[CONF_FRIENDLY_NAME],
-        dimmer=entry.options.get(CONF_DIMMER, None),
+        dimmers=entry.options.get(CONF_DIMMER, []),
         input_select=entry.options.get(CONF_INPUT_SELECT, None),
         triggers=entry.options.get(CONF_TRIGGERS, None),
         predictors=entry.options.get(CONF_PREDICTORS, None),
         script=entry.options.get(CONF_SCRIPT, None),
         motion_dimmer=None,
+        budgets=entry_budgets(entry),
+        adaptive_interval=entry.options.get(CONF_ADAPTIVE_INTERVAL, False),
+        extension_strategy=entry.options.get(
+            CONF_EXTENSION_STRATEGY, DEFAULT_EXTENSION_STRATEGY
+        ),
+        pump_mode=entry.options.get(CONF_PUMP_MODE, DEFAULT_PUMP_MODE),
     )
     hass.data[DOMAIN][entry.entry_id] = data
     data.motion_dimmer = MotionDimmer(MotionDimmerHA(hass, entry.entry_id))
     entry.async_on_unload(entry.add_update_listener(update_listener))
 
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    # Cancel every listener and timer of the Motion Dimmer on unload.
+    listeners = data.listeners
+    entry.async_on_unload(listeners.async_cancel_all)
 
-    # Initialize any timers that were running before shutdown.
-    hass.bus.async_listen_once(
-        EVENT_HOMEASSISTANT_STARTED, data.motion_dimmer.init_timer
+    # Entity ids are cached by the adapter until the registry changes.
+    listeners.async_add_listener(
+        hass.bus.async_listen(
+            er.EVENT_ENTITY_REGISTRY_UPDATED,
+            data.motion_dimmer.adapter.async_clear_entity_ids,
+        )
     )
 
-    # Add dimmer state listener
-    if data.dimmer:
-        # adapter = data.motion_dimmer.adapter
-        async_track_state_change_event(
-            hass,
-            data.dimmer,
-            data.motion_dimmer.dimmer_state_callback,
-        )
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
-    # Add trigger on listener
-    if data.triggers:
-        async_track_state_change(
-            hass,
-            data.triggers,
-            data.motion_dimmer.triggered_callback,
-            to_state="on",
-        )
+    # Initialize any timers that were running before shutdown or reload.
+    listeners.async_add_listener(
+        async_at_started(hass, data.motion_dimmer.init_timer)
+    )
 
-    # Add predictor on listener
-    if data.predictors:
-        async_track_state_change(
-            hass,
-            data.predictors,
-            data.motion_dimmer.predictor_callback,
-            to_state="on",
-        )
+    async_track_dimmer(hass, data)
+    async_track_triggers(hass, data)
+    async_track_predictors(hass, data)
 
     return True
 
 
 async def update_listener(hass: HomeAssistant, entry):
     """Handle options update."""
-    await hass.config_entries.async_reload(entry.entry_id)
+    from .models import (
+        MotionDimmerData,
+        async_track_dimmer,
+        async_track_predictors,
+        async_track_triggers,
+        entry_budgets,
+    )
+
+    data: MotionDimmerData | None = hass.data[DOMAIN].get(entry.entry_id)
+    options = entry.options
+
+    # The entities depend on the dropdown options and on having predictors.
+    if (
+        data is None
+        or data.input_select != options.get(CONF_INPUT_SELECT)
+        or bool(data.predictors) != bool(options.get(CONF_PREDICTORS))
+    ):
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
+
+    # Apply everything else in place, keeping the running timers.
+    data.script = options.get(CONF_SCRIPT)
+    data.budgets = entry_budgets(entry)
+    data.adaptive_interval = options.get(CONF_ADAPTIVE_INTERVAL, False)
+    data.extension_strategy = options.get(
+        CONF_EXTENSION_STRATEGY, DEFAULT_EXTENSION_STRATEGY
+    )
+    data.pump_mode = options.get(CONF_PUMP_MODE, DEFAULT_PUMP_MODE)
+
+    if data.dimmers != options.get(CONF_DIMMER, []):
+        data.dimmers = options.get(CONF_DIMMER, [])
+        async_track_dimmer(hass, data)
+
+    if data.triggers != options.get(CONF_TRIGGERS):
+        data.triggers = options.get(CONF_TRIGGERS)
+        async_track_triggers(hass, data)
+
+    if data.predictors != options.get(CONF_PREDICTORS):
+        data.predictors = options.get(CONF_PREDICTORS)
+        async_track_predictors(hass, data)
+
+
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Migrate an entry to the current version."""
+    if entry.version > 2:
+        return False
+
+    if entry.version == 1:
+        # A Motion Dimmer controls a list of dimmers since version 2.
+        options = dict(entry.options)
+        if dimmer := options.get(CONF_DIMMER):
+            options[CONF_DIMMER] = [dimmer] if isinstance(dimmer, str) else dimmer
+        hass.config_entries.async_update_entry(entry, options=options, version=2)
+
+    return True
 
 
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
-    return await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok := await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        hass.data[DOMAIN].pop(entry.entry_id)
+
+    return unload_ok
@@ -0,0 +1,197 @@
+"""Recommend Motion Dimmer settings from recorded motion.
+
+The seconds of each dropdown option, the maximum extension and the trigger
+test interval are chosen so that at most a target share of the times the
+light turned off were false-offs, with the least time on. The seconds are
+tuned first with the current extension and interval, then the extension and
+interval with the tuned seconds. It does not depend on Home Assistant.
+
+    python -m custom_components.motion_dimmer.autotune events.jsonl \\
+        --false-off-rate 0.05
+
+The recommendations are printed as JSON lines.
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import sys
+from typing import NamedTuple, TypeVar
+
+from .const import DEFAULT_FALSE_OFF_RATE, DEFAULT_FALSE_OFF_SECS, DEFAULT_SEG_SECONDS
+from .history import connect, entry_events
+from .replay import ReplayEvent, read_events, segment_seconds
+from .sweep import SWEEP_SETTINGS, grid, sweep
+
+CANDIDATE_SECONDS = (15, 30, 45, 60, 90, 120, 180, 300, 600, 900, 1800)
+CANDIDATE_EXTENSION_MAX = (0, 300, 900, 1800, 3600, 7200)
+CANDIDATE_TRIGGER_INTERVAL = (0, 15, 30, 59, 120)
+
+_T = TypeVar("_T")
+
+
+class Recommendation(NamedTuple):
+    """The recommended settings of a dimmer and how it behaves with them."""
+
+    dimmer: str
+    segments: dict[str, float]
+    extension_max: float
+    trigger_interval: float
+    false_off_rate: float
+    on_hours: float
+    commands_per_hour: float
+
+
+def false_off_rate(false_offs: int, turn_offs: int) -> float:
+    """The share of the turn offs that were false-offs."""
+    return false_offs / turn_offs if turn_offs else 0.0
+
+
+def choose(
+    candidates: list[tuple[_T, float, float, float]], target_rate: float
+) -> _T:
+    """Choose from (value, false-off rate, on hours, commands per hour).
+
+    The value with the least on time within the target rate wins, or the one
+    with the lowest rate if none is within it.
+    """
+    within = [candidate for candidate in candidates if candidate[1] <= target_rate]
+    if within:
+        return min(within, key=lambda candidate: (candidate[2], candidate[3]))[0]
+    return min(candidates, key=lambda candidate: (candidate[1], candidate[2]))[0]
+
+
+def tune(
+    dimmer: str,
+    events: list[ReplayEvent],
+    settings: dict | None = None,
+    target_rate: float = DEFAULT_FALSE_OFF_RATE,
+    false_off_secs: float = DEFAULT_FALSE_OFF_SECS,
+    workers: int | None = None,
+) -> Recommendation | None:
+    """Recommend settings for a dimmer, starting from its current settings.
+
+    Returns None if there are no events. Options the light never turned off
+    in keep their seconds.
+    """
+    if not events:
+        return None
+
+    current = {**SWEEP_SETTINGS, **(settings or {})}
+    segments = current["seconds"]
+    if isinstance(segments, dict):
+        segments = {**segment_seconds(events, DEFAULT_SEG_SECONDS), **segments}
+    else:
+        segments = segment_seconds(events, segments)
+    streams = {dimmer: events}
+
+    # Every option gets the same seconds, and each turn off counts for the
+    # option selected when the timer started.
+    results = sweep(
+        streams,
+        [{**current, "seconds": seconds} for seconds in CANDIDATE_SECONDS],
+        false_off_secs,
+        workers,
+    )
+    for option in {option for result in results for option in result.options}:
+        candidates = [
+            (
+                seconds,
+                false_off_rate(outcome.false_offs, outcome.turn_offs),
+                outcome.on_hours,
+                0,
+            )
+            for seconds, result in zip(CANDIDATE_SECONDS, results)
+            if (outcome := result.options.get(option))
+        ]
+        segments[option] = choose(candidates, target_rate)
+
+    combinations = [
+        {**current, **combination}
+        for combination in grid(
+            seconds=[segments],
+            extension_max=CANDIDATE_EXTENSION_MAX,
+            trigger_interval=CANDIDATE_TRIGGER_INTERVAL,
+        )
+    ]
+    results = sweep(streams, combinations, false_off_secs, workers)
+    best = choose(
+        [
+            (
+                result,
+                false_off_rate(result.false_offs, result.turn_offs),
+                result.on_hours,
+                result.commands_per_hour,
+            )
+            for result in results
+        ],
+        target_rate,
+    )
+    return Recommendation(
+        dimmer,
+        segments,
+        best.settings["extension_max"],
+        best.settings["trigger_interval"],
+        false_off_rate(best.false_offs, best.turn_offs),
+        best.on_hours,
+        best.commands_per_hour,
+    )
+
+
+def tune_history(
+    database: str,
+    dimmer: str,
+    options: dict,
+    settings: dict | None = None,
+    start: float = 0,
+    end: float = float("inf"),
+    target_rate: float = DEFAULT_FALSE_OFF_RATE,
+    false_off_secs: float = DEFAULT_FALSE_OFF_SECS,
+    workers: int | None = 1,
+) -> Recommendation | None:
+    """Recommend settings for an entry from the recorder database."""
+    connection = connect(database)
+    try:
+        events = list(entry_events(connection, options, start, end))
+    finally:
+        connection.close()
+
+    return tune(dimmer, events, settings, target_rate, false_off_secs, workers)
+
+
+def tuning_process() -> ProcessPoolExecutor:
+    """A process to tune in, so the replays do not hold the caller's GIL.
+
+    The process is spawned, since forking a process with running threads
+    can deadlock.
+    """
+    return ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Recommend settings for the dimmers in a file of events."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("events", type=argparse.FileType("r"))
+    parser.add_argument("--false-off-rate", type=float, default=DEFAULT_FALSE_OFF_RATE)
+    parser.add_argument("--false-off", type=float, default=DEFAULT_FALSE_OFF_SECS)
+    parser.add_argument("--workers", type=int, help="defaults to the number of cores")
+    args = parser.parse_args(argv)
+
+    for dimmer, events in read_events(args.events).items():
+        recommendation = tune(
+            dimmer,
+            events,
+            target_rate=args.false_off_rate,
+            false_off_secs=args.false_off,
+            workers=args.workers,
+        )
+        sys.stdout.write(json.dumps(recommendation._asdict()) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Validate the Motion Dimmers settings in configuration.yaml.
+
+The settings are shared by every Motion Dimmer. They are validated here
+instead of with CONFIG_SCHEMA in the integration module, which does not
+import Home Assistant.
+"""
+
+from __future__ import annotations
+
+import voluptuous as vol
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.typing import ConfigType
+
+from .const import (
+    CONF_GROUP_BY,
+    CONF_MAX_IN_FLIGHT,
+    DEFAULT_GROUP_BY,
+    DEFAULT_MAX_IN_FLIGHT,
+    DOMAIN,
+    GROUP_INTEGRATION,
+    GROUP_MESH,
+    GROUP_NONE,
+)
+
+CONFIG_SCHEMA = vol.Schema(
+    {
+        DOMAIN: vol.Schema(
+            {
+                vol.Optional(
+                    CONF_MAX_IN_FLIGHT, default=DEFAULT_MAX_IN_FLIGHT
+                ): vol.All(vol.Coerce(int), vol.Range(min=1)),
+                vol.Optional(CONF_GROUP_BY, default=DEFAULT_GROUP_BY): vol.In(
+                    [GROUP_NONE, GROUP_INTEGRATION, GROUP_MESH]
+                ),
+            }
+        )
+    },
+    extra=vol.ALLOW_EXTRA,
+)
+
+
+async def async_validate_config(hass: HomeAssistant, config: ConfigType) -> ConfigType:
+    """Validate the integration-wide settings."""
+    return CONFIG_SCHEMA(config)
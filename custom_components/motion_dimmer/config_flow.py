@@ -14,17 +14,37 @@ from homeassistant.components.light import DOMAIN as LIGHT_DOMAIN
 from homeassistant.components.script import DOMAIN as SCRIPT_DOMAIN
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
-from homeassistant.helpers.selector import EntitySelector, EntitySelectorConfig
+from homeassistant.helpers.selector import (
+    BooleanSelector,
+    EntitySelector,
+    EntitySelectorConfig,
+    NumberSelector,
+    NumberSelectorConfig,
+    NumberSelectorMode,
+    SelectSelector,
+    SelectSelectorConfig,
+)
 
 from .const import (
+    CALLBACK_BUDGETS,
+    CONF_ADAPTIVE_INTERVAL,
     CONF_DIMMER,
+    CONF_EXTENSION_STRATEGY,
     CONF_FRIENDLY_NAME,
     CONF_INPUT_SELECT,
     CONF_PREDICTORS,
+    CONF_PUMP_MODE,
     CONF_SCRIPT,
     CONF_TRIGGERS,
     CONF_UNIQUE_NAME,
+    DEFAULT_CALLBACK_BUDGET,
+    DEFAULT_EXTENSION_STRATEGY,
+    DEFAULT_PUMP_MODE,
     DOMAIN,
+    EXTENSION_HEURISTIC,
+    EXTENSION_LEARNED,
+    PUMP_ALWAYS,
+    PUMP_LEARNED,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -48,7 +68,7 @@ async def validate_input(hass: HomeAssistant, data: dict[str, Any]) -> dict[str,
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Motion Dimmers."""
 
-    VERSION = 1
+    VERSION = 2
 
     @staticmethod
     @callback
@@ -94,6 +114,24 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             return self.async_create_entry(data=user_input)
 
         entry = self.config_entry
+        budgets = {
+            vol.Optional(
+                option,
+                description={
+                    "suggested_value": entry.options.get(
+                        option, DEFAULT_CALLBACK_BUDGET
+                    )
+                },
+            ): NumberSelector(
+                NumberSelectorConfig(
+                    min=0,
+                    max=60000,
+                    mode=NumberSelectorMode.BOX,
+                    unit_of_measurement="ms",
+                ),
+            )
+            for option in CALLBACK_BUDGETS.values()
+        }
 
         return self.async_show_form(
             step_id="init",
@@ -105,7 +143,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                     ): EntitySelector(
                         EntitySelectorConfig(
                             domain=[LIGHT_DOMAIN],
-                            multiple=False,
+                            multiple=True,
                         ),
                     ),
                     vol.Required(
@@ -144,6 +182,41 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                             multiple=False,
                         ),
                     ),
+                    vol.Optional(
+                        CONF_ADAPTIVE_INTERVAL,
+                        description={
+                            "suggested_value": entry.options.get(
+                                CONF_ADAPTIVE_INTERVAL, False
+                            )
+                        },
+                    ): BooleanSelector(),
+                    vol.Optional(
+                        CONF_EXTENSION_STRATEGY,
+                        description={
+                            "suggested_value": entry.options.get(
+                                CONF_EXTENSION_STRATEGY, DEFAULT_EXTENSION_STRATEGY
+                            )
+                        },
+                    ): SelectSelector(
+                        SelectSelectorConfig(
+                            options=[EXTENSION_HEURISTIC, EXTENSION_LEARNED],
+                            translation_key=CONF_EXTENSION_STRATEGY,
+                        ),
+                    ),
+                    vol.Optional(
+                        CONF_PUMP_MODE,
+                        description={
+                            "suggested_value": entry.options.get(
+                                CONF_PUMP_MODE, DEFAULT_PUMP_MODE
+                            )
+                        },
+                    ): SelectSelector(
+                        SelectSelectorConfig(
+                            options=[PUMP_ALWAYS, PUMP_LEARNED],
+                            translation_key=CONF_PUMP_MODE,
+                        ),
+                    ),
+                    **budgets,
                 }
             ),
         )
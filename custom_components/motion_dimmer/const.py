@@ -1,11 +1,13 @@
 """Constants for the Motion Dimmers integration."""
 
 from dataclasses import dataclass
-from enum import Enum
-
-from homeassistant.const import Platform
+from enum import Enum, IntEnum
 
 DOMAIN = "motion_dimmer"
+# Objects shared by all Motion Dimmers.
+DATA_LOAD = f"{DOMAIN}_load"
+DATA_SCHEDULER = f"{DOMAIN}_scheduler"
+DATA_CONFIG = f"{DOMAIN}_config"
 
 CONF_UNIQUE_NAME = "unique_name"
 CONF_FRIENDLY_NAME = "friendly_name"
@@ -14,6 +16,23 @@ CONF_INPUT_SELECT = "input_select"
 CONF_TRIGGERS = "triggers"
 CONF_PREDICTORS = "predictors"
 CONF_SCRIPT = "script"
+CONF_ADAPTIVE_INTERVAL = "adaptive_interval"
+CONF_EXTENSION_STRATEGY = "extension_strategy"
+CONF_PUMP_MODE = "pump_mode"
+CONF_BUDGET_TRIGGER = "budget_trigger"
+CONF_BUDGET_PREDICTOR = "budget_predictor"
+CONF_BUDGET_DIMMER_STATE = "budget_dimmer_state"
+CONF_BUDGET_TIMER = "budget_timer"
+CONF_MAX_IN_FLIGHT = "max_in_flight"
+CONF_GROUP_BY = "group_by"
+
+# Options holding the latency budget of each callback type.
+CALLBACK_BUDGETS = {
+    "trigger": CONF_BUDGET_TRIGGER,
+    "predictor": CONF_BUDGET_PREDICTOR,
+    "dimmer_state": CONF_BUDGET_DIMMER_STATE,
+    "timer": CONF_BUDGET_TIMER,
+}
 
 DEFAULT_SEG_SECONDS = 60
 DEFAULT_PREDICTION_BRIGHTNESS = 50
@@ -22,18 +41,88 @@ DEFAULT_MANUAL_OVERRIDE = 60 * 10
 DEFAULT_EXTENSION_MAX = 60 * 60
 DEFAULT_TRIGGER_INTERVAL = 59
 DEFAULT_MIN_BRIGHTNESS = 1
+DEFAULT_CALLBACK_BUDGET = 500
+# Motion this soon after the dimmer turned off means it turned off on someone.
+DEFAULT_FALSE_OFF_SECS = 30
+# The share of false-offs the tuned settings aim for.
+DEFAULT_FALSE_OFF_RATE = 0.05
+DEFAULT_TUNE_DAYS = 28
 
 PUMP_TIME = 1
+# How dimmers set below the minimum brightness are turned on: always pumped,
+# or pumped only below the lowest brightness they were seen to turn on at.
+PUMP_ALWAYS = "always"
+PUMP_LEARNED = "learned"
+DEFAULT_PUMP_MODE = PUMP_ALWAYS
+TIMER = "timer"
+PERIODIC_TIMER = "periodic"
+PUMP_TIMER = "pump"
 SMALL_TIME_OFF = 20
 LONG_TIME_OFF = 60 * 20
+# How the trigger hold times are learned for the adaptive interval.
+HOLD_SMOOTHING = 0.2
+HOLD_DEVIATIONS = 2
+# How the timer is extended: the fixed rules or pauses learned per option.
+EXTENSION_HEURISTIC = "heuristic"
+EXTENSION_LEARNED = "learned"
+DEFAULT_EXTENSION_STRATEGY = EXTENSION_HEURISTIC
+EXTENSION_SMOOTHING = 0.2
+EXTENSION_DEVIATIONS = 2
+
+# How many light commands may be in flight at once, across all Motion
+# Dimmers or for the lights of each integration or mesh (config entry).
+DEFAULT_MAX_IN_FLIGHT = 8
+GROUP_NONE = "none"
+GROUP_INTEGRATION = "integration"
+GROUP_MESH = "mesh"
+DEFAULT_GROUP_BY = GROUP_NONE
+
+
+class CommandPriority(IntEnum):
+    """The priority of a light command, the most urgent first."""
+
+    TRIGGER = 1
+    RECOVERY = 2
+    TURN_OFF = 3
+    PREDICTION = 4
+    PUMP = 5
+
+
+COMMAND_CONFIRM_TIMEOUT = 30
+CONFIRM_BRIGHTNESS_MARGIN = 3
+
+TRACE_SIZE = 100
+TRACE_MAX_EVENTS = 100_000
+DEFAULT_CAPTURE_SECS = 60
+DEFAULT_TOP = 20
+TRACEMALLOC_FRAMES = 25
+SLOW_CALLBACK_STREAK = 5
+LOAD_PROBE_INTERVAL = 5
+LOAD_SHED_LAG = 0.5
+LOAD_LAG_SMOOTHING = 0.3
+ISSUE_SLOW_CALLBACKS = "slow_callbacks"
 
 SENSOR_END_TIME = "end_time"
 SENSOR_DURATION = "duration"
 SENSOR_IDLE = "idle"
 SENSOR_ACTIVE = "active"
-
+SENSOR_LAST = "last"
+SENSOR_MAX = "max"
+SENSOR_CONFIRMED = "confirmed"
+SENSOR_UNCONFIRMED = "unconfirmed"
+
+SERVICE_APPLY = "apply"
+SERVICE_AUTOTUNE = "autotune"
+SERVICE_DAYS = "days"
 SERVICE_ENABLE = "enable"
+SERVICE_FALSE_OFF_RATE = "false_off_rate"
 SERVICE_FINISH_TIMER = "finish_timer"
+SERVICE_GET_TRACE = "get_trace"
+SERVICE_CAPTURE_TRACE = "capture_trace"
+SERVICE_DURATION = "duration"
+SERVICE_PROFILE = "profile"
+SERVICE_TOP = "top"
+SERVICE_TRACE_MEMORY = "trace_memory"
 SERVICE_DISABLE = "temporarily_disable"
 SERVICE_SECONDS = "seconds"
 SERVICE_MINUTES = "minutes"
@@ -55,14 +144,15 @@ class ControlEntityData:
 class ControlEntities(ControlEntityData, Enum):
     """Entities used to control functionality."""
 
-    DISABLED_UNTIL = (Platform.DATETIME, "disabled_until")
-    MIN_BRIGHTNESS = (Platform.NUMBER, "brightness_min")
-    TRIGGER_INTERVAL = (Platform.NUMBER, "trigger_interval")
-    EXTENSION_MAX = (Platform.NUMBER, "extension_max")
-    MANUAL_OVERRIDE = (Platform.NUMBER, "manual_override")
-    PREDICTION_SECS = (Platform.NUMBER, "prediction_secs")
-    PREDICTION_BRIGHTNESS = (Platform.NUMBER, "prediction_brightness")
-    SEG_SECONDS = (Platform.NUMBER, "seconds")
-    SEG_LIGHT = (Platform.LIGHT, "light")
-    CONTROL_SWITCH = (Platform.SWITCH, "control")
-    TIMER = (Platform.SENSOR, "timer")
+    DISABLED_UNTIL = ("datetime", "disabled_until")
+    MIN_BRIGHTNESS = ("number", "brightness_min")
+    TRIGGER_INTERVAL = ("number", "trigger_interval")
+    EXTENSION_MAX = ("number", "extension_max")
+    MANUAL_OVERRIDE = ("number", "manual_override")
+    PREDICTION_SECS = ("number", "prediction_secs")
+    PREDICTION_BRIGHTNESS = ("number", "prediction_brightness")
+    SEG_SECONDS = ("number", "seconds")
+    SEG_LIGHT = ("light", "light")
+    CONTROL_SWITCH = ("switch", "control")
+    TIMER = ("sensor", "timer")
+    LATENCY = ("sensor", "latency")
@@ -0,0 +1,1343 @@
+"""The Motion Dimmer decision logic.
+
+This module does not depend on Home Assistant, so it imports quickly and the
+production logic can run in simulations and tests with any adapter.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from .const import (
+    COMMAND_CONFIRM_TIMEOUT,
+    CONFIRM_BRIGHTNESS_MARGIN,
+    DEFAULT_FALSE_OFF_SECS,
+    EXTENSION_DEVIATIONS,
+    EXTENSION_HEURISTIC,
+    EXTENSION_LEARNED,
+    EXTENSION_SMOOTHING,
+    HOLD_DEVIATIONS,
+    HOLD_SMOOTHING,
+    LONG_TIME_OFF,
+    PUMP_LEARNED,
+    PUMP_TIME,
+    SENSOR_ACTIVE,
+    SENSOR_IDLE,
+    SLOW_CALLBACK_STREAK,
+    SMALL_TIME_OFF,
+    TRACE_SIZE,
+    CommandPriority,
+)
+from .tracing import instrumented
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Clock:
+    """The system clock.
+
+    Durations are measured with the monotonic clock, so changes to the wall
+    clock do not affect them. The wall clock is only used for times that are
+    published or compared with entity states.
+    """
+
+    def monotonic(self) -> float:
+        """Seconds since an arbitrary point, only useful for durations."""
+        return time.monotonic()
+
+    def time(self) -> float:
+        """Seconds since the epoch."""
+        return time.time()
+
+    def now(self) -> datetime:
+        """The current wall clock time."""
+        return datetime.fromtimestamp(self.time(), UTC)
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when advanced, for simulations."""
+
+    def __init__(self, start: datetime | None = None) -> None:
+        """Initialize the clock at the start time."""
+        self._time = (start or datetime.now(UTC)).timestamp()
+        self._monotonic = 0.0
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock forward."""
+        self._time += seconds
+        self._monotonic += seconds
+
+    def monotonic(self) -> float:
+        """Seconds the clock was advanced."""
+        return self._monotonic
+
+    def time(self) -> float:
+        """Seconds since the epoch."""
+        return self._time
+
+
+class MotionDimmerAdapter:  # pragma: no cover
+    """Adapter for Motion Dimmer"""
+
+    @property
+    def are_triggers_on(self) -> bool:
+        """True if any triggers are on."""
+        raise NotImplementedError
+
+    @property
+    def brightness_min(self) -> float:
+        """The minimum brightness needed to activate the dimmer."""
+        raise NotImplementedError
+
+    @property
+    def callback_budgets(self) -> dict[str, float]:
+        """The number of seconds each type of callback may take."""
+        raise NotImplementedError
+
+    @property
+    def clock(self) -> Clock:
+        """The source of time for the Motion Dimmer."""
+        raise NotImplementedError
+
+    @property
+    def dimmers(self) -> list[str]:
+        """The entity ids of the dimmers, which are controlled together."""
+        raise NotImplementedError
+
+    @property
+    def disabled_until(self) -> datetime:
+        """The time Motion Dimmer is no longer disabled"""
+        raise NotImplementedError
+
+    @property
+    def extension_max(self) -> float:
+        """Maximum number of seconds the timer can be extended."""
+        raise NotImplementedError
+
+    @property
+    def extension_strategy(self) -> str:
+        """The name of the strategy that extends the timer."""
+        raise NotImplementedError
+
+    @property
+    def is_dimmer_on(self) -> bool:
+        """Is the dimmer currently on."""
+        raise NotImplementedError
+
+    @property
+    def is_segment_enabled(self) -> bool:
+        """Return true if segment is enabled."""
+        raise NotImplementedError
+
+    @property
+    def is_interval_adaptive(self) -> bool:
+        """Is the trigger test interval learned from the triggers."""
+        raise NotImplementedError
+
+    @property
+    def is_on(self) -> bool:
+        """Is Motion Dimmer enabled"""
+        raise NotImplementedError
+
+    @property
+    def is_overloaded(self) -> bool:
+        """Is Home Assistant too busy for non-essential work."""
+        raise NotImplementedError
+
+    @property
+    def manual_override(self) -> int:
+        """The number of seconds to temprarily disable."""
+        raise NotImplementedError
+
+    @property
+    def prediction_brightness(self) -> float:
+        """The brightness of the predictive activation."""
+        raise NotImplementedError
+
+    @property
+    def prediction_secs(self) -> float:
+        """The number of seconds to activate a prediction."""
+        raise NotImplementedError
+
+    @property
+    def pump_mode(self) -> str:
+        """How the dimmer is turned on below the minimum brightness."""
+        raise NotImplementedError
+
+    @property
+    def brightness(self) -> float:
+        """Get the brightness for the segment."""
+        raise NotImplementedError
+
+    @property
+    def color_mode(self) -> str:
+        """The color mode to set the dimmer to."""
+        raise NotImplementedError
+
+    @property
+    def color_temp(self) -> int:
+        """The color temp to set the dimmer to."""
+        raise NotImplementedError
+
+    @property
+    def rgb_color(self) -> tuple[int, int, int]:
+        """The color to set the dimmer to."""
+        raise NotImplementedError
+
+    @property
+    def seconds(self) -> float:
+        """Get the number of seconds for the segment."""
+        raise NotImplementedError
+
+    @property
+    def segment_id(self) -> str:
+        """The unique id of the segment."""
+        raise NotImplementedError
+
+    @property
+    def timer(self) -> TimerState:
+        """Get the state of the timer."""
+        raise NotImplementedError
+
+    @property
+    def trigger_interval(self) -> float:
+        """Number of seconds to wait before checking the triggers again."""
+        raise NotImplementedError
+
+    def cancel_periodic_timer(self) -> None:
+        """Cancel the periodic timer."""
+        raise NotImplementedError
+
+    def cancel_timer(self) -> None:
+        """Stop the timer."""
+        raise NotImplementedError
+
+    def clear_slow_callback_issue(self) -> None:
+        """Remove the repair issue for slow callbacks."""
+        raise NotImplementedError
+
+    def dimmer_state_callback(self, *args, **kwargs) -> dict:
+        """Callback when dimmer state changes."""
+        raise NotImplementedError
+
+    def measure_lag(self, *args, **kwargs) -> None:
+        """Measure how late a trigger or predictor callback runs."""
+        raise NotImplementedError
+
+    def raise_slow_callback_issue(self, kind: str, elapsed: float, budget: float):
+        """Raise a repair issue for callbacks that keep exceeding the budget."""
+        raise NotImplementedError
+
+    def schedule_periodic_timer(self, time, callback) -> None:
+        """Start the periodic timer to check triggers."""
+        raise NotImplementedError
+
+    def schedule_pump_timer(self, time, callback) -> None:
+        """Pump the dimmer for a short time."""
+        raise NotImplementedError
+
+    def schedule_timer(self, time: datetime, duration: str, callback) -> None:
+        """Start timer."""
+        raise NotImplementedError
+
+    def set_temporarily_disabled(self, next_time: datetime):
+        """Set the temporarily disabled field"""
+        raise NotImplementedError
+
+    def track_timer(self, timer_end, duration, state) -> None:
+        """Store changes in timer."""
+        raise NotImplementedError
+
+    def turn_on_dimmer(
+        self, priority: CommandPriority, dimmers: list[str] | None = None, **kwargs
+    ) -> None:
+        """Turn on the dimmers, or only the given ones."""
+        raise NotImplementedError
+
+    def turn_off_dimmer(self, priority: CommandPriority) -> None:
+        """Turn off dimmer."""
+        raise NotImplementedError
+
+    def turn_on_script(self) -> None:
+        """Turn on script."""
+        raise NotImplementedError
+
+
+def budgeted(kind: str) -> Callable:
+    """Measure each call of a Motion Dimmer callback against its budget."""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self: MotionDimmer, *args, **kwargs):
+            with self.budget.measure(kind):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class MotionDimmer:
+    """Representation of a Motion Dimmer."""
+
+    def __init__(self, adapter: MotionDimmerAdapter) -> None:
+        """Initialize the Motion Dimmer."""
+        self._adapter = adapter
+        self._clock = adapter.clock
+        self._is_prediction = False
+        self._is_pumping = False
+        self._was_dimmer_on = False
+        self._additional_time = 0
+        self._dimmer_time_on = self._clock.monotonic()
+        self._dimmer_time_off = self._clock.monotonic()
+        self._timer_end_time = self._clock.now()
+        self._timer_duration = "00:00:00"
+        self._timer_state = SENSOR_IDLE
+        self._stats = MotionDimmerStats()
+        self._trace = EventTrace(clock=self._clock)
+        self._budget = CallbackBudget(adapter, self._stats)
+        self._holds = TriggerHolds(self._clock)
+        self._extension: ExtensionStrategy = HeuristicExtension()
+        self._thresholds: dict[str, TurnOnThreshold] = {}
+        # The brightness sent to each dimmer without pumping, until the pump
+        # time is over.
+        self._probes: dict[str, float] = {}
+        # The dimmers pumped after their probe failed, which get the normal
+        # brightness when the pump time is over.
+        self._pumped: list[str] = []
+        # The timer runs out after a manual override, which goes ahead of
+        # everything but triggers.
+        self._is_recovering = False
+
+    @property
+    def adapter(self) -> MotionDimmerAdapter:
+        """Get the storage adapter."""
+        return self._adapter
+
+    @property
+    def additional_time(self) -> float:
+        """Number of seconds the timer is extended by."""
+        return self._additional_time
+
+    @property
+    def budget(self) -> CallbackBudget:
+        """Get the latency budget of the callbacks."""
+        return self._budget
+
+    @property
+    def clock(self) -> Clock:
+        """Get the source of time."""
+        return self._clock
+
+    @property
+    def device_id(self) -> str | None:
+        """The unique id of the Motion Dimmer device, if the adapter has one."""
+        return getattr(self.adapter, "device_id", None)
+
+    @property
+    def dimmer_on_seconds(self) -> int:
+        """Number of seconds the dimmer was on."""
+        return round(self._clock.monotonic() - self._dimmer_time_on)
+
+    @property
+    def dimmer_off_seconds(self) -> int:
+        """Number of seconds the dimmer was off."""
+        if self.adapter.is_dimmer_on:
+            return 0
+
+        return round(self._clock.monotonic() - self._dimmer_time_off)
+
+    @property
+    def duration(self) -> str:
+        """Get the duration."""
+        return self._timer_duration
+
+    @property
+    def end_time(self) -> datetime:
+        """Get the end time."""
+        return self._timer_end_time
+
+    @property
+    def extension(self) -> ExtensionStrategy:
+        """Get the strategy that extends the timer, as chosen in the adapter."""
+        name = self.adapter.extension_strategy
+        if self._extension.name != name:
+            self._extension = EXTENSION_STRATEGIES[name]()
+        return self._extension
+
+    @property
+    def holds(self) -> TriggerHolds:
+        """Get the learned trigger hold times."""
+        return self._holds
+
+    @property
+    def is_enabled(self) -> bool:
+        """Return true if device is enabled."""
+        # Motion Dimmer is on.
+        if not self.adapter.is_on:
+            return False
+
+        # Motion Dimmer is not temporarily disabled.
+        if self.is_temporarily_disabled:
+            return False
+
+        # Current segment is enabled.
+        return self.adapter.is_segment_enabled
+
+    @property
+    def is_temporarily_disabled(self) -> bool:
+        """Return true if device is temporarily disabled."""
+        return self._clock.now() < self.adapter.disabled_until
+
+    @property
+    def seconds(self) -> float:
+        """Number of seconds to turn the dimmer on."""
+        return self.adapter.seconds + self._additional_time
+
+    @property
+    def stats(self) -> MotionDimmerStats:
+        """Get the performance counters."""
+        return self._stats
+
+    def threshold(self, dimmer: str) -> TurnOnThreshold:
+        """Get the learned brightness a dimmer turns on at."""
+        if (threshold := self._thresholds.get(dimmer)) is None:
+            threshold = self._thresholds[dimmer] = TurnOnThreshold()
+        return threshold
+
+    @property
+    def trace(self) -> EventTrace:
+        """Get the trace of recent events."""
+        return self._trace
+
+    @property
+    def trigger_interval(self) -> float:
+        """Number of seconds to wait before checking the triggers again.
+
+        When adaptive, a check only comes before the timer runs out if the
+        triggers have been seen to stay on for the configured interval.
+        """
+        interval = self.adapter.trigger_interval
+        if interval == 0 or not self.adapter.is_interval_adaptive:
+            return interval
+
+        hold = self._holds.longest()
+        if hold is None or hold >= interval:
+            return interval
+
+        # The triggers reliably turn off first, so the timer checks them.
+        return max(interval, self.seconds)
+
+    def add_time(self) -> None:
+        """Add time to the timer."""
+        total = self.extension.extend(self)
+
+        # Make sure it is between 0 and max time.
+        total = min(self.adapter.extension_max, max(total, 0))
+
+        self._additional_time = total
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the internal state for diagnostics."""
+        return {
+            "additional_time": self._additional_time,
+            "is_prediction": self._is_prediction,
+            "is_pumping": self._is_pumping,
+            "is_recovering": self._is_recovering,
+            "was_dimmer_on": self._was_dimmer_on,
+            "dimmer_time_on": _isoformat(self._wall_time(self._dimmer_time_on)),
+            "dimmer_time_off": _isoformat(self._wall_time(self._dimmer_time_off)),
+            "timer_end_time": _isoformat(self._timer_end_time),
+            "timer_duration": self._timer_duration,
+            "timer_state": self._timer_state,
+            "stats": asdict(self.stats),
+            "budget": self.budget.as_dict(),
+            "extension": self.extension.as_dict(),
+            "holds": self.holds.as_dict(),
+            "thresholds": {
+                dimmer: threshold.as_dict()
+                for dimmer, threshold in self._thresholds.items()
+            },
+            "trace": self.trace.as_list(),
+        }
+
+    def _wall_time(self, monotonic: float) -> datetime:
+        """Convert a monotonic time to the wall clock time."""
+        return self._clock.now() - timedelta(
+            seconds=self._clock.monotonic() - monotonic
+        )
+
+    @instrumented("callback")
+    @budgeted("dimmer_state")
+    def dimmer_state_callback(self, *args, **kwargs) -> None:
+        """Check if dimmer was changed manually."""
+        self.stats.events_handled += 1
+        if not self.is_enabled:
+            # A probe in flight cannot tell the dimmer was changed by hand, so
+            # it is dropped instead of learned when the pump timer fires.
+            self._probes = {}
+            self.trace.record("dimmer_state", "disabled", self._timer_end_time)
+            return
+
+        # Pass callback to adapter for platform-specific handling.
+        change = self.adapter.dimmer_state_callback(*args, **kwargs)
+
+        # The dimmer turned on without pumping.
+        probe = self._probes.get(change.entity_id)
+        if probe is not None and change.is_on and not change.was_on:
+            self.threshold(change.entity_id).record(probe, True)
+
+        # Compare states.
+        same_state = change.was_on == change.is_on
+        same_bright = change.old_brightness == change.new_brightness
+        # Don't worry about changes in color or temp.
+
+        decision = "ignored"
+        if not same_state:
+            if change.is_on != self.adapter.are_triggers_on and not self._is_prediction:
+                decision = self.disable_temporarily()
+        elif not same_bright and not self._is_pumping:
+            # Give a 1 percent margin of error.
+            diff = self.adapter.brightness - change.new_brightness
+            if diff < -1 or diff > 1:
+                decision = self.disable_temporarily()
+
+        self.trace.record("dimmer_state", decision, self._timer_end_time)
+
+    def disable_temporarily(self) -> str:
+        """Disable all functionality for a time."""
+        seconds = self.adapter.manual_override
+        if seconds and int(seconds) > 0:
+            delay = timedelta(seconds=int(seconds))
+            next_time = self._clock.now() + delay
+        else:
+            return "ignored"  # pragma: no cover
+
+        # Only set a new disable if it is later than the old one.
+        if self.adapter.disabled_until < next_time:
+            # Schedule the timer to turn off dimmer after it is reenabled.
+            buffer = timedelta(seconds=5)
+            self.adapter.schedule_timer(
+                next_time + buffer, str(delay + buffer), self.timer_callback
+            )
+            self.adapter.set_temporarily_disabled(next_time)
+            self._is_recovering = True
+            return "disable"
+
+        return "already_disabled"
+
+    @instrumented("callback")
+    def init_timer(self, *args, **kwargs) -> None:
+        """Init timer."""
+        self.stats.events_handled += 1
+        timer = self.adapter.timer
+        self._timer_end_time = timer.end_time
+        self._timer_duration = timer.duration
+        self._timer_state = timer.state
+
+        # Check if timer was running on HA shutdown.
+        if timer.end_time and timer.end_time > self._clock.now():
+            # Restart timer because it hasn't finished.
+            self.schedule_timer(timer.end_time, timer.duration)
+            self.trace.record("init", "restore", self._timer_end_time)
+        elif timer.end_time and timer.state == SENSOR_ACTIVE:
+            # Finish timer.
+            self.timer_callback()
+
+    @instrumented("timer")
+    @budgeted("timer")
+    def periodic_callback(self, *args, **kwargs) -> None:
+        """Repeatedly check the triggers to reset the timer."""
+        self.stats.events_handled += 1
+        # Check if the segment has been disabled or we have transitioned
+        # to a disabled segment.
+        if self.is_enabled:
+            if self.adapter.are_triggers_on:
+                decision = self.start_dimmer()
+            else:
+                self.schedule_periodic_timer()
+                decision = "reschedule"
+        else:
+            decision = "disabled"
+
+        self.trace.record("periodic", decision, self._timer_end_time)
+
+    def predict(self):
+        """Start the dimmer based on a prediction."""
+        if self._is_prediction:
+            # Prediction brightness is > minimum and < regular brightness.
+            brightness = min(
+                max(self.adapter.prediction_brightness, self.adapter.brightness_min),
+                self.adapter.brightness,
+            )
+            delay = timedelta(seconds=self.adapter.prediction_secs)
+            self.turn_on_dimmer(brightness, CommandPriority.PREDICTION)
+            self.schedule_timer(self._clock.now() + delay, str(delay))
+            return True
+
+        return False
+
+    @instrumented("callback")
+    @budgeted("predictor")
+    def predictor_callback(self, *args, **kwargs) -> None:
+        """Run when predictors are activated."""
+        self.stats.events_handled += 1
+        self.adapter.measure_lag(*args, **kwargs)
+        # Do nothing if the dimmer is already on.
+        if self.adapter.is_dimmer_on:
+            decision = "dimmer_on"
+        elif not self.is_enabled:
+            decision = "disabled"
+        elif self.adapter.is_overloaded:
+            # Predictions are a nicety, leave the capacity to triggers.
+            self.stats.predictions_shed += 1
+            decision = "shed"
+        else:
+            decision = self.start_dimmer(is_prediction=True)
+
+        self.trace.record("predictor", decision, self._timer_end_time)
+
+    def pump(self) -> bool:
+        """Start the dimmer at a brightness above the target brightness."""
+        brightness = self.adapter.brightness
+        if (
+            not self._was_dimmer_on
+            and not self._is_pumping
+            and not self._is_prediction
+            and brightness < self.adapter.brightness_min
+        ):
+            if self.adapter.pump_mode == PUMP_LEARNED:
+                # The dimmers get the same command, so each has to turn on.
+                unknown = [
+                    dimmer
+                    for dimmer in self.adapter.dimmers
+                    if not self.threshold(dimmer).turns_on(brightness)
+                ]
+                if not unknown:
+                    return False
+
+                if not any(
+                    self.threshold(dimmer).stays_off(brightness) for dimmer in unknown
+                ):
+                    # Try without pumping and pump if it is not confirmed.
+                    self._probes = dict.fromkeys(unknown, brightness)
+                    self.schedule_pump_timer()
+                    return False
+
+            self._is_pumping = True
+            self.turn_on_dimmer(self.adapter.brightness_min, CommandPriority.PUMP)
+            self.schedule_pump_timer()
+            return True
+
+        return False
+
+    @instrumented("timer")
+    @budgeted("timer")
+    def pump_callback(self, *args, **kwargs) -> None:
+        """Turn on the dimmer to normal brightness after pump."""
+        self.stats.events_handled += 1
+        if self._probes:
+            decision = self.resolve_probes()
+        elif self._pumped:
+            decision = self.finish_pump()
+        else:
+            decision = self.start_dimmer() if self.is_enabled else "disabled"
+        self.trace.record("pump", decision, self._timer_end_time)
+
+    def resolve_probes(self) -> str:
+        """Pump the dimmers that did not turn on without pumping.
+
+        The timer and script were started with the probe, so only the failed
+        dimmers get commands.
+        """
+        probes, self._probes = self._probes, {}
+        failed = [
+            dimmer
+            for dimmer, probe in probes.items()
+            if not self.threshold(dimmer).turns_on(probe)
+        ]
+        if not failed:
+            return "confirmed"
+
+        for dimmer in failed:
+            self.threshold(dimmer).record(probes[dimmer], False)
+        if not self.is_enabled:
+            return "disabled"
+
+        self._is_pumping = True
+        self._pumped = failed
+        self.turn_on_dimmer(self.adapter.brightness_min, CommandPriority.PUMP, failed)
+        self.schedule_pump_timer()
+        return "pump"
+
+    def finish_pump(self) -> str:
+        """Set the pumped dimmers to the normal brightness."""
+        pumped, self._pumped = self._pumped, []
+        self._is_pumping = False
+        if not self.is_enabled:
+            return "disabled"
+
+        self.turn_on_dimmer(dimmers=pumped)
+        return "pumped"
+
+    def priority(self, priority: CommandPriority) -> CommandPriority:
+        """The priority of a light command, raised when recovering.
+
+        A pump keeps its priority, so the scheduler sends it before the
+        brightness that follows it.
+        """
+        if self._is_recovering and priority != CommandPriority.PUMP:
+            return min(priority, CommandPriority.RECOVERY)
+        return priority
+
+    def reset_dimmer_time_off(self) -> None:
+        """Reset dimmer time off."""
+        self._dimmer_time_off = self._clock.monotonic()
+
+    def reset_dimmer_time_on(self) -> None:
+        """Reset dimmer time on."""
+        self._dimmer_time_on = self._clock.monotonic()
+
+    def schedule_periodic_timer(self) -> None:
+        """Start the periodic timer to check triggers."""
+        trigger_interval = self.trigger_interval
+        if trigger_interval == 0:
+            return
+
+        next_time = self._clock.now() + timedelta(seconds=trigger_interval)
+        self.adapter.cancel_periodic_timer()
+        self.adapter.schedule_periodic_timer(next_time, self.periodic_callback)
+
+    def schedule_pump_timer(self) -> None:
+        """Pump the dimmer for a short time."""
+        next_time = self._clock.now() + timedelta(seconds=PUMP_TIME)
+        self.adapter.schedule_pump_timer(next_time, self.pump_callback)
+
+    def schedule_timer(
+        self, next_time: datetime | None = None, duration: str | None = None
+    ) -> None:
+        """Start a timer."""
+
+        if not next_time:
+            seconds = self.seconds
+            delay = timedelta(seconds=seconds)
+            duration = str(delay)
+            next_time = self._clock.now() + delay
+
+        self.adapter.cancel_timer()
+        self.adapter.schedule_timer(next_time, duration, self.timer_callback)
+        self.track_timer(next_time, duration, SENSOR_ACTIVE)
+
+    def start_dimmer(self, is_prediction=False) -> str:
+        """Turn on the dimmer."""
+        # Predictions and Pumps are not considered "on".
+        self._was_dimmer_on = (
+            (not self._is_prediction)
+            and (not self._is_pumping)
+            and self.adapter.is_dimmer_on
+        )
+        # Prediction state must be set AFTER previous check.
+        self._is_prediction = is_prediction
+
+        if self.pump():
+            return "pump"
+
+        if self.predict():
+            return "predict"
+
+        self._is_pumping = False
+        if not self._was_dimmer_on:
+            self.reset_dimmer_time_on()
+
+        self.add_time()
+        self.turn_on_dimmer()
+        self.schedule_timer()
+        self.schedule_periodic_timer()
+
+        # Only trigger the script if dimmer was off.
+        if not self._was_dimmer_on:
+            self.adapter.turn_on_script()
+
+        return "extend" if self._was_dimmer_on else "on"
+
+    def stop_dimmer(self) -> str:
+        """Turn off the dimmer."""
+        if self.adapter.is_on and not self.is_temporarily_disabled:
+            # Check if triggers are are still on and make sure we turn off
+            # the dimmer if the segment changed and the new one is disabled.
+            if self.adapter.are_triggers_on and self.adapter.is_segment_enabled:
+                # Restart everything instead of stopping.
+                return self.start_dimmer()
+            else:
+                self._is_prediction = False
+                self.adapter.cancel_timer()
+                self.adapter.cancel_periodic_timer()
+                self.adapter.turn_off_dimmer(
+                    priority=self.priority(CommandPriority.TURN_OFF)
+                )
+                self.reset_dimmer_time_off()
+                self.track_timer(self._clock.now(), "00:00:00", SENSOR_IDLE)
+                return "off"
+        else:
+            self.track_timer(self._clock.now(), "00:00:00", SENSOR_IDLE)
+            return "idle"
+
+    @instrumented("timer")
+    @budgeted("timer")
+    def timer_callback(self, *args, **kwargs) -> None:
+        """Turn off the dimmer because timer ran out."""
+        self.stats.events_handled += 1
+        decision = self.stop_dimmer()
+        self._is_recovering = False
+        self.trace.record("timer", decision, self._timer_end_time)
+
+    def track_timer(self, timer_end, duration, state) -> None:
+        """Store changes in timer."""
+        self._timer_end_time = timer_end
+        self._timer_duration = duration
+
+        # Moving the end time of a running timer only updates the countdown,
+        # so it can wait when Home Assistant is busy.
+        if (
+            state == SENSOR_ACTIVE
+            and self._timer_state == SENSOR_ACTIVE
+            and self.adapter.is_overloaded
+        ):
+            self.stats.timer_writes_shed += 1
+            return
+
+        self._timer_state = state
+        self.adapter.track_timer(timer_end, duration, state)
+
+    @instrumented("callback")
+    @budgeted("trigger")
+    def triggered_callback(self, *args, **kwargs) -> None:
+        """Run when triggers are activated."""
+        self.stats.events_handled += 1
+        self.adapter.measure_lag(*args, **kwargs)
+        decision = self.start_dimmer() if self.is_enabled else "disabled"
+        self.trace.record("trigger", decision, self._timer_end_time)
+
+    def trigger_state_callback(self, entity_id: str, is_on: bool) -> None:
+        """Learn how long a trigger stays on and how long motion pauses."""
+        self._holds.record(entity_id, is_on)
+        self.extension.motion_changed(self, self.adapter.are_triggers_on)
+
+    def turn_on_dimmer(
+        self,
+        brightness: int | None = None,
+        priority: CommandPriority = CommandPriority.TRIGGER,
+        dimmers: list[str] | None = None,
+    ):
+        """Turn on the dimmers, or only some of them."""
+        self.adapter.turn_on_dimmer(
+            priority=self.priority(priority),
+            dimmers=dimmers,
+            brightness=brightness or self.adapter.brightness,
+            color_mode=self.adapter.color_mode,
+            color_temp=self.adapter.color_temp,
+            rgb_color=self.adapter.rgb_color,
+            transition=1,
+        )
+
+
+def _isoformat(value: datetime | None) -> str | None:
+    """Format an optional datetime for diagnostics."""
+    return value.isoformat() if value else None
+
+
+class EventTrace:
+    """Fixed size ring buffer of recent Motion Dimmer events."""
+
+    __slots__ = ("_records", "_index", "_clock")
+
+    def __init__(self, size: int = TRACE_SIZE, clock: Clock | None = None) -> None:
+        """Preallocate the buffer."""
+        self._records: list[tuple | None] = [None] * size
+        self._index = 0
+        self._clock = clock or Clock()
+
+    def __len__(self) -> int:
+        """Number of events in the buffer."""
+        return sum(1 for record in self._records if record is not None)
+
+    def record(self, kind: str, decision: str, deadline: datetime | None) -> None:
+        """Record an event and the decision taken."""
+        index = self._index
+        self._records[index] = (self._clock.time(), kind, decision, deadline)
+        self._index = (index + 1) % len(self._records)
+
+    def as_list(self) -> list[dict[str, Any]]:
+        """Return the events from oldest to newest."""
+        records = self._records[self._index :] + self._records[: self._index]
+        return [
+            {
+                "time": datetime.fromtimestamp(stamp, UTC).isoformat(),
+                "kind": kind,
+                "decision": decision,
+                "deadline": _isoformat(deadline),
+            }
+            for stamp, kind, decision, deadline in filter(None, records)
+        ]
+
+
+@dataclass
+class SmoothedEstimate:
+    """Exponentially weighted mean and mean deviation of a measurement."""
+
+    mean: float
+    deviation: float = 0
+    count: int = 1
+
+    def add(self, sample: float, smoothing: float) -> None:
+        """Add a measurement."""
+        difference = sample - self.mean
+        self.mean += smoothing * difference
+        self.deviation += smoothing * (abs(difference) - self.deviation)
+        self.count += 1
+
+    def high(self, deviations: float) -> float:
+        """An estimate that most measurements are below."""
+        return self.mean + deviations * self.deviation
+
+
+class TurnOnThreshold:
+    """The brightness levels a dimmer was seen to turn on at from off.
+
+    A level the dimmer turned on at means every higher level turns it on too,
+    and a level it stayed off at means every lower level keeps it off.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with nothing learned."""
+        self.lowest_on: float | None = None
+        self.highest_off: float | None = None
+
+    def record(self, brightness: float, turned_on: bool) -> None:
+        """Learn whether the dimmer turned on at a brightness."""
+        if turned_on:
+            if self.lowest_on is None or brightness < self.lowest_on:
+                self.lowest_on = brightness
+            # The dimmer changed, so forget what contradicts it.
+            if self.highest_off is not None and self.highest_off >= brightness:
+                self.highest_off = None
+        else:
+            if self.highest_off is None or brightness > self.highest_off:
+                self.highest_off = brightness
+            if self.lowest_on is not None and self.lowest_on <= brightness:
+                self.lowest_on = None
+
+    def turns_on(self, brightness: float) -> bool:
+        """True if the dimmer is known to turn on at the brightness."""
+        return self.lowest_on is not None and brightness >= self.lowest_on
+
+    def stays_off(self, brightness: float) -> bool:
+        """True if the dimmer is known to stay off at the brightness."""
+        return self.highest_off is not None and brightness <= self.highest_off
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the learned levels for diagnostics."""
+        return {"lowest_on": self.lowest_on, "highest_off": self.highest_off}
+
+
+class TriggerHolds:
+    """Learn how long each trigger stays on once it turns on.
+
+    The mean and mean deviation of the hold times are smoothed, so the
+    estimate follows a sensor whose hold time is changed.
+    """
+
+    def __init__(self, clock: Clock, smoothing: float = HOLD_SMOOTHING) -> None:
+        """Initialize the estimates."""
+        self._clock = clock
+        self._smoothing = smoothing
+        self._since: dict[str, float] = {}
+        self._estimates: dict[str, SmoothedEstimate] = {}
+
+    def record(self, entity_id: str, is_on: bool) -> None:
+        """Record a trigger turning on or off."""
+        now = self._clock.monotonic()
+        if is_on:
+            self._since.setdefault(entity_id, now)
+            return
+
+        since = self._since.pop(entity_id, None)
+        if since is None:
+            return
+
+        seconds = now - since
+        if (estimate := self._estimates.get(entity_id)) is None:
+            self._estimates[entity_id] = SmoothedEstimate(seconds)
+        else:
+            estimate.add(seconds, self._smoothing)
+
+    def longest(self) -> float | None:
+        """A high estimate of the hold time of the triggers.
+
+        Triggers that are still on count for as long as they have been on.
+        Returns None until a trigger has turned off.
+        """
+        if not self._estimates:
+            return None
+
+        now = self._clock.monotonic()
+        return max(
+            [estimate.high(HOLD_DEVIATIONS) for estimate in self._estimates.values()]
+            + [now - since for since in self._since.values()]
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the estimates for diagnostics."""
+        return {
+            entity_id: asdict(estimate)
+            for entity_id, estimate in self._estimates.items()
+        }
+
+
+class ExtensionStrategy:
+    """Decide how many seconds to extend the timer by when it starts."""
+
+    name = ""
+
+    def extend(self, motion_dimmer: MotionDimmer) -> float:
+        """The extension for the timer that is starting."""
+        raise NotImplementedError  # pragma: no cover
+
+    def motion_changed(self, motion_dimmer: MotionDimmer, is_on: bool) -> None:
+        """Learn from the triggers turning on or off."""
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the strategy state for diagnostics."""
+        return {"name": self.name}
+
+
+class HeuristicExtension(ExtensionStrategy):
+    """Extend the timer by fixed rules on how long the dimmer was on and off."""
+
+    name = EXTENSION_HEURISTIC
+
+    def extend(self, motion_dimmer: MotionDimmer) -> float:
+        """The extension for the timer that is starting."""
+        total = motion_dimmer.additional_time
+        off_seconds = motion_dimmer.dimmer_off_seconds
+        if off_seconds <= 0:
+            # Light is on so only extend a small amount.
+            total += int(motion_dimmer.dimmer_on_seconds / 5)
+        elif off_seconds < SMALL_TIME_OFF:
+            # Light was briefly off, so extend by normal amount
+            total += motion_dimmer.dimmer_on_seconds
+        elif off_seconds < LONG_TIME_OFF:
+            # Light was off for a little while, so decrease the extension.
+            total -= int(total / 2)
+        else:
+            # Light was off for long time.  Reset extension.
+            total = 0
+
+        return total
+
+
+class LearnedExtension(ExtensionStrategy):
+    """Extend the timer to cover the pauses in motion of each segment.
+
+    A pause lasts from the last trigger turning off to a trigger turning on.
+    It is measured against the timer running when motion stopped, which
+    already covers the trigger holds and periodic restarts. Each pause the
+    timer covered, or that ended soon after it ran out, needed the timer to
+    run until motion came back, which is how much longer than the timer
+    without its extension it needed to be. Longer pauses were people leaving
+    and count as needing nothing. The extension is a high estimate of the
+    smoothed need.
+    """
+
+    name = EXTENSION_LEARNED
+
+    def __init__(self, smoothing: float = EXTENSION_SMOOTHING) -> None:
+        """Initialize the estimates."""
+        self._smoothing = smoothing
+        # The end of the running timer when motion stopped, and the end it
+        # would have had without the extension.
+        self._paused_until: datetime | None = None
+        self._base_end: datetime | None = None
+        self._estimates: dict[str, SmoothedEstimate] = {}
+
+    def extend(self, motion_dimmer: MotionDimmer) -> float:
+        """The extension for the timer that is starting."""
+        estimate = self._estimates.get(motion_dimmer.adapter.segment_id)
+        return round(estimate.high(EXTENSION_DEVIATIONS)) if estimate else 0
+
+    def motion_changed(self, motion_dimmer: MotionDimmer, is_on: bool) -> None:
+        """Measure the pauses in motion."""
+        now = motion_dimmer.clock.now()
+        if not is_on:
+            # A pause while the timer is not running says nothing about it.
+            end_time = motion_dimmer.end_time
+            if self._paused_until is None and end_time and end_time > now:
+                self._paused_until = end_time
+                self._base_end = end_time - timedelta(
+                    seconds=motion_dimmer.additional_time
+                )
+            return
+
+        if self._paused_until is None:
+            return
+
+        paused_until, self._paused_until = self._paused_until, None
+        need = 0.0
+        if now <= paused_until + timedelta(seconds=DEFAULT_FALSE_OFF_SECS):
+            need = max((now - self._base_end).total_seconds(), 0)
+
+        segment_id = motion_dimmer.adapter.segment_id
+        if (estimate := self._estimates.get(segment_id)) is None:
+            self._estimates[segment_id] = SmoothedEstimate(need)
+        else:
+            estimate.add(need, self._smoothing)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the strategy state for diagnostics."""
+        return {
+            "name": self.name,
+            "segments": {
+                segment_id: asdict(estimate)
+                for segment_id, estimate in self._estimates.items()
+            },
+        }
+
+
+EXTENSION_STRATEGIES: dict[str, type[ExtensionStrategy]] = {
+    strategy.name: strategy for strategy in (HeuristicExtension, LearnedExtension)
+}
+
+
+@dataclass
+class MotionDimmerStats:
+    """Runtime performance counters."""
+
+    events_handled: int = 0
+    commands_sent: int = 0
+    redundant_turn_offs: int = 0
+    dispatch_errors: int = 0
+    executor_wait: float = 0
+    timer_reschedules: int = 0
+    state_writes: int = 0
+    slow_callbacks: int = 0
+    predictions_shed: int = 0
+    timer_writes_shed: int = 0
+
+
+class CallbackBudget:
+    """Compare the time taken by callbacks with their latency budget.
+
+    The time of each callback is split into waiting for service calls on the
+    event loop and everything else, which is mostly adapter state reads.
+    """
+
+    def __init__(self, adapter: MotionDimmerAdapter, stats: MotionDimmerStats):
+        """Initialize the budget."""
+        self._adapter = adapter
+        self._stats = stats
+        self._local = threading.local()
+        self.slow: dict[str, int] = {}
+        self.worst: dict[str, float] = {}
+        self.slow_streak = 0
+        self.fast_streak = 0
+        self.issue_raised = False
+
+    def add_wait(self, seconds: float) -> None:
+        """Add time spent waiting for a service call to the current callback."""
+        if getattr(self._local, "wait", None) is not None:
+            self._local.wait += seconds
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the budget state for diagnostics."""
+        return {
+            "budgets": self._adapter.callback_budgets,
+            "slow": self.slow,
+            "worst": self.worst,
+            "issue_raised": self.issue_raised,
+        }
+
+    @contextmanager
+    def measure(self, kind: str) -> Iterator[None]:
+        """Measure a callback."""
+        outer_wait = getattr(self._local, "wait", None)
+        self._local.wait = 0.0
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            wait = self._local.wait
+            self._local.wait = None if outer_wait is None else outer_wait + wait
+            self.check(kind, elapsed, wait)
+
+    def check(self, kind: str, elapsed: float, wait: float) -> None:
+        """Count and report a callback that exceeded its budget."""
+        budget = self._adapter.callback_budgets.get(kind)
+        if not budget:
+            return
+
+        if elapsed <= budget:
+            self.slow_streak = 0
+            self.fast_streak += 1
+            if self.issue_raised and self.fast_streak >= SLOW_CALLBACK_STREAK:
+                self.issue_raised = False
+                self._adapter.clear_slow_callback_issue()
+            return
+
+        self._stats.slow_callbacks += 1
+        self.slow[kind] = self.slow.get(kind, 0) + 1
+        self.worst[kind] = max(self.worst.get(kind, 0), elapsed)
+        self.fast_streak = 0
+        self.slow_streak += 1
+        _LOGGER.warning(
+            "%s %s callback took %.0f ms, over the %.0f ms budget "
+            "(%.0f ms in service calls, %.0f ms in adapter reads)",
+            getattr(self._adapter, "device_id", "Motion Dimmer"),
+            kind,
+            elapsed * 1000,
+            budget * 1000,
+            wait * 1000,
+            (elapsed - wait) * 1000,
+        )
+        if not self.issue_raised and self.slow_streak >= SLOW_CALLBACK_STREAK:
+            self.issue_raised = True
+            self._adapter.raise_slow_callback_issue(kind, elapsed, budget)
+
+
+@dataclass
+class DimmerStateChange:
+    """State change data."""
+
+    was_on: bool
+    is_on: bool
+    old_brightness: int | None
+    new_brightness: int | None
+    entity_id: str | None = None
+
+
+@dataclass
+class TimerState:
+    """Timer state data."""
+
+    end_time: datetime
+    duration: str
+    state: str
+
+
+@dataclass
+class PendingCommand:
+    """A dimmer command waiting for confirmation."""
+
+    sent: float
+    is_on: bool
+    brightness: int | None
+
+
+@dataclass
+class CommandLatency:
+    """Confirmation latency of the commands sent to a dimmer."""
+
+    confirmed: int = 0
+    unconfirmed: int = 0
+    last: float | None = None
+    maximum: float = 0
+    total: float = 0
+
+    @property
+    def average(self) -> float | None:
+        """Average number of seconds until a command is confirmed."""
+        if self.confirmed:
+            return self.total / self.confirmed
+
+
+@dataclass
+class CommandTracker:
+    """Match dimmer commands with the state changes that confirm them."""
+
+    timeout: float = COMMAND_CONFIRM_TIMEOUT
+    pending: dict[str, PendingCommand] = field(default_factory=dict)
+    latencies: dict[str, CommandLatency] = field(default_factory=dict)
+    clock: Clock = field(default_factory=Clock)
+
+    def command_sent(
+        self, entity_id: str, is_on: bool, brightness: int | None = None
+    ) -> None:
+        """Start waiting for a command to be confirmed."""
+        self.expire()
+        if entity_id in self.pending:
+            # A new command replaced one that was never confirmed.
+            self.latency(entity_id).unconfirmed += 1
+
+        self.pending[entity_id] = PendingCommand(
+            self.clock.monotonic(), is_on, brightness
+        )
+
+    def expire(self) -> None:
+        """Count the commands that were not confirmed in time as unconfirmed."""
+        now = self.clock.monotonic()
+        for entity_id, command in list(self.pending.items()):
+            if now - command.sent > self.timeout:
+                del self.pending[entity_id]
+                self.latency(entity_id).unconfirmed += 1
+
+    def latency(self, entity_id: str) -> CommandLatency:
+        """Get the latency of a dimmer."""
+        if entity_id not in self.latencies:
+            self.latencies[entity_id] = CommandLatency()
+
+        return self.latencies[entity_id]
+
+    def combined(self, entity_ids: list[str]) -> CommandLatency:
+        """Get the latency of dimmers controlled together.
+
+        The dimmers are sent their commands together, so the slowest counts.
+        """
+        self.expire()
+        latencies = [self.latency(entity_id) for entity_id in entity_ids]
+        lasts = [latency.last for latency in latencies if latency.last is not None]
+        return CommandLatency(
+            confirmed=sum(latency.confirmed for latency in latencies),
+            unconfirmed=sum(latency.unconfirmed for latency in latencies),
+            last=max(lasts, default=None),
+            maximum=max((latency.maximum for latency in latencies), default=0),
+            total=sum(latency.total for latency in latencies),
+        )
+
+    def state_changed(
+        self, entity_id: str, is_on: bool, brightness: int | None
+    ) -> float | None:
+        """Confirm the pending command if the dimmer reached its target."""
+        command = self.pending.get(entity_id)
+        if command is None:
+            return None
+
+        latency = self.latency(entity_id)
+        elapsed = self.clock.monotonic() - command.sent
+        if elapsed > self.timeout:
+            del self.pending[entity_id]
+            latency.unconfirmed += 1
+            return None
+
+        if is_on != command.is_on:
+            return None
+
+        # Dimmers often round the brightness they report back and some do
+        # not report it at all.
+        if is_on and command.brightness is not None and brightness is not None:
+            if abs(brightness - command.brightness) > CONFIRM_BRIGHTNESS_MARGIN:
+                return None
+
+        del self.pending[entity_id]
+        latency.confirmed += 1
+        latency.last = elapsed
+        latency.maximum = max(latency.maximum, elapsed)
+        latency.total += elapsed
+        return elapsed
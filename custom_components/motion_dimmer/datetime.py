@@ -4,6 +4,7 @@ from __future__ import annotations
 
 from datetime import datetime
 import logging
+from typing import TYPE_CHECKING
 
 from homeassistant.components.datetime import DateTimeEntity
 from homeassistant.config_entries import ConfigEntry
@@ -13,7 +14,10 @@ from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.util.dt import now
 
 from .const import DOMAIN, ControlEntities
-from .models import MotionDimmerData, MotionDimmerEntity, internal_id
+from .entity import MotionDimmerEntity, internal_id
+
+if TYPE_CHECKING:
+    from .models import MotionDimmerData
 
 _LOGGER = logging.getLogger(__name__)
 
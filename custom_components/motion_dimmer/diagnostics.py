@@ -0,0 +1,50 @@
+"""Diagnostics support for Motion Dimmer."""
+
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceEntry
+
+from .const import DOMAIN
+from .models import MotionDimmerData
+
+
+def dimmer_diagnostics(data: MotionDimmerData) -> dict[str, Any]:
+    """Get the runtime state of a Motion Dimmer."""
+    motion_dimmer = data.motion_dimmer
+    return {
+        "device_id": data.device_id,
+        "dimmers": data.dimmers,
+        "input_select": data.input_select,
+        "triggers": data.triggers,
+        "predictors": data.predictors,
+        "script": data.script,
+        "motion_dimmer": motion_dimmer.as_dict(),
+        "adapter": motion_dimmer.adapter.as_dict(),
+    }
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    data: MotionDimmerData = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "entry": {
+            "title": entry.title,
+            "data": dict(entry.data),
+            "options": dict(entry.options),
+        },
+        "data": dimmer_diagnostics(data),
+    }
+
+
+async def async_get_device_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry, device: DeviceEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a device."""
+    data: MotionDimmerData = hass.data[DOMAIN][entry.entry_id]
+    return dimmer_diagnostics(data)
@@ -0,0 +1,221 @@
+"""Read the state history of Motion Dimmer entities from the recorder database.
+
+The history is read from the SQLite database of the recorder in chunks and
+kept in compact arrays, so months of history load in bounded memory. It does
+not depend on Home Assistant.
+
+    python -m custom_components.motion_dimmer.history \\
+        /config/home-assistant_v2.db kitchen_island > events.jsonl
+
+The output can be fed to the replay.
+"""
+
+from __future__ import annotations
+
+import argparse
+from array import array
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+import heapq
+import json
+import os
+import sqlite3
+import sys
+
+from .const import (
+    CONF_DIMMER,
+    CONF_INPUT_SELECT,
+    CONF_PREDICTORS,
+    CONF_TRIGGERS,
+    CONF_UNIQUE_NAME,
+    DOMAIN,
+)
+from .replay import DIMMER, INPUT_SELECT, PREDICTOR, TRIGGER, ReplayEvent
+
+CHUNK_SIZE = 10_000
+NO_BRIGHTNESS = -1
+
+# The index on (metadata_id, last_updated_ts) returns the rows in order.
+STATES_QUERY = """
+SELECT last_updated_ts, state, NULL
+FROM states
+WHERE metadata_id = ? AND last_updated_ts >= ? AND last_updated_ts < ?
+ORDER BY last_updated_ts
+"""
+BRIGHTNESS_QUERY = """
+SELECT states.last_updated_ts, states.state, state_attributes.shared_attrs
+FROM states
+LEFT JOIN state_attributes USING (attributes_id)
+WHERE states.metadata_id = ?
+    AND states.last_updated_ts >= ?
+    AND states.last_updated_ts < ?
+ORDER BY states.last_updated_ts
+"""
+
+
+@dataclass
+class EntityHistory:
+    """The state changes of an entity in columns.
+
+    States are stored as indexes into the list of distinct values.
+    """
+
+    entity_id: str
+    times: array = field(default_factory=lambda: array("d"))
+    states: array = field(default_factory=lambda: array("H"))
+    brightness: array = field(default_factory=lambda: array("h"))
+    values: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        """Number of state changes."""
+        return len(self.times)
+
+    def state(self, index: int) -> str:
+        """The state of a change."""
+        return self.values[self.states[index]]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open the recorder database without writing to it."""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def read_history(
+    connection: sqlite3.Connection,
+    entity_id: str,
+    start: float = 0,
+    end: float = float("inf"),
+    with_brightness: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> EntityHistory:
+    """Read the state changes of an entity between two timestamps.
+
+    Rows that only change attributes are skipped, unless the brightness is
+    read and changed.
+    """
+    history = EntityHistory(entity_id)
+    row = connection.execute(
+        "SELECT metadata_id FROM states_meta WHERE entity_id = ?", (entity_id,)
+    ).fetchone()
+    if row is None:
+        return history
+
+    codes: dict[str, int] = {}
+    last = None
+    cursor = connection.execute(
+        BRIGHTNESS_QUERY if with_brightness else STATES_QUERY, (row[0], start, end)
+    )
+    while rows := cursor.fetchmany(chunk_size):
+        for stamp, state, attributes in rows:
+            brightness = NO_BRIGHTNESS
+            if attributes and state == "on":
+                value = json.loads(attributes).get("brightness")
+                if value is not None:
+                    brightness = int(value)
+
+            if (state, brightness) == last:
+                continue
+            last = (state, brightness)
+
+            if (code := codes.get(state)) is None:
+                code = codes[state] = len(history.values)
+                history.values.append(state)
+            history.times.append(stamp)
+            history.states.append(code)
+            history.brightness.append(brightness)
+
+    return history
+
+
+def replay_events(history: EntityHistory, kind: str) -> Iterator[ReplayEvent]:
+    """Convert the history of an entity to replay events."""
+    for index, stamp in enumerate(history.times):
+        brightness = history.brightness[index]
+        yield ReplayEvent(
+            stamp,
+            kind,
+            history.entity_id,
+            history.state(index),
+            None if brightness == NO_BRIGHTNESS else brightness,
+        )
+
+
+def entry_events(
+    connection: sqlite3.Connection,
+    options: dict,
+    start: float = 0,
+    end: float = float("inf"),
+) -> Iterator[ReplayEvent]:
+    """Read the events of a Motion Dimmer entry in time order."""
+    streams = [
+        replay_events(read_history(connection, entity_id, start, end), kind)
+        for kind, entity_ids in (
+            (TRIGGER, options.get(CONF_TRIGGERS) or []),
+            (PREDICTOR, options.get(CONF_PREDICTORS) or []),
+            (INPUT_SELECT, [options.get(CONF_INPUT_SELECT)]),
+        )
+        for entity_id in entity_ids
+        if entity_id
+    ]
+    # Each dimmer keeps its entity id, so the replay learns it separately.
+    streams.extend(
+        replay_events(
+            read_history(connection, dimmer, start, end, with_brightness=True),
+            DIMMER,
+        )
+        for dimmer in options.get(CONF_DIMMER) or []
+    )
+    return heapq.merge(*streams, key=lambda event: event.time)
+
+
+def entry_options(config_dir: str, unique_name: str) -> dict:
+    """Read the options of a Motion Dimmer entry from the configuration."""
+    path = os.path.join(config_dir, ".storage", "core.config_entries")
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)["data"]["entries"]
+
+    for entry in entries:
+        if (
+            entry["domain"] == DOMAIN
+            and entry["data"].get(CONF_UNIQUE_NAME) == unique_name
+        ):
+            return entry["options"]
+
+    raise KeyError(f"No Motion Dimmer named {unique_name}")
+
+
+def write_events(events: Iterable[ReplayEvent], dimmer: str) -> None:
+    """Write the events as the JSON lines read by the replay."""
+    for event in events:
+        row = {"dimmer": dimmer, **event._asdict()}
+        if event.brightness is None:
+            del row["brightness"]
+        sys.stdout.write(json.dumps(row) + "\n")
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Export the history of Motion Dimmers for the replay."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("database")
+    parser.add_argument("dimmers", nargs="+", help="unique ids of the dimmers")
+    parser.add_argument(
+        "--config", help="configuration directory, defaults to the database's"
+    )
+    parser.add_argument("--start", type=float, default=0, help="epoch seconds")
+    parser.add_argument("--end", type=float, default=float("inf"))
+    args = parser.parse_args(argv)
+
+    config_dir = args.config or os.path.dirname(os.path.abspath(args.database))
+    connection = connect(args.database)
+    try:
+        for dimmer in args.dimmers:
+            options = entry_options(config_dir, dimmer)
+            write_events(
+                entry_events(connection, options, args.start, args.end), dimmer
+            )
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
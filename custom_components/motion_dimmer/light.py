@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS,
@@ -21,7 +21,10 @@ from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.restore_state import RestoreEntity
 
 from .const import DOMAIN, ControlEntities
-from .models import MotionDimmerData, MotionDimmerEntity, internal_id, segments
+from .entity import MotionDimmerEntity, internal_id, segments
+
+if TYPE_CHECKING:
+    from .models import MotionDimmerData
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -3,87 +3,278 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import heapq
+import itertools
 import logging
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import time
+from collections.abc import Callable, Coroutine
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
 
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS,
     ATTR_COLOR_TEMP,
     ATTR_COLOR_MODE,
+    ATTR_HS_COLOR,
+    ATTR_MAX_MIREDS,
+    ATTR_MIN_MIREDS,
     ATTR_RGB_COLOR,
+    ATTR_RGBW_COLOR,
+    ATTR_RGBWW_COLOR,
+    ATTR_SUPPORTED_COLOR_MODES,
     ATTR_TRANSITION,
+    ATTR_XY_COLOR,
     ColorMode,
+    LightEntityFeature,
+    brightness_supported,
 )
-from homeassistant.core import Event
+from homeassistant.core import Event, State
 from homeassistant.components.light import DOMAIN as LIGHT_DOMAIN
-from homeassistant.components.datetime import DOMAIN as DATETIME_DOMAIN
-from homeassistant.components.script import DOMAIN as SCRIPT_DOMAIN
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import ATTR_ENTITY_ID, ATTR_FRIENDLY_NAME, ATTR_ICON
-from homeassistant.core import HassJob, HomeAssistant
-from homeassistant.helpers import entity_registry as er
-from homeassistant.helpers.device_registry import DeviceInfo
-from homeassistant.helpers.entity import Entity
+from homeassistant.const import (
+    ATTR_ENTITY_ID,
+    ATTR_FRIENDLY_NAME,
+    ATTR_ICON,
+    ATTR_SUPPORTED_FEATURES,
+    Platform,
+)
+from homeassistant.core import CALLBACK_TYPE, HassJob, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er, issue_registry as ir
 from homeassistant.helpers.event import (
+    async_call_later,
     async_track_point_in_time,
+    async_track_state_change,
+    async_track_state_change_event,
     EventStateChangedData,
 )
-from homeassistant.util import slugify
-from homeassistant.util.dt import now
+from homeassistant.util import color as color_util, slugify
+from homeassistant.util.dt import as_local, now, utcnow
 
 from .const import (
+    CALLBACK_BUDGETS,
+    CONF_DIMMER,
+    CONF_PREDICTORS,
+    CONF_TRIGGERS,
+    DATA_LOAD,
+    DATA_SCHEDULER,
+    DEFAULT_CALLBACK_BUDGET,
+    DEFAULT_EXTENSION_STRATEGY,
+    DEFAULT_GROUP_BY,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_PUMP_MODE,
     DOMAIN,
-    LONG_TIME_OFF,
-    PUMP_TIME,
-    SENSOR_ACTIVE,
+    GROUP_INTEGRATION,
+    GROUP_NONE,
+    ISSUE_SLOW_CALLBACKS,
+    LOAD_LAG_SMOOTHING,
+    LOAD_PROBE_INTERVAL,
+    LOAD_SHED_LAG,
+    PERIODIC_TIMER,
+    PUMP_TIMER,
     SENSOR_DURATION,
     SENSOR_END_TIME,
-    SENSOR_IDLE,
-    SMALL_TIME_OFF,
+    TIMER,
+    CommandPriority,
     ControlEntityData,
 )
 from .const import (
     ControlEntities as CE,
 )
+from .core import (
+    Clock,
+    CommandTracker,
+    DimmerStateChange,
+    MotionDimmer,
+    MotionDimmerAdapter,
+    MotionDimmerStats,
+    TimerState,
+    _isoformat,
+)
+from .entity import external_id
+from .tracing import instrumented
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def internal_id(
-    ced: ControlEntityData, device_id: str, seg_id: str | None = None
-) -> str:
-    """Create a unique id from parts."""
-    suffix = seg_id + "_" + ced.id_suffix if seg_id else ced.id_suffix
-    return ced.platform + "." + DOMAIN + "_" + device_id + "_" + suffix
+class ListenerRegistry:
+    """Listeners and timers of a Motion Dimmer, so they can all be cancelled.
 
+    Only used from the event loop.
+    """
 
-def external_id(
-    hass: HomeAssistant,
-    ced: ControlEntityData,
-    device_id: str,
-    seg_id: str | None = None,
-) -> str | None:
-    """Get the entity id from entity data."""
-    ent_reg = er.async_get(hass)
-    if entity_id := ent_reg.async_get_entity_id(
-        ced.platform, DOMAIN, internal_id(ced, device_id, seg_id)
-    ):
-        return entity_id
+    def __init__(self) -> None:
+        """Initialize the registry."""
+        self._listeners: list[tuple[str | None, CALLBACK_TYPE]] = []
+        self._timers: dict[str, tuple[object, CALLBACK_TYPE, datetime]] = {}
+        self.created = 0
+        self.cancelled = 0
 
+    @property
+    def live_listeners(self) -> int:
+        """Number of listeners that are still subscribed."""
+        return len(self._listeners)
 
-def segments(hass: HomeAssistant, entry: ConfigEntry) -> dict:
-    """Get the segments from the input select."""
-    segs = {}
-    data: MotionDimmerData = hass.data[DOMAIN][entry.entry_id]
+    @property
+    def live_timers(self) -> int:
+        """Number of timers that have not fired or been cancelled."""
+        return len(self._timers)
+
+    @callback
+    def async_add_listener(self, unsub: CALLBACK_TYPE, key: str | None = None):
+        """Track a listener until it is removed or the Motion Dimmer is unloaded.
+
+        Listeners added with a key can be removed together.
+        """
+        self.created += 1
+        self._listeners.append((key, unsub))
+
+    @callback
+    def async_remove_listeners(self, key: str) -> None:
+        """Remove the listeners added with a key."""
+        for listener in [item for item in self._listeners if item[0] == key]:
+            self._listeners.remove(listener)
+            listener[1]()
+            self.cancelled += 1
+
+    @callback
+    def async_add_timer(
+        self, name: str, token: object, unsub: CALLBACK_TYPE, deadline: datetime
+    ) -> None:
+        """Track a timer until it fires or is cancelled.
+
+        A timer replaces any pending timer with the same name.
+        """
+        self.async_cancel_timer(name)
+        self.created += 1
+        self._timers[name] = (token, unsub, deadline)
+
+    @callback
+    def async_cancel_timer(self, name: str) -> None:
+        """Cancel a pending timer."""
+        if timer := self._timers.pop(name, None):
+            timer[1]()
+            self.cancelled += 1
+
+    @callback
+    def async_timer_fired(self, name: str, token: object) -> None:
+        """Forget a timer that fired, unless it was replaced."""
+        if (timer := self._timers.get(name)) and timer[0] is token:
+            del self._timers[name]
+
+    @callback
+    def async_cancel_all(self) -> None:
+        """Cancel all listeners and timers."""
+        while self._listeners:
+            self._listeners.pop()[1]()
+            self.cancelled += 1
+        for name in list(self._timers):
+            self.async_cancel_timer(name)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the counters for diagnostics."""
+        return {
+            "live_listeners": self.live_listeners,
+            "live_timers": self.live_timers,
+            "timers": sorted(self._timers),
+            "created": self.created,
+            "cancelled": self.cancelled,
+        }
 
-    if data.input_select:
-        input_segments = hass.states.get(data.input_select).attributes["options"]
+    def deadline(self, name: str) -> datetime | None:
+        """Get the deadline of a pending timer."""
+        if timer := self._timers.get(name):
+            return timer[2]
+        return None
+
+
+@dataclass(frozen=True)
+class DimmerCapabilities:
+    """What the dimmer supports, read from its state attributes.
+
+    Unknown capabilities send the segment settings as they are.
+    """
+
+    color_modes: frozenset[str] | None = None
+    min_mireds: int | None = None
+    max_mireds: int | None = None
+    transition: bool = True
+
+    @classmethod
+    def from_state(cls, state: State | None) -> DimmerCapabilities:
+        """Read the capabilities of a dimmer state."""
+        if state is None or not state.attributes.get(ATTR_SUPPORTED_COLOR_MODES):
+            return cls()
+
+        attributes = state.attributes
+        features = attributes.get(ATTR_SUPPORTED_FEATURES, 0)
+        return cls(
+            frozenset(attributes[ATTR_SUPPORTED_COLOR_MODES]),
+            attributes.get(ATTR_MIN_MIREDS),
+            attributes.get(ATTR_MAX_MIREDS),
+            bool(features & LightEntityFeature.TRANSITION),
+        )
 
-        for input_segment in input_segments:
-            segs[slugify(input_segment)] = input_segment
+    def as_dict(self) -> dict[str, Any]:
+        """Return the capabilities for diagnostics."""
+        return {
+            **asdict(self),
+            "color_modes": sorted(self.color_modes) if self.color_modes else None,
+        }
 
-    return segs
+
+@functools.lru_cache(maxsize=64)
+def native_color(
+    capabilities: DimmerCapabilities,
+    color_mode: str | None,
+    color_temp: int | None,
+    rgb_color: tuple[int, int, int] | None,
+) -> dict[str, Any]:
+    """The color attributes of a segment in the color mode of the dimmer.
+
+    Colors the dimmer cannot show are left out, so only the brightness is set.
+    """
+    modes = capabilities.color_modes
+    if modes is None:
+        if color_mode == ColorMode.COLOR_TEMP:
+            return {ATTR_COLOR_TEMP: color_temp}
+        if color_mode == ColorMode.RGB:
+            return {ATTR_RGB_COLOR: rgb_color}
+        return {}
+
+    if color_mode == ColorMode.COLOR_TEMP and color_temp:
+        if ColorMode.COLOR_TEMP in modes:
+            low = capabilities.min_mireds or color_temp
+            high = capabilities.max_mireds or color_temp
+            return {ATTR_COLOR_TEMP: min(max(color_temp, low), high)}
+
+        kelvin = color_util.color_temperature_mired_to_kelvin(color_temp)
+        rgb_color = tuple(
+            round(value) for value in color_util.color_temperature_to_rgb(kelvin)
+        )
+    elif color_mode != ColorMode.RGB:
+        return {}
+
+    if not rgb_color:
+        return {}
+    if ColorMode.RGB in modes:
+        return {ATTR_RGB_COLOR: rgb_color}
+    if ColorMode.HS in modes:
+        return {ATTR_HS_COLOR: color_util.color_RGB_to_hs(*rgb_color)}
+    if ColorMode.XY in modes:
+        return {ATTR_XY_COLOR: color_util.color_RGB_to_xy(*rgb_color)}
+    if ColorMode.RGBW in modes:
+        return {ATTR_RGBW_COLOR: color_util.color_rgb_to_rgbw(*rgb_color)}
+    if ColorMode.RGBWW in modes and capabilities.min_mireds and capabilities.max_mireds:
+        return {
+            ATTR_RGBWW_COLOR: color_util.color_rgb_to_rgbww(
+                *rgb_color,
+                color_util.color_temperature_mired_to_kelvin(capabilities.max_mireds),
+                color_util.color_temperature_mired_to_kelvin(capabilities.min_mireds),
+            )
+        }
+    return {}
 
 
 @dataclass
@@ -92,172 +283,17 @@ class MotionDimmerData:
 
     device_id: str
     device_name: str
-    dimmer: str
+    dimmers: list
     input_select: str
     triggers: list
     predictors: list | None
     script: str | None
     motion_dimmer: MotionDimmer
-
-
-class MotionDimmerEntity(Entity):
-    """Motion Dimmer entity."""
-
-    _attr_has_entity_name = True
-
-    def __init__(
-        self,
-        data: MotionDimmerData,
-        entity_name: str,
-        unique_id: str = None,
-        entity_id: str = None,
-    ) -> None:
-        """Set up the base class."""
-        self._data = data
-        self._attr_name = entity_name
-        self._attr_unique_id = unique_id if unique_id else entity_id
-
-        device_id = data.device_id
-        self._device = device_id
-
-        info = DeviceInfo(
-            identifiers={(DOMAIN, device_id)},
-            name=data.device_name,
-        )
-        self._attr_device_info = info
-
-
-class MotionDimmerAdapter:  # pragma: no cover
-    """Adapter for Motion Dimmer"""
-
-    @property
-    def are_triggers_on(self) -> bool:
-        """True if any triggers are on."""
-        raise NotImplementedError
-
-    @property
-    def brightness_min(self) -> float:
-        """The minimum brightness needed to activate the dimmer."""
-        raise NotImplementedError
-
-    @property
-    def disabled_until(self) -> datetime:
-        """The time Motion Dimmer is no longer disabled"""
-        raise NotImplementedError
-
-    @property
-    def extension_max(self) -> float:
-        """Maximum number of seconds the timer can be extended."""
-        raise NotImplementedError
-
-    @property
-    def is_dimmer_on(self) -> bool:
-        """Is the dimmer currently on."""
-        raise NotImplementedError
-
-    @property
-    def is_segment_enabled(self) -> bool:
-        """Return true if segment is enabled."""
-        raise NotImplementedError
-
-    @property
-    def is_on(self) -> bool:
-        """Is Motion Dimmer enabled"""
-        raise NotImplementedError
-
-    @property
-    def manual_override(self) -> int:
-        """The number of seconds to temprarily disable."""
-        raise NotImplementedError
-
-    @property
-    def prediction_brightness(self) -> float:
-        """The brightness of the predictive activation."""
-        raise NotImplementedError
-
-    @property
-    def prediction_secs(self) -> float:
-        """The number of seconds to activate a prediction."""
-        raise NotImplementedError
-
-    @property
-    def brightness(self) -> float:
-        """Get the brightness for the segment."""
-        raise NotImplementedError
-
-    @property
-    def color_mode(self) -> str:
-        """The color mode to set the dimmer to."""
-        raise NotImplementedError
-
-    @property
-    def color_temp(self) -> int:
-        """The color temp to set the dimmer to."""
-        raise NotImplementedError
-
-    @property
-    def rgb_color(self) -> tuple[int, int, int]:
-        """The color to set the dimmer to."""
-        raise NotImplementedError
-
-    @property
-    def seconds(self) -> float:
-        """Get the number of seconds for the segment."""
-        raise NotImplementedError
-
-    @property
-    def timer(self) -> TimerState:
-        """Get the state of the timer."""
-        raise NotImplementedError
-
-    @property
-    def trigger_interval(self) -> float:
-        """Number of seconds to wait before checking the triggers again."""
-        raise NotImplementedError
-
-    def cancel_periodic_timer(self) -> None:
-        """Cancel the periodic timer."""
-        raise NotImplementedError
-
-    def cancel_timer(self) -> None:
-        """Stop the timer."""
-        raise NotImplementedError
-
-    def dimmer_state_callback(self, *args, **kwargs) -> dict:
-        """Callback when dimmer state changes."""
-        raise NotImplementedError
-
-    def schedule_periodic_timer(self, time, callback) -> None:
-        """Start the periodic timer to check triggers."""
-        raise NotImplementedError
-
-    def schedule_pump_timer(self, time, callback) -> None:
-        """Pump the dimmer for a short time."""
-        raise NotImplementedError
-
-    def schedule_timer(self, time: datetime, duration: str, callback) -> None:
-        """Start timer."""
-        raise NotImplementedError
-
-    def set_temporarily_disabled(self, next_time: datetime):
-        """Set the temporarily disabled field"""
-        raise NotImplementedError
-
-    def track_timer(self, timer_end, duration, state) -> None:
-        """Store changes in timer."""
-        raise NotImplementedError
-
-    def turn_on_dimmer(self, **kwargs) -> None:
-        """Turn on dimmer."""
-        raise NotImplementedError
-
-    def turn_off_dimmer(self) -> None:
-        """Turn off dimmer."""
-        raise NotImplementedError
-
-    def turn_on_script(self) -> None:
-        """Turn on script."""
-        raise NotImplementedError
+    budgets: dict[str, float] = field(default_factory=dict)
+    adaptive_interval: bool = False
+    extension_strategy: str = DEFAULT_EXTENSION_STRATEGY
+    pump_mode: str = DEFAULT_PUMP_MODE
+    listeners: ListenerRegistry = field(default_factory=ListenerRegistry)
 
 
 class MotionDimmerHA(MotionDimmerAdapter):
@@ -266,8 +302,11 @@ class MotionDimmerHA(MotionDimmerAdapter):
     def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
         self._hass = hass
         self._data: MotionDimmerData = hass.data[DOMAIN][entry_id]
-        self._cancel_timer = None
-        self._cancel_periodic_timer = None
+        self._clock = Clock()
+        self._commands = CommandTracker(clock=self._clock)
+        self._entity_ids: dict[tuple[str, str, str | None], str] = {}
+        self._capabilities: dict[str, DimmerCapabilities] = {}
+        self._in_flight = 0
 
     @property
     def are_triggers_on(self) -> bool:
@@ -295,6 +334,16 @@ class MotionDimmerHA(MotionDimmerAdapter):
         entity_id = self.external_id(CE.MIN_BRIGHTNESS)
         return float(self.hass.states.get(entity_id).state) * 2.55
 
+    @property
+    def callback_budgets(self) -> dict[str, float]:
+        """The number of seconds each type of callback may take."""
+        return self.data.budgets
+
+    @property
+    def clock(self) -> Clock:
+        """The system clock."""
+        return self._clock
+
     @property
     def color_mode(self) -> str:
         """The color mode to set the dimmer to."""
@@ -309,11 +358,26 @@ class MotionDimmerHA(MotionDimmerAdapter):
             self.external_id(CE.SEG_LIGHT, self.segment_id)
         ).attributes.get(ATTR_COLOR_TEMP)
 
+    @property
+    def commands(self) -> CommandTracker:
+        """Return the tracker for commands sent to the dimmer."""
+        return self._commands
+
     @property
     def data(self) -> MotionDimmerData:
         """Return MotionDimmerData"""
         return self._data
 
+    @property
+    def device_id(self) -> str:
+        """The unique id of the Motion Dimmer device."""
+        return self.data.device_id
+
+    @property
+    def dimmers(self) -> list[str]:
+        """The entity ids of the dimmers."""
+        return self.data.dimmers
+
     @property
     def disabled_until(self) -> datetime:
         """The datetime when the motion dimmer is no longer disabled."""
@@ -330,15 +394,32 @@ class MotionDimmerHA(MotionDimmerAdapter):
         entity_id = self.external_id(CE.EXTENSION_MAX)
         return float(self.hass.states.get(entity_id).state)
 
+    @property
+    def extension_strategy(self) -> str:
+        """The name of the strategy that extends the timer."""
+        return self.data.extension_strategy
+
     @property
     def hass(self) -> HomeAssistant:
         """Return HomeAssistant"""
         return self._hass
 
+    @property
+    def stats(self) -> MotionDimmerStats:
+        """Return the performance counters of the Motion Dimmer."""
+        return self.data.motion_dimmer.stats
+
     @property
     def is_dimmer_on(self) -> bool:
-        """Is the dimmer currently on."""
-        return self.hass.states.is_state(self.data.dimmer, "on")
+        """Is any of the dimmers currently on."""
+        return any(
+            self.hass.states.is_state(dimmer, "on") for dimmer in self.data.dimmers
+        )
+
+    @property
+    def is_dimmer_off(self) -> bool:
+        """Are all the dimmers known to be off with no command in flight."""
+        return all(self.is_off(dimmer) for dimmer in self.data.dimmers)
 
     @property
     def is_segment_enabled(self) -> bool:
@@ -347,11 +428,36 @@ class MotionDimmerHA(MotionDimmerAdapter):
             self.external_id(CE.SEG_LIGHT, self.segment_id), "on"
         )
 
+    @property
+    def is_interval_adaptive(self) -> bool:
+        """Is the trigger test interval learned from the triggers."""
+        return self.data.adaptive_interval
+
     @property
     def is_on(self) -> bool:
         """Is Motion Dimmer enabled"""
         return self.hass.states.is_state(self.external_id(CE.CONTROL_SWITCH), "on")
 
+    @property
+    def is_overloaded(self) -> bool:
+        """Is Home Assistant too busy for non-essential work."""
+        return self.load.is_overloaded
+
+    @property
+    def listeners(self) -> ListenerRegistry:
+        """The listeners and timers of the Motion Dimmer."""
+        return self.data.listeners
+
+    @property
+    def load(self) -> LoadMonitor:
+        """The load monitor shared by all Motion Dimmers."""
+        return self.hass.data[DATA_LOAD]
+
+    @property
+    def scheduler(self) -> CommandScheduler:
+        """Get the light command scheduler shared by all Motion Dimmers."""
+        return self.hass.data[DATA_SCHEDULER]
+
     @property
     def manual_override(self) -> int:
         """The number of seconds to temprarily disable."""
@@ -369,6 +475,11 @@ class MotionDimmerHA(MotionDimmerAdapter):
         entity_id = self.external_id(CE.PREDICTION_SECS)
         return float(self.hass.states.get(entity_id).state)
 
+    @property
+    def pump_mode(self) -> str:
+        """How the dimmer is turned on below the minimum brightness."""
+        return self.data.pump_mode
+
     @property
     def rgb_color(self) -> tuple[int, int, int]:
         """The color to set the dimmer to."""
@@ -383,6 +494,11 @@ class MotionDimmerHA(MotionDimmerAdapter):
         if state := self.hass.states.get(entity_id):
             return float(state.state)
 
+    @property
+    def slow_callback_issue_id(self) -> str:
+        """The id of the repair issue for slow callbacks."""
+        return f"{ISSUE_SLOW_CALLBACKS}_{self.device_id}"
+
     @property
     def segment_id(self) -> str:
         """The unique id of the segment."""
@@ -409,17 +525,68 @@ class MotionDimmerHA(MotionDimmerAdapter):
         entity_id = self.external_id(CE.TRIGGER_INTERVAL)
         return float(self.hass.states.get(entity_id).state)
 
+    def as_dict(self) -> dict[str, Any]:
+        """Return the adapter state for diagnostics."""
+        return {
+            "timer_deadline": _isoformat(self.listeners.deadline(TIMER)),
+            "periodic_deadline": _isoformat(self.listeners.deadline(PERIODIC_TIMER)),
+            "listeners": self.listeners.as_dict(),
+            "entity_ids": {
+                ".".join(part for part in key if part): entity_id
+                for key, entity_id in self._entity_ids.items()
+            },
+            "latency": {
+                entity_id: asdict(latency)
+                for entity_id, latency in self.commands.latencies.items()
+            },
+            "load": self.load.as_dict(),
+            "scheduler": self.scheduler.as_dict(),
+            "in_flight": self._in_flight,
+            "capabilities": {
+                dimmer: capabilities.as_dict()
+                for dimmer, capabilities in self._capabilities.items()
+            },
+        }
+
     def cancel_timer(self) -> None:
         """Stop the timer."""
-        if self._cancel_timer is not None:
-            self._cancel_timer()
-            self._cancel_timer = None
+        self.dispatch(self.async_cancel_timer())
+
+    @instrumented("adapter")
+    async def async_cancel_timer(self) -> None:
+        """Stop the timer."""
+        self.listeners.async_cancel_timer(TIMER)
 
     def cancel_periodic_timer(self) -> None:
         """Cancel the periodic timer."""
-        if self._cancel_periodic_timer is not None:
-            self._cancel_periodic_timer()
-            self._cancel_periodic_timer = None
+        self.dispatch(self.async_cancel_periodic_timer())
+
+    @instrumented("adapter")
+    async def async_cancel_periodic_timer(self) -> None:
+        """Cancel the periodic timer."""
+        self.listeners.async_cancel_timer(PERIODIC_TIMER)
+
+    def capabilities(self, dimmer: str) -> DimmerCapabilities:
+        """What a dimmer supports, read once and kept up to date."""
+        if (capabilities := self._capabilities.get(dimmer)) is None:
+            capabilities = DimmerCapabilities.from_state(self.hass.states.get(dimmer))
+            self._capabilities[dimmer] = capabilities
+        return capabilities
+
+    def clear_slow_callback_issue(self) -> None:
+        """Remove the repair issue for slow callbacks."""
+        ir.delete_issue(self.hass, DOMAIN, self.slow_callback_issue_id)
+
+    @callback
+    @instrumented("adapter")
+    def async_confirm_command(self, event: Event[EventStateChangedData]) -> None:
+        """Match a dimmer state change with the command that caused it."""
+        if new_state := event.data["new_state"]:
+            self.commands.state_changed(
+                new_state.entity_id,
+                new_state.state == "on",
+                new_state.attributes.get(ATTR_BRIGHTNESS),
+            )
 
     def dimmer_state_callback(
         self, event: Event[EventStateChangedData]
@@ -432,129 +599,243 @@ class MotionDimmerHA(MotionDimmerAdapter):
             new_state.state == "on" if new_state else False,
             old_state.attributes.get(ATTR_BRIGHTNESS) if old_state else None,
             new_state.attributes.get(ATTR_BRIGHTNESS) if new_state else None,
+            event.data["entity_id"],
         )
 
     def external_id(
         self, ced: ControlEntityData, seg_id: str | None = None
     ) -> str | None:
         """Get the entity id from entity data."""
-        return external_id(self.hass, ced, self.data.device_id, seg_id)
+        key = (ced.platform, ced.id_suffix, seg_id)
+        if key not in self._entity_ids:
+            entity_id = external_id(self.hass, ced, self.data.device_id, seg_id)
+            if entity_id is None:
+                return None
+            self._entity_ids[key] = entity_id
+
+        return self._entity_ids[key]
+
+    @callback
+    def async_clear_entity_ids(self, *args, **kwargs) -> None:
+        """Forget the cached entity ids after the registry changes."""
+        self._entity_ids.clear()
+
+    @callback
+    def async_clear_capabilities(self) -> None:
+        """Forget the capabilities after the dimmers changed."""
+        self._capabilities.clear()
+
+    @callback
+    def async_update_capabilities(self, event: Event[EventStateChangedData]) -> None:
+        """Read the capabilities again when a dimmer state changes."""
+        self._capabilities[event.data["entity_id"]] = DimmerCapabilities.from_state(
+            event.data["new_state"]
+        )
+
+    def is_off(self, dimmer: str) -> bool:
+        """Is a dimmer known to be off with no command in flight."""
+        # The state is stale while a command is waiting for confirmation.
+        if dimmer in self.commands.pending:
+            return False
+
+        return self.hass.states.is_state(dimmer, "off")
+
+    def measure_lag(self, *args, **kwargs) -> None:
+        """Measure how late a trigger or predictor callback runs."""
+        new_state = args[2] if len(args) > 2 else kwargs.get("new_state")
+        if new_state is not None:
+            lag = (utcnow() - new_state.last_updated).total_seconds()
+            self.load.record_event_lag(lag)
+
+    def raise_slow_callback_issue(self, kind: str, elapsed: float, budget: float):
+        """Raise a repair issue for callbacks that keep exceeding the budget."""
+        ir.create_issue(
+            self.hass,
+            DOMAIN,
+            self.slow_callback_issue_id,
+            is_fixable=False,
+            severity=ir.IssueSeverity.WARNING,
+            translation_key=ISSUE_SLOW_CALLBACKS,
+            translation_placeholders={
+                "name": self.data.device_name,
+                "kind": kind,
+                "elapsed": str(round(elapsed * 1000)),
+                "budget": str(round(budget * 1000)),
+            },
+        )
+
+    def dispatch(self, coro: Coroutine) -> None:
+        """Run a coroutine in the event loop without waiting for it.
+
+        The coroutines start in the order they are dispatched, so the light
+        command sent first is never held up by the timer and sensor updates.
+        Their service calls block within the coroutine, so a failing service
+        is counted as a dispatch error.
+        """
+        self.hass.create_task(self.async_run_dispatched(coro))
+
+    @instrumented("dispatch")
+    async def async_run_dispatched(self, coro: Coroutine) -> None:
+        """Run a dispatched coroutine, counting and logging its errors."""
+        self._in_flight += 1
+        try:
+            await coro
+        except Exception:  # pylint: disable=broad-except
+            self.stats.dispatch_errors += 1
+            _LOGGER.exception(
+                "%s: %s failed", self.data.device_name, coro.__qualname__
+            )
+        finally:
+            self._in_flight -= 1
+
+    @instrumented("executor_wait")
+    def run_threadsafe(self, coro: Coroutine) -> Any:
+        """Run a coroutine in the event loop and wait for the result."""
+        start = time.monotonic()
+        try:
+            return asyncio.run_coroutine_threadsafe(coro, self.hass.loop).result()
+        finally:
+            elapsed = time.monotonic() - start
+            self.stats.executor_wait += elapsed
+            self.data.motion_dimmer.budget.add_wait(elapsed)
 
     def schedule_periodic_timer(self, time: datetime, callback) -> None:
         """Start the periodic timer to check triggers."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_schedule_periodic_timer(time, callback), self.hass.loop
-        ).result()
+        self.dispatch(self.async_schedule_periodic_timer(time, callback))
 
+    @instrumented("adapter")
     async def async_schedule_periodic_timer(self, time: datetime, callback) -> None:
         """Start the periodic timer to check triggers."""
-        self._cancel_periodic_timer = async_track_point_in_time(
-            self.hass,
-            HassJob(
-                callback,
-                name="Dimmer Trigger Periodic Timer",
-                cancel_on_shutdown=True,
-            ),
-            time,
+        self.async_track_point_in_time(
+            PERIODIC_TIMER, time, callback, "Dimmer Trigger Periodic Timer"
         )
 
     def schedule_pump_timer(self, time: datetime, callback) -> None:
         """Start the periodic timer to check triggers."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_schedule_pump_timer(time, callback), self.hass.loop
-        ).result()
+        self.dispatch(self.async_schedule_pump_timer(time, callback))
 
+    @instrumented("adapter")
     async def async_schedule_pump_timer(self, time: datetime, callback) -> None:
         """Pump the dimmer for a short time."""
-        async_track_point_in_time(
-            self.hass,
-            HassJob(
-                callback,
-                name="Dimmer Pump Timer",
-                cancel_on_shutdown=True,
-            ),
-            time,
-        )
+        self.async_track_point_in_time(PUMP_TIMER, time, callback, "Dimmer Pump Timer")
 
     def schedule_timer(self, time: datetime, duration: str, callback) -> None:
         """Start a timer."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_schedule_timer(time, callback), self.hass.loop
-        ).result()
+        self.dispatch(self.async_schedule_timer(time, callback))
 
+    @instrumented("adapter")
     async def async_schedule_timer(self, time: datetime, callback) -> None:
         """Start a timer."""
-        self._cancel_timer = async_track_point_in_time(
+        self.async_track_point_in_time(TIMER, time, callback, "Dimmer Timer")
+
+    @callback
+    def async_track_point_in_time(
+        self, name: str, time: datetime, action: Callable, job_name: str
+    ) -> None:
+        """Run a callback in the executor at a time, tracking the timer."""
+        token = object()
+
+        @callback
+        def fired(*args) -> None:
+            self.listeners.async_timer_fired(name, token)
+            self.hass.async_add_executor_job(action, *args)
+
+        self.stats.timer_reschedules += 1
+        unsub = async_track_point_in_time(
             self.hass,
-            HassJob(
-                callback,
-                name="Dimmer Timer",
-                cancel_on_shutdown=True,
-            ),
+            HassJob(fired, name=job_name, cancel_on_shutdown=True),
             time,
         )
+        self.listeners.async_add_timer(name, token, unsub, time)
 
     def set_temporarily_disabled(self, next_time: datetime):
         """Set the temporarily disabled field"""
-        asyncio.run_coroutine_threadsafe(
-            self.async_set_temporarily_disabled(next_time), self.hass.loop
-        ).result()
+        self.run_threadsafe(self.async_set_temporarily_disabled(next_time))
 
+    @instrumented("adapter")
     async def async_set_temporarily_disabled(self, next_time: datetime) -> None:
         """Set the temporarily disabled field"""
         await self.hass.services.async_call(
-            DATETIME_DOMAIN,
+            Platform.DATETIME,
             "set_value",
             {
                 "entity_id": self.external_id(CE.DISABLED_UNTIL),
-                "datetime": next_time,
+                "datetime": as_local(next_time),
             },
         )
 
-    def turn_on_dimmer(self, **kwargs) -> None:
-        """Turn on dimmer."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_turn_on_dimmer(**kwargs), self.hass.loop
-        ).result()
+    def turn_on_dimmer(
+        self, priority: CommandPriority, dimmers: list[str] | None = None, **kwargs
+    ) -> None:
+        """Turn on the dimmers without waiting for the service calls."""
+        for dimmer in self.data.dimmers if dimmers is None else dimmers:
+            self.dispatch(
+                self.scheduler.async_run(
+                    dimmer, priority, self.async_turn_on_light(dimmer, **kwargs)
+                )
+            )
 
-    async def async_turn_on_dimmer(self, **kwargs) -> None:
-        """Turn on dimmer."""
+    @instrumented("adapter")
+    async def async_turn_on_light(self, dimmer: str, **kwargs) -> None:
+        """Turn on a dimmer with the attributes it supports."""
+        capabilities = self.capabilities(dimmer)
         args = {
-            ATTR_ENTITY_ID: self.data.dimmer,
+            ATTR_ENTITY_ID: dimmer,
         }
-        args[ATTR_BRIGHTNESS] = kwargs.get(ATTR_BRIGHTNESS)
-        args[ATTR_TRANSITION] = kwargs.get(ATTR_TRANSITION)
-        if kwargs.get(ATTR_COLOR_MODE) == ColorMode.COLOR_TEMP:
-            args[ATTR_COLOR_TEMP] = kwargs.get(ATTR_COLOR_TEMP)
-        if kwargs.get(ATTR_COLOR_MODE) == ColorMode.RGB:
-            args[ATTR_RGB_COLOR] = kwargs.get(ATTR_RGB_COLOR)
+        if capabilities.color_modes is None or brightness_supported(
+            capabilities.color_modes
+        ):
+            args[ATTR_BRIGHTNESS] = kwargs.get(ATTR_BRIGHTNESS)
+        if capabilities.transition:
+            args[ATTR_TRANSITION] = kwargs.get(ATTR_TRANSITION)
+        rgb_color = kwargs.get(ATTR_RGB_COLOR)
+        args.update(
+            native_color(
+                capabilities,
+                kwargs.get(ATTR_COLOR_MODE),
+                kwargs.get(ATTR_COLOR_TEMP),
+                tuple(rgb_color) if rgb_color else None,
+            )
+        )
         filtered_args = {k: v for k, v in args.items() if v is not None}
+        self.stats.commands_sent += 1
+        self.commands.command_sent(dimmer, True, filtered_args.get(ATTR_BRIGHTNESS))
         await self.hass.services.async_call(
             LIGHT_DOMAIN,
             "turn_on",
             filtered_args,
+            blocking=True,
         )
 
-    def turn_off_dimmer(self) -> None:
-        """Turn off dimmer."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_turn_off_dimmer(), self.hass.loop
-        ).result()
+    def turn_off_dimmer(self, priority: CommandPriority) -> None:
+        """Turn off the dimmers without waiting for the service calls."""
+        for dimmer in self.data.dimmers:
+            self.dispatch(
+                self.scheduler.async_run(
+                    dimmer, priority, self.async_turn_off_light(dimmer), turn_on=False
+                )
+            )
+
+    @instrumented("adapter")
+    async def async_turn_off_light(self, dimmer: str) -> None:
+        """Turn off a dimmer, counting it if it is known to be off already."""
+        if self.is_off(dimmer):
+            self.stats.redundant_turn_offs += 1
 
-    async def async_turn_off_dimmer(self) -> None:
-        """Turn off dimmer."""
+        self.stats.commands_sent += 1
+        self.commands.command_sent(dimmer, False)
         await self.hass.services.async_call(
             LIGHT_DOMAIN,
             "turn_off",
-            {ATTR_ENTITY_ID: self.data.dimmer},
+            {ATTR_ENTITY_ID: dimmer},
+            blocking=True,
         )
 
     def turn_on_script(self) -> None:
         """Turn on script."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_turn_on_script(), self.hass.loop
-        ).result()
+        self.dispatch(self.async_turn_on_script())
 
+    @instrumented("adapter")
     async def async_turn_on_script(self) -> None:
         """Turn on script."""
         if not self.data.script:
@@ -564,21 +845,22 @@ class MotionDimmerHA(MotionDimmerAdapter):
             ATTR_ENTITY_ID: self.data.script,
         }
         await self.hass.services.async_call(
-            SCRIPT_DOMAIN,
+            "script",
             "turn_on",
             args,
+            blocking=True,
         )
 
     def track_timer(self, timer_end, duration, state) -> None:
         """Store changes in timer data so the timer sensor can read it."""
-        asyncio.run_coroutine_threadsafe(
-            self.async_track_timer(timer_end, duration, state), self.hass.loop
-        ).result()
+        self.dispatch(self.async_track_timer(timer_end, duration, state))
 
+    @instrumented("adapter")
     async def async_track_timer(self, timer_end, duration, state) -> None:
         """Store changes in timer."""
         new_attr = {
-            SENSOR_END_TIME: timer_end.isoformat(),
+            # The core keeps time in UTC, the sensor shows local time.
+            SENSOR_END_TIME: as_local(timer_end).isoformat(),
             SENSOR_DURATION: duration,
         }
         timer_id = self.external_id(CE.TIMER)
@@ -586,336 +868,353 @@ class MotionDimmerHA(MotionDimmerAdapter):
             ATTR_FRIENDLY_NAME
         )
         new_attr[ATTR_ICON] = self.hass.states.get(timer_id).attributes.get(ATTR_ICON)
+        self.stats.state_writes += 1
         self.hass.states.async_set(
             entity_id=timer_id, new_state=state, attributes=new_attr, force_update=True
         )
 
 
-class MotionDimmer:
-    """Representation of a Motion Dimmer."""
-
-    def __init__(self, adapter: MotionDimmerAdapter) -> None:
-        """Initialize the Motion Dimmer."""
-        self._adapter = adapter
-        self._is_prediction = False
-        self._is_pumping = False
-        self._was_dimmer_on = False
-        self._additional_time = 0
-        self._dimmer_time_on = now()
-        self._dimmer_time_off = now()
-        self._timer_end_time = now()
-        self._timer_duration = "00:00:00"
-
-    @property
-    def adapter(self) -> MotionDimmerHA:
-        """Get the storage adapter."""
-        return self._adapter
-
-    @property
-    def dimmer_on_seconds(self) -> int:
-        """Number of seconds the dimmer was on."""
-        diff = now() - self._dimmer_time_on
-        return round(diff.total_seconds())
-
-    @property
-    def dimmer_off_seconds(self) -> int:
-        """Number of seconds the dimmer was off."""
-        if self.adapter.is_dimmer_on:
-            return 0
+class LoadMonitor:
+    """Estimate how busy Home Assistant is.
 
-        diff = now() - self._dimmer_time_off
-        return round(diff.total_seconds())
+    The event loop lag is probed every few seconds. The executor lag is the
+    delay between a trigger or predictor state change and its callback
+    running. Both are smoothed and the executor lag decays between events.
+    """
 
-    @property
-    def duration(self) -> str:
-        """Get the duration."""
-        return self._timer_duration
+    def __init__(self, hass: HomeAssistant, threshold: float = LOAD_SHED_LAG):
+        """Initialize the monitor."""
+        self._hass = hass
+        self._users = 0
+        self._expected: float | None = None
+        self._cancel_probe = None
+        self.threshold = threshold
+        self.loop_lag = 0.0
+        self.event_lag = 0.0
 
     @property
-    def end_time(self) -> datetime:
-        """Get the end time."""
-        return self._timer_end_time
+    def is_overloaded(self) -> bool:
+        """Is the lag above the threshold."""
+        return max(self.loop_lag, self.event_lag) > self.threshold
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the load for diagnostics."""
+        return {
+            "loop_lag": self.loop_lag,
+            "event_lag": self.event_lag,
+            "threshold": self.threshold,
+            "is_overloaded": self.is_overloaded,
+        }
 
-    @property
-    def is_enabled(self) -> bool:
-        """Return true if device is enabled."""
-        # Motion Dimmer is on.
-        if not self.adapter.is_on:
-            return False
+    def record_event_lag(self, seconds: float) -> None:
+        """Add a measurement of the executor lag."""
+        self.event_lag = _smooth(self.event_lag, max(seconds, 0))
+
+    @callback
+    def async_start(self) -> None:
+        """Start probing for a Motion Dimmer."""
+        self._users += 1
+        if self._users == 1:
+            self._async_schedule_probe()
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop probing once no Motion Dimmer needs it."""
+        self._users -= 1
+        if self._users == 0 and self._cancel_probe is not None:
+            self._cancel_probe()
+            self._cancel_probe = None
+
+    @callback
+    def _async_schedule_probe(self) -> None:
+        """Schedule the next event loop probe."""
+        self._expected = self._hass.loop.time() + LOAD_PROBE_INTERVAL
+        self._cancel_probe = async_call_later(
+            self._hass,
+            LOAD_PROBE_INTERVAL,
+            HassJob(
+                self._async_probe,
+                name="Motion Dimmer Load Probe",
+                cancel_on_shutdown=True,
+            ),
+        )
 
-        # Motion Dimmer is not temporarily disabled.
-        if self.is_temporarily_disabled:
-            return False
+    @callback
+    def _async_probe(self, *args) -> None:
+        """Measure how late the probe runs."""
+        lag = max(self._hass.loop.time() - self._expected, 0)
+        self.loop_lag = _smooth(self.loop_lag, lag)
+        self.event_lag = _smooth(self.event_lag, 0)
+        self._async_schedule_probe()
 
-        # Current segment is enabled.
-        return self.adapter.is_segment_enabled
 
-    @property
-    def is_temporarily_disabled(self) -> bool:
-        """Return true if device is temporarily disabled."""
-        return now() < self.adapter.disabled_until
+@dataclass
+class CommandQueue:
+    """The light commands of a group of lights, in flight and waiting."""
+
+    in_flight: int = 0
+    # The commands waiting for each light in the order they are sent, and
+    # the heap they are sent from.
+    waiting: dict[str, list[tuple[int, int, str, asyncio.Future]]] = field(
+        default_factory=dict
+    )
+    heap: list[tuple[int, int, str, asyncio.Future]] = field(default_factory=list)
+    # The waiting pumps, which are kept for the brightness that follows them.
+    pumps: set[asyncio.Future] = field(default_factory=set)
 
     @property
-    def seconds(self) -> float:
-        """Number of seconds to turn the dimmer on."""
-        return self.adapter.seconds + self._additional_time
-
-    def add_time(self) -> None:
-        """Add time to the timer."""
-        # Initialize the attribute.
-        total = self._additional_time
-        off_seconds = self.dimmer_off_seconds
-        if off_seconds <= 0:
-            # Light is on so only extend a small amount.
-            total += int(self.dimmer_on_seconds / 5)
-        elif off_seconds < SMALL_TIME_OFF:
-            # Light was briefly off, so extend by normal amount
-            total += self.dimmer_on_seconds
-        elif off_seconds < LONG_TIME_OFF:
-            # Light was off for a little while, so decrease the extension.
-            total -= int(total / 2)
+    def waiting_count(self) -> int:
+        """The number of commands waiting."""
+        return sum(len(commands) for commands in self.waiting.values())
+
+    def forget(self, light: str, future: asyncio.Future) -> None:
+        """Stop tracking a waiting command of a light."""
+        self.pumps.discard(future)
+        commands = [
+            command
+            for command in self.waiting.get(light, [])
+            if command[3] is not future
+        ]
+        if commands:
+            self.waiting[light] = commands
         else:
-            # Light was off for long time.  Reset extension.
-            total = 0
+            self.waiting.pop(light, None)
 
-        # Make sure it is between 0 and max time.
-        total = min(self.adapter.extension_max, max(total, 0))
-
-        self._additional_time = total
-
-    def dimmer_state_callback(self, *args, **kwargs) -> None:
-        """Check if dimmer was changed manually."""
-        if not self.is_enabled:
-            return
-
-        # Pass callback to adapter for platform-specific handling.
-        change = self.adapter.dimmer_state_callback(*args, **kwargs)
-
-        # Compare states.
-        same_state = change.was_on == change.is_on
-        same_bright = change.old_brightness == change.new_brightness
-        # Don't worry about changes in color or temp.
-
-        if not same_state:
-            if change.is_on != self.adapter.are_triggers_on and not self._is_prediction:
-                self.disable_temporarily()
-        elif not same_bright and not self._is_pumping:
-            # Give a 1 percent margin of error.
-            diff = self.adapter.brightness - change.new_brightness
-            if diff < -1 or diff > 1:
-                self.disable_temporarily()
-
-    def disable_temporarily(self) -> None:
-        """Disable all functionality for a time."""
-        seconds = self.adapter.manual_override
-        if seconds and int(seconds) > 0:
-            delay = timedelta(seconds=int(seconds))
-            next_time = now() + delay
-        else:
-            return  # pragma: no cover
-
-        # Only set a new disable if it is later than the old one.
-        if self.adapter.disabled_until < next_time:
-            # Schedule the timer to turn off dimmer after it is reenabled.
-            buffer = timedelta(seconds=5)
-            self.adapter.schedule_timer(
-                next_time + buffer, str(delay + buffer), self.timer_callback
-            )
-            self.adapter.set_temporarily_disabled(next_time)
-
-    def init_timer(self, *args, **kwargs) -> None:
-        """Init timer."""
-        timer = self.adapter.timer
-        self._timer_end_time = timer.end_time
-        self._timer_duration = timer.duration
-
-        # Check if timer was running on HA shutdown.
-        if timer.end_time and timer.end_time > now():
-            # Restart timer because it hasn't finished.
-            self.schedule_timer(timer.end_time, timer.duration)
-        elif timer.end_time and timer.state == SENSOR_ACTIVE:
-            # Finish timer.
-            self.timer_callback()
-
-    def periodic_callback(self, *args, **kwargs) -> None:
-        """Repeatedly check the triggers to reset the timer."""
-        # Check if the segment has been disabled or we have transitioned
-        # to a disabled segment.
-        if self.is_enabled:
-            if self.adapter.are_triggers_on:
-                self.start_dimmer()
-            else:
-                self.schedule_periodic_timer()
-
-    def predict(self):
-        """Start the dimmer based on a prediction."""
-        if self._is_prediction:
-            # Prediction brightness is > minimum and < regular brightness.
-            brightness = min(
-                max(self.adapter.prediction_brightness, self.adapter.brightness_min),
-                self.adapter.brightness,
-            )
-            delay = timedelta(seconds=self.adapter.prediction_secs)
-            self.turn_on_dimmer(brightness)
-            self.schedule_timer(now() + delay, str(delay))
-            return True
-
-        return False
-
-    def predictor_callback(self, *args, **kwargs) -> None:
-        """Run when predictors are activated."""
-        # Do nothing if the dimmer is already on.
-        if self.adapter.is_dimmer_on or not self.is_enabled:
-            return
-
-        self.start_dimmer(is_prediction=True)
-
-    def pump(self) -> bool:
-        """Start the dimmer at a brightness above the target brightness."""
-        if (
-            not self._was_dimmer_on
-            and not self._is_pumping
-            and not self._is_prediction
-            and self.adapter.brightness < self.adapter.brightness_min
-        ):
-            self._is_pumping = True
-            self.turn_on_dimmer(brightness=self.adapter.brightness_min)
-            self.schedule_pump_timer()
-            return True
-
-        return False
-
-    def pump_callback(self, *args, **kwargs) -> None:
-        """Turn on the dimmer to normal brightness after pump."""
-        if self.is_enabled:
-            self.start_dimmer()
-
-    def reset_dimmer_time_off(self) -> None:
-        """Reset dimmer time off."""
-        self._dimmer_time_off = now()
-
-    def reset_dimmer_time_on(self) -> None:
-        """Reset dimmer time on."""
-        self._dimmer_time_on = now()
-
-    def schedule_periodic_timer(self) -> None:
-        """Start the periodic timer to check triggers."""
-        trigger_interval = self.adapter.trigger_interval
-        if trigger_interval == 0:
-            return
 
-        next_time = now() + timedelta(seconds=trigger_interval)
-        self.adapter.cancel_periodic_timer()
-        self.adapter.schedule_periodic_timer(next_time, self.periodic_callback)
+class CommandScheduler:
+    """Limit the light commands in flight across all Motion Dimmers.
 
-    def schedule_pump_timer(self) -> None:
-        """Pump the dimmer for a short time."""
-        next_time = now() + timedelta(seconds=PUMP_TIME)
-        self.adapter.schedule_pump_timer(next_time, self.pump_callback)
+    Commands over the limit wait and are sent the most urgent first, oldest
+    first within a priority. The limit is shared by all lights, or by the
+    lights of each integration or mesh (the config entry of the light). The
+    waiting commands of a light are dropped when a newer one for it comes in,
+    except for a pump followed by a turn on: the pump is moved up to the
+    priority of the turn on and sent just before it.
+    """
 
-    def schedule_timer(
-        self, next_time: datetime | None = None, duration: str | None = None
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        group_by: str = DEFAULT_GROUP_BY,
     ) -> None:
-        """Start a timer."""
+        """Initialize the scheduler."""
+        self._hass = hass
+        self._queues: dict[str, CommandQueue] = {}
+        self._sequence = itertools.count()
+        self.max_in_flight = max_in_flight
+        self.group_by = group_by
+        self.sent = {priority.name.lower(): 0 for priority in CommandPriority}
+        self.wait = {priority.name.lower(): 0.0 for priority in CommandPriority}
+        self.queued = 0
+        self.superseded = 0
+        self.max_waiting = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the queue metrics for diagnostics."""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "group_by": self.group_by,
+            "groups": {
+                group: {"in_flight": queue.in_flight, "waiting": queue.waiting_count}
+                for group, queue in self._queues.items()
+            },
+            "sent": self.sent,
+            "wait": self.wait,
+            "queued": self.queued,
+            "superseded": self.superseded,
+            "max_waiting": self.max_waiting,
+        }
 
-        if not next_time:
-            seconds = self.seconds
-            delay = timedelta(seconds=seconds)
-            duration = str(delay)
-            next_time = now() + delay
-
-        self.adapter.cancel_timer()
-        self.adapter.schedule_timer(next_time, duration, self.timer_callback)
-        self.track_timer(next_time, duration, SENSOR_ACTIVE)
-
-    def start_dimmer(self, is_prediction=False) -> None:
-        """Turn on the dimmer."""
-        # Predictions and Pumps are not considered "on".
-        self._was_dimmer_on = (
-            (not self._is_prediction)
-            and (not self._is_pumping)
-            and self.adapter.is_dimmer_on
-        )
-        # Prediction state must be set AFTER previous check.
-        self._is_prediction = is_prediction
+    def group(self, light: str) -> str:
+        """The group of lights sharing the limit with a light."""
+        if self.group_by == GROUP_NONE:
+            return GROUP_NONE
 
-        if self.pump():
-            return
+        entry = er.async_get(self._hass).async_get(light)
+        if entry is None:
+            return light
+        if self.group_by == GROUP_INTEGRATION:
+            return entry.platform
+        return entry.config_entry_id or entry.platform
 
-        if self.predict():
-            return
-
-        self._is_pumping = False
-        if not self._was_dimmer_on:
-            self.reset_dimmer_time_on()
-
-        self.add_time()
-        self.turn_on_dimmer()
-        self.schedule_timer()
-        self.schedule_periodic_timer()
-
-        # Only trigger the script if dimmer was off.
-        if not self._was_dimmer_on:
-            self.adapter.turn_on_script()
-
-    def stop_dimmer(self) -> None:
-        """Turn off the dimmer."""
-        if self.adapter.is_on and not self.is_temporarily_disabled:
-            # Check if triggers are are still on and make sure we turn off
-            # the dimmer if the segment changed and the new one is disabled.
-            if self.adapter.are_triggers_on and self.adapter.is_segment_enabled:
-                # Restart everything instead of stopping.
-                self.start_dimmer()
-            else:
-                self._is_prediction = False
-                self.adapter.cancel_timer()
-                self.adapter.cancel_periodic_timer()
-                self.adapter.turn_off_dimmer()
-                self.reset_dimmer_time_off()
-                self.track_timer(now(), "00:00:00", SENSOR_IDLE)
+    async def async_run(
+        self,
+        light: str,
+        priority: CommandPriority,
+        coro: Coroutine,
+        turn_on: bool = True,
+    ) -> None:
+        """Send a command to a light once its group has room for it.
+
+        The command holds its place until the coroutine returns, so the
+        service call should block.
+        """
+        queue = self._queues.setdefault(self.group(light), CommandQueue())
+        if queue.in_flight < self.max_in_flight:
+            queue.in_flight += 1
+            wait = 0.0
         else:
-            self.track_timer(now(), "00:00:00", SENSOR_IDLE)
-
-    def timer_callback(self, *args, **kwargs) -> None:
-        """Turn off the dimmer because timer ran out."""
-        self.stop_dimmer()
-
-    def track_timer(self, timer_end, duration, state) -> None:
-        """Store changes in timer."""
-        self._timer_end_time = timer_end
-        self._timer_duration = duration
-        self.adapter.track_timer(timer_end, duration, state)
-
-    def triggered_callback(self, *args, **kwargs) -> None:
-        """Run when triggers are activated."""
-        if self.is_enabled:
-            self.start_dimmer()
-
-    def turn_on_dimmer(self, brightness: int | None = None):
-        """Turn on the dimmer."""
-        self.adapter.turn_on_dimmer(
-            brightness=brightness or self.adapter.brightness,
-            color_mode=self.adapter.color_mode,
-            color_temp=self.adapter.color_temp,
-            rgb_color=self.adapter.rgb_color,
-            transition=1,
+            start = self._hass.loop.time()
+            if not await self._async_wait(queue, light, priority, coro, turn_on):
+                return
+            wait = self._hass.loop.time() - start
+
+        name = priority.name.lower()
+        self.sent[name] += 1
+        self.wait[name] = _smooth(self.wait[name], wait)
+        try:
+            await coro
+        finally:
+            queue.in_flight -= 1
+            self._async_send_next(queue)
+
+    async def _async_wait(
+        self,
+        queue: CommandQueue,
+        light: str,
+        priority: CommandPriority,
+        coro: Coroutine,
+        turn_on: bool,
+    ) -> bool:
+        """Wait for a turn to send a command, false if it was dropped."""
+        future = self._hass.loop.create_future()
+        is_pump = priority == CommandPriority.PUMP
+        commands = []
+        for command in queue.waiting.get(light, []):
+            if turn_on and not is_pump and command[3] in queue.pumps:
+                # The turn on depends on the pump, which goes right before it.
+                command = (min(priority, command[0]), *command[1:])
+                heapq.heappush(queue.heap, command)
+                commands.append(command)
+            else:
+                queue.pumps.discard(command[3])
+                command[3].set_result(False)
+                self.superseded += 1
+        command = (priority, next(self._sequence), light, future)
+        commands.append(command)
+        queue.waiting[light] = commands
+        if is_pump:
+            queue.pumps.add(future)
+        heapq.heappush(queue.heap, command)
+        self.queued += 1
+        self.max_waiting = max(self.max_waiting, queue.waiting_count)
+
+        try:
+            send = await future
+        except asyncio.CancelledError:
+            queue.forget(light, future)
+            # The turn was given just before the cancellation.
+            if future.done() and not future.cancelled() and future.result():
+                queue.in_flight -= 1
+                self._async_send_next(queue)
+            coro.close()
+            raise
+
+        if not send:
+            coro.close()
+        return send
+
+    @callback
+    def _async_send_next(self, queue: CommandQueue) -> None:
+        """Give the free places to the most urgent waiting commands."""
+        while queue.heap and queue.in_flight < self.max_in_flight:
+            *_, light, future = heapq.heappop(queue.heap)
+            if future.done():
+                continue
+
+            queue.forget(light, future)
+            queue.in_flight += 1
+            future.set_result(True)
+
+
+def _smooth(average: float, sample: float) -> float:
+    """Exponentially weighted moving average."""
+    return average + LOAD_LAG_SMOOTHING * (sample - average)
+
+
+def entry_budgets(entry: ConfigEntry) -> dict[str, float]:
+    """Get the callback budgets in seconds from the options."""
+    return {
+        kind: entry.options.get(option, DEFAULT_CALLBACK_BUDGET) / 1000
+        for kind, option in CALLBACK_BUDGETS.items()
+    }
+
+
+@callback
+def async_track_dimmer(hass: HomeAssistant, data: MotionDimmerData) -> None:
+    """Listen to the state of the dimmers."""
+    data.listeners.async_remove_listeners(CONF_DIMMER)
+    data.motion_dimmer.adapter.async_clear_capabilities()
+    if data.dimmers:
+        data.listeners.async_add_listener(
+            async_track_state_change_event(
+                hass,
+                data.dimmers,
+                data.motion_dimmer.dimmer_state_callback,
+            ),
+            CONF_DIMMER,
+        )
+        # Measure how long the dimmer takes to confirm each command.
+        data.listeners.async_add_listener(
+            async_track_state_change_event(
+                hass,
+                data.dimmers,
+                data.motion_dimmer.adapter.async_confirm_command,
+            ),
+            CONF_DIMMER,
+        )
+        # Keep the capabilities up to date.
+        data.listeners.async_add_listener(
+            async_track_state_change_event(
+                hass,
+                data.dimmers,
+                data.motion_dimmer.adapter.async_update_capabilities,
+            ),
+            CONF_DIMMER,
         )
 
 
-@dataclass
-class DimmerStateChange:
-    """State change data."""
+@callback
+def async_track_triggers(hass: HomeAssistant, data: MotionDimmerData) -> None:
+    """Listen to the triggers turning on, and learn how long they stay on."""
+    data.listeners.async_remove_listeners(CONF_TRIGGERS)
+    if data.triggers:
+        data.listeners.async_add_listener(
+            async_track_state_change(
+                hass,
+                data.triggers,
+                data.motion_dimmer.triggered_callback,
+                to_state="on",
+            ),
+            CONF_TRIGGERS,
+        )
 
-    was_on: bool
-    is_on: bool
-    old_brightness: int | None
-    new_brightness: int | None
+        @callback
+        def async_trigger_changed(event: Event[EventStateChangedData]) -> None:
+            new_state = event.data["new_state"]
+            data.motion_dimmer.trigger_state_callback(
+                event.data["entity_id"],
+                new_state is not None and new_state.state == "on",
+            )
 
+        data.listeners.async_add_listener(
+            async_track_state_change_event(hass, data.triggers, async_trigger_changed),
+            CONF_TRIGGERS,
+        )
 
-@dataclass
-class TimerState:
-    """Timer state data."""
 
-    end_time: datetime
-    duration: str
-    state: str
+@callback
+def async_track_predictors(hass: HomeAssistant, data: MotionDimmerData) -> None:
+    """Listen to the predictors turning on."""
+    data.listeners.async_remove_listeners(CONF_PREDICTORS)
+    if data.predictors:
+        data.listeners.async_add_listener(
+            async_track_state_change(
+                hass,
+                data.predictors,
+                data.motion_dimmer.predictor_callback,
+                to_state="on",
+            ),
+            CONF_PREDICTORS,
+        )
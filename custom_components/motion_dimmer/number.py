@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import logging
+from typing import TYPE_CHECKING
 
 from homeassistant.components.number import NumberDeviceClass, NumberMode, RestoreNumber
 from homeassistant.config_entries import ConfigEntry
@@ -20,7 +21,10 @@ from .const import (
     DOMAIN,
     ControlEntities,
 )
-from .models import MotionDimmerData, MotionDimmerEntity, internal_id, segments
+from .entity import MotionDimmerEntity, internal_id, segments
+
+if TYPE_CHECKING:
+    from .models import MotionDimmerData
 
 _LOGGER = logging.getLogger(__name__)
 
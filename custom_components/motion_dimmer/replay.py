@@ -0,0 +1,574 @@
+"""Replay recorded state changes through the Motion Dimmer logic.
+
+The replay runs the production MotionDimmer on a virtual clock, so a day of
+events is processed in a fraction of a second. It does not depend on Home
+Assistant.
+
+    python -m custom_components.motion_dimmer.replay events.jsonl
+
+Each line of the input is a JSON object with the "time" (seconds since the
+epoch), the "dimmer" it belongs to, the "kind" of entity (trigger, predictor,
+dimmer or input_select), the "entity_id", the new "state" and, for the dimmer,
+the "brightness". The light commands and timer states are written as JSON
+lines.
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+import heapq
+import itertools
+import json
+import sys
+from typing import Any, NamedTuple, TextIO
+
+from .const import (
+    DEFAULT_EXTENSION_MAX,
+    DEFAULT_EXTENSION_STRATEGY,
+    DEFAULT_MANUAL_OVERRIDE,
+    DEFAULT_MIN_BRIGHTNESS,
+    DEFAULT_PREDICTION_BRIGHTNESS,
+    DEFAULT_PREDICTION_SECS,
+    DEFAULT_PUMP_MODE,
+    DEFAULT_SEG_SECONDS,
+    DEFAULT_TRIGGER_INTERVAL,
+    PERIODIC_TIMER,
+    PUMP_TIMER,
+    SENSOR_IDLE,
+    TIMER,
+    CommandPriority,
+)
+from .core import (
+    DimmerStateChange,
+    MotionDimmer,
+    MotionDimmerAdapter,
+    TimerState,
+    VirtualClock,
+)
+
+TRIGGER = "trigger"
+PREDICTOR = "predictor"
+DIMMER = "dimmer"
+INPUT_SELECT = "input_select"
+
+# Timers still running after the last event are run for at most this long.
+SETTLE_SECONDS = 24 * 60 * 60
+
+
+class ReplayEvent(NamedTuple):
+    """A recorded state change of an entity used by a Motion Dimmer."""
+
+    time: float
+    kind: str
+    entity_id: str
+    state: str
+    brightness: int | None = None
+
+
+class Command(NamedTuple):
+    """A command the Motion Dimmer sent to the dimmer or script."""
+
+    time: float
+    service: str
+    brightness: int | None = None
+
+
+class TimerChange(NamedTuple):
+    """A change of the timer sensor."""
+
+    time: float
+    end_time: float
+    duration: str
+    state: str
+
+
+@dataclass
+class DimmerSettings:
+    """The Motion Dimmer entity values used during a replay."""
+
+    segments: dict[str, float] = field(
+        default_factory=lambda: {"default": DEFAULT_SEG_SECONDS}
+    )
+    brightness: int = 255
+    brightness_min: float = DEFAULT_MIN_BRIGHTNESS
+    extension_max: float = DEFAULT_EXTENSION_MAX
+    manual_override: int = DEFAULT_MANUAL_OVERRIDE
+    prediction_brightness: float = DEFAULT_PREDICTION_BRIGHTNESS
+    prediction_secs: float = DEFAULT_PREDICTION_SECS
+    trigger_interval: float = DEFAULT_TRIGGER_INTERVAL
+    script: bool = False
+    adaptive_interval: bool = False
+    extension_strategy: str = DEFAULT_EXTENSION_STRATEGY
+    pump_mode: str = DEFAULT_PUMP_MODE
+    # The lowest brightness the simulated dimmer turns on at from off.
+    turn_on_level: float = 0
+
+
+@dataclass
+class ReplayResult:
+    """What the Motion Dimmer did during a replay."""
+
+    commands: list[Command] = field(default_factory=list)
+    timers: list[TimerChange] = field(default_factory=list)
+    # The number of times each kind of timer fired.
+    wakeups: dict[str, int] = field(
+        default_factory=lambda: dict.fromkeys((TIMER, PERIODIC_TIMER, PUMP_TIMER), 0)
+    )
+    # The times the dimmer turned on or off, for whatever reason, and the
+    # time the replay ended.
+    transitions: list[tuple[float, bool]] = field(default_factory=list)
+    end: float = 0.0
+    # The turn offs sent while the dimmer was off, as counted in production.
+    redundant_turn_offs: int = 0
+
+    def on_intervals(self) -> Iterator[tuple[float, float]]:
+        """The times the dimmer turned on and off again.
+
+        A dimmer still on at the end of the replay is on until the end.
+        """
+        since = None
+        for time, is_on in self.transitions:
+            if is_on and since is None:
+                since = time
+            elif not is_on and since is not None:
+                yield since, time
+                since = None
+        if since is not None:
+            yield since, max(self.end, since)
+
+
+class RecordingAdapter(MotionDimmerAdapter):
+    """Adapter that simulates the entities and records the commands."""
+
+    def __init__(
+        self,
+        settings: DimmerSettings,
+        clock: VirtualClock,
+        dimmers: list[str] | None = None,
+    ) -> None:
+        """Initialize the entities from the settings."""
+        self.settings = settings
+        self.result = ReplayResult()
+        self._segment_id = next(iter(settings.segments))
+        self.triggers: set[str] = set()
+        self.predictors: set[str] = set()
+        # Whether each dimmer is on and its brightness.
+        self.lights: dict[str, tuple[bool, int | None]] = dict.fromkeys(
+            dimmers or [DIMMER], (False, None)
+        )
+        self.changes: list[DimmerStateChange] = []
+        self._clock = clock
+        self._disabled_until = clock.now()
+        self._timer = TimerState(clock.now(), "00:00:00", SENSOR_IDLE)
+        self._timers: list[tuple[float, int, str, int, Callable]] = []
+        self._generations = dict.fromkeys((TIMER, PERIODIC_TIMER, PUMP_TIMER), 0)
+        self._sequence = itertools.count()
+
+    @property
+    def are_triggers_on(self) -> bool:
+        """True if any triggers are on."""
+        return bool(self.triggers)
+
+    @property
+    def brightness(self) -> float:
+        """Get the brightness for the segment."""
+        return self.settings.brightness
+
+    @property
+    def brightness_min(self) -> float:
+        """The minimum brightness needed to activate the dimmer."""
+        return self.settings.brightness_min
+
+    @property
+    def callback_budgets(self) -> dict[str, float]:
+        """Latency budgets are not checked during a replay."""
+        return {}
+
+    @property
+    def clock(self) -> VirtualClock:
+        """The virtual clock of the replay."""
+        return self._clock
+
+    @property
+    def color_mode(self) -> str:
+        """The color mode to set the dimmer to."""
+        return "brightness"
+
+    @property
+    def color_temp(self) -> None:
+        """The color temp to set the dimmer to."""
+        return None
+
+    @property
+    def dimmers(self) -> list[str]:
+        """The entity ids of the simulated dimmers."""
+        return list(self.lights)
+
+    @property
+    def disabled_until(self) -> datetime:
+        """The time Motion Dimmer is no longer disabled"""
+        return self._disabled_until
+
+    @property
+    def extension_max(self) -> float:
+        """Maximum number of seconds the timer can be extended."""
+        return self.settings.extension_max
+
+    @property
+    def extension_strategy(self) -> str:
+        """The name of the strategy that extends the timer."""
+        return self.settings.extension_strategy
+
+    @property
+    def dimmer_on(self) -> bool:
+        """Is any of the dimmers on."""
+        return any(is_on for is_on, _ in self.lights.values())
+
+    @property
+    def is_dimmer_on(self) -> bool:
+        """Is the dimmer currently on."""
+        return self.dimmer_on
+
+    @property
+    def is_interval_adaptive(self) -> bool:
+        """Is the trigger test interval learned from the triggers."""
+        return self.settings.adaptive_interval
+
+    @property
+    def is_on(self) -> bool:
+        """Is Motion Dimmer enabled"""
+        return True
+
+    @property
+    def is_overloaded(self) -> bool:
+        """A replay is never overloaded."""
+        return False
+
+    @property
+    def is_segment_enabled(self) -> bool:
+        """Return true if segment is enabled."""
+        return True
+
+    @property
+    def manual_override(self) -> int:
+        """The number of seconds to temprarily disable."""
+        return self.settings.manual_override
+
+    @property
+    def prediction_brightness(self) -> float:
+        """The brightness of the predictive activation."""
+        return self.settings.prediction_brightness
+
+    @property
+    def prediction_secs(self) -> float:
+        """The number of seconds to activate a prediction."""
+        return self.settings.prediction_secs
+
+    @property
+    def pump_mode(self) -> str:
+        """How the dimmer is turned on below the minimum brightness."""
+        return self.settings.pump_mode
+
+    @property
+    def rgb_color(self) -> None:
+        """The color to set the dimmer to."""
+        return None
+
+    @property
+    def seconds(self) -> float:
+        """Get the number of seconds for the segment."""
+        return self.settings.segments.get(self.segment_id, DEFAULT_SEG_SECONDS)
+
+    @property
+    def segment_id(self) -> str:
+        """The selected dropdown option."""
+        return self._segment_id
+
+    @segment_id.setter
+    def segment_id(self, segment_id: str) -> None:
+        self._segment_id = segment_id
+
+    @property
+    def timer(self) -> TimerState:
+        """Get the state of the timer."""
+        return self._timer
+
+    @property
+    def trigger_interval(self) -> float:
+        """Number of seconds to wait before checking the triggers again."""
+        return self.settings.trigger_interval
+
+    def cancel_periodic_timer(self) -> None:
+        """Cancel the periodic timer."""
+        self._generations[PERIODIC_TIMER] += 1
+
+    def cancel_timer(self) -> None:
+        """Stop the timer."""
+        self._generations[TIMER] += 1
+
+    def clear_slow_callback_issue(self) -> None:
+        """Latency budgets are not checked during a replay."""
+
+    def dimmer_state_callback(self, change: DimmerStateChange) -> DimmerStateChange:
+        """The replay passes the state change itself."""
+        return change
+
+    def measure_lag(self, *args, **kwargs) -> None:
+        """A replay has no lag."""
+
+    def raise_slow_callback_issue(self, kind: str, elapsed: float, budget: float):
+        """Latency budgets are not checked during a replay."""
+
+    def schedule_periodic_timer(self, time: datetime, callback) -> None:
+        """Start the periodic timer to check triggers."""
+        self._schedule(PERIODIC_TIMER, time, callback)
+
+    def schedule_pump_timer(self, time: datetime, callback) -> None:
+        """Pump the dimmer for a short time."""
+        self._schedule(PUMP_TIMER, time, callback)
+
+    def schedule_timer(self, time: datetime, duration: str, callback) -> None:
+        """Start timer."""
+        self._schedule(TIMER, time, callback)
+
+    def set_temporarily_disabled(self, next_time: datetime):
+        """Set the temporarily disabled field"""
+        self._disabled_until = next_time
+
+    def track_timer(self, timer_end, duration, state) -> None:
+        """Store changes in timer."""
+        self._timer = TimerState(timer_end, duration, state)
+        self.result.timers.append(
+            TimerChange(self._clock.time(), timer_end.timestamp(), duration, state)
+        )
+
+    def turn_on_dimmer(
+        self, priority: CommandPriority, dimmers: list[str] | None = None, **kwargs
+    ) -> None:
+        """Turn on the dimmers, or only the given ones."""
+        brightness = kwargs.get("brightness")
+        self.result.commands.append(
+            Command(self._clock.time(), "turn_on", brightness)
+        )
+        for dimmer, (is_on, _) in self.lights.items():
+            if dimmers is not None and dimmer not in dimmers:
+                continue
+            if is_on or (brightness or 0) >= self.settings.turn_on_level:
+                self.set_dimmer(dimmer, True, brightness)
+
+    def turn_off_dimmer(self, priority: CommandPriority) -> None:
+        """Turn off dimmer, counting it if the dimmer is off already."""
+        if not self.dimmer_on:
+            self.result.redundant_turn_offs += 1
+        self.result.commands.append(Command(self._clock.time(), "turn_off"))
+        for dimmer in self.lights:
+            self.set_dimmer(dimmer, False, None)
+
+    def turn_on_script(self) -> None:
+        """Turn on script."""
+        if self.settings.script:
+            self.result.commands.append(Command(self._clock.time(), "script"))
+
+    def set_dimmer(self, dimmer: str, is_on: bool, brightness: int | None) -> None:
+        """Change a dimmer, queueing the state change if there is one."""
+        was_on, old_brightness = self.lights.get(dimmer, (False, None))
+        if is_on == was_on and brightness == old_brightness:
+            return
+
+        self.changes.append(
+            DimmerStateChange(was_on, is_on, old_brightness, brightness, dimmer)
+        )
+        # The transitions are of the dimmers together, on while any is on.
+        any_on = self.dimmer_on
+        self.lights[dimmer] = (is_on, brightness)
+        if self.dimmer_on != any_on:
+            self.result.transitions.append((self._clock.time(), self.dimmer_on))
+
+    def next_deadline(self) -> float | None:
+        """The time the next pending timer fires."""
+        timers = self._timers
+        while timers and timers[0][3] != self._generations[timers[0][2]]:
+            heapq.heappop(timers)
+        return timers[0][0] if timers else None
+
+    def pop_timer(self) -> Callable:
+        """Remove the next pending timer and return its callback."""
+        _, _, name, _, callback = heapq.heappop(self._timers)
+        self._generations[name] += 1
+        self.result.wakeups[name] += 1
+        return callback
+
+    def _schedule(self, name: str, time: datetime, callback: Callable) -> None:
+        """Replace the timer with the name."""
+        self._generations[name] += 1
+        heapq.heappush(
+            self._timers,
+            (
+                time.timestamp(),
+                next(self._sequence),
+                name,
+                self._generations[name],
+                callback,
+            ),
+        )
+
+
+class Replay:
+    """Feed a stream of recorded state changes through a Motion Dimmer."""
+
+    def __init__(self, settings: DimmerSettings | None = None) -> None:
+        """Initialize the replay."""
+        self._settings = settings or DimmerSettings()
+
+    def run(
+        self, events: Iterable[ReplayEvent], until: float | None = None
+    ) -> ReplayResult:
+        """Replay the events in time order.
+
+        Timers still running after the last event keep firing until the
+        until time, or for a day if it is not given.
+        """
+        events = sorted(events, key=lambda event: event.time)
+        if not events:
+            return ReplayResult()
+
+        clock = VirtualClock(datetime.fromtimestamp(events[0].time, UTC))
+        dimmers = sorted({event.entity_id for event in events if event.kind == DIMMER})
+        adapter = RecordingAdapter(self._settings, clock, dimmers)
+        motion_dimmer = MotionDimmer(adapter)
+        motion_dimmer.init_timer()
+
+        for event in events:
+            self._run_timers(motion_dimmer, event.time)
+            self._advance(clock, event.time)
+            self._apply(motion_dimmer, event)
+
+        # Without an until time, the replay ends when the last timer fires.
+        end = until
+        if until is None:
+            until = events[-1].time + SETTLE_SECONDS
+        self._run_timers(motion_dimmer, until)
+        adapter.result.end = end if end is not None else clock.time()
+        return adapter.result
+
+    def _advance(self, clock: VirtualClock, time: float) -> None:
+        """Move the clock forward to a time."""
+        if time > clock.time():
+            clock.advance(time - clock.time())
+
+    def _apply(self, motion_dimmer: MotionDimmer, event: ReplayEvent) -> None:
+        """Change the entity and run the callback listening to it."""
+        adapter: RecordingAdapter = motion_dimmer.adapter
+        is_on = event.state == "on"
+        if event.kind == TRIGGER:
+            was_on = event.entity_id in adapter.triggers
+            if is_on:
+                adapter.triggers.add(event.entity_id)
+            else:
+                adapter.triggers.discard(event.entity_id)
+            if is_on != was_on:
+                motion_dimmer.trigger_state_callback(event.entity_id, is_on)
+            if is_on and not was_on:
+                self._callback(motion_dimmer, motion_dimmer.triggered_callback)
+        elif event.kind == PREDICTOR:
+            was_on = event.entity_id in adapter.predictors
+            if is_on:
+                adapter.predictors.add(event.entity_id)
+            else:
+                adapter.predictors.discard(event.entity_id)
+            if is_on and not was_on:
+                self._callback(motion_dimmer, motion_dimmer.predictor_callback)
+        elif event.kind == DIMMER:
+            adapter.set_dimmer(
+                event.entity_id, is_on, event.brightness if is_on else None
+            )
+            self._callback(motion_dimmer, None)
+        elif event.kind == INPUT_SELECT:
+            adapter.segment_id = event.state
+
+    def _callback(self, motion_dimmer: MotionDimmer, callback: Callable | None):
+        """Run a callback and then the dimmer state changes it caused."""
+        adapter: RecordingAdapter = motion_dimmer.adapter
+        if callback is not None:
+            callback()
+        while adapter.changes:
+            change = adapter.changes.pop(0)
+            motion_dimmer.dimmer_state_callback(change)
+
+    def _run_timers(self, motion_dimmer: MotionDimmer, time: float) -> None:
+        """Run the timers that fire up to a time."""
+        adapter: RecordingAdapter = motion_dimmer.adapter
+        while (deadline := adapter.next_deadline()) is not None and deadline <= time:
+            self._advance(adapter.clock, deadline)
+            self._callback(motion_dimmer, adapter.pop_timer())
+
+
+def read_events(file: TextIO) -> dict[str, list[ReplayEvent]]:
+    """Read the JSON lines of events, grouped by dimmer."""
+    streams: dict[str, list[ReplayEvent]] = {}
+    for line in file:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        streams.setdefault(row.get("dimmer", ""), []).append(
+            ReplayEvent(
+                float(row["time"]),
+                row["kind"],
+                row.get("entity_id", row["kind"]),
+                row["state"],
+                row.get("brightness"),
+            )
+        )
+    return streams
+
+
+def segment_seconds(events: Iterable[ReplayEvent], seconds: float) -> dict:
+    """The same number of seconds for every dropdown option in the events."""
+    segments = {"default": seconds}
+    for event in events:
+        if event.kind == INPUT_SELECT:
+            segments.setdefault(event.state, seconds)
+    return segments
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Replay a file of events and print what each Motion Dimmer did."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("events", type=argparse.FileType("r"))
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SEG_SECONDS)
+    parser.add_argument("--extension-max", type=float, default=DEFAULT_EXTENSION_MAX)
+    parser.add_argument(
+        "--trigger-interval", type=float, default=DEFAULT_TRIGGER_INTERVAL
+    )
+    args = parser.parse_args(argv)
+
+    streams = read_events(args.events)
+    for dimmer, events in streams.items():
+        settings = DimmerSettings(
+            segments=segment_seconds(events, args.seconds),
+            extension_max=args.extension_max,
+            trigger_interval=args.trigger_interval,
+        )
+        result = Replay(settings).run(events)
+        for row in _rows(dimmer, result):
+            sys.stdout.write(json.dumps(row) + "\n")
+
+
+def _rows(dimmer: str, result: ReplayResult) -> Iterable[dict[str, Any]]:
+    """The commands and timer changes of a replay in time order."""
+    rows = [
+        {"dimmer": dimmer, "type": "command", **command._asdict()}
+        for command in result.commands
+    ] + [
+        {"dimmer": dimmer, "type": "timer", **timer._asdict()}
+        for timer in result.timers
+    ]
+    # The sort is stable, so changes at the same time keep their order.
+    return sorted(rows, key=lambda row: row["time"])
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,16 @@ from __future__ import annotations
 
 from datetime import datetime
 import logging
+from typing import TYPE_CHECKING
 
-from homeassistant.components.sensor import RestoreSensor
+from homeassistant.components.sensor import (
+    RestoreSensor,
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfTime
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.util.dt import now
@@ -14,12 +21,19 @@ from homeassistant.util.dt import now
 from .const import (
     DOMAIN,
     SENSOR_ACTIVE,
+    SENSOR_CONFIRMED,
     SENSOR_DURATION,
     SENSOR_END_TIME,
     SENSOR_IDLE,
+    SENSOR_LAST,
+    SENSOR_MAX,
+    SENSOR_UNCONFIRMED,
     ControlEntities,
 )
-from .models import MotionDimmerData, MotionDimmerEntity, internal_id
+from .entity import MotionDimmerEntity, internal_id
+
+if TYPE_CHECKING:
+    from .models import MotionDimmerData
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -76,6 +90,45 @@ class TimerSensor(MotionDimmerEntity, RestoreSensor):
                     self._attr_native_value = SENSOR_IDLE
 
 
+class LatencySensor(MotionDimmerEntity, SensorEntity):
+    """Time the dimmer takes to confirm a command."""
+
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_icon = "mdi:timer-sync-outline"
+
+    def __init__(
+        self,
+        data: MotionDimmerData,
+        entity_name,
+        unique_id,
+    ) -> None:
+        """Initialize the Sensor."""
+        super().__init__(data, entity_name, unique_id)
+
+        self._attr_extra_state_attributes = {
+            SENSOR_LAST: None,
+            SENSOR_MAX: None,
+            SENSOR_CONFIRMED: 0,
+            SENSOR_UNCONFIRMED: 0,
+        }
+
+    async def async_update(self) -> None:
+        """Fetch new state data for the sensor."""
+        commands = self._data.motion_dimmer.adapter.commands
+        latency = commands.combined(self._data.dimmers)
+        if latency.average is not None:
+            self._attr_native_value = round(latency.average * 1000)
+            self._attr_extra_state_attributes[SENSOR_LAST] = round(latency.last * 1000)
+            self._attr_extra_state_attributes[SENSOR_MAX] = round(
+                latency.maximum * 1000
+            )
+
+        self._attr_extra_state_attributes[SENSOR_CONFIRMED] = latency.confirmed
+        self._attr_extra_state_attributes[SENSOR_UNCONFIRMED] = latency.unconfirmed
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: ConfigEntry,
@@ -91,5 +144,10 @@ async def async_setup_entry(
                 entity_name="Timer",
                 unique_id=internal_id(ControlEntities.TIMER, data.device_id),
             ),
+            LatencySensor(
+                data,
+                entity_name="Dimmer Latency",
+                unique_id=internal_id(ControlEntities.LATENCY, data.device_id),
+            ),
         ]
     )
@@ -1,27 +1,54 @@
 """The Motion Dimmers services."""
 
+from __future__ import annotations
+
+import asyncio
 import datetime
+import functools
 import logging
+from typing import TYPE_CHECKING
 
 from homeassistant.components.datetime import DOMAIN as DATETIME_DOMAIN
+from homeassistant.components.number import DOMAIN as NUMBER_DOMAIN
 from homeassistant.components.switch import DOMAIN as SWITCH_DOMAIN
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import entity_registry as er
 from homeassistant.helpers.service import ServiceTargetSelector
+from homeassistant.util import slugify
 from homeassistant.util.dt import now
 
+from . import tracing
 from .const import (
+    CONF_DIMMER,
+    CONF_INPUT_SELECT,
+    CONF_PREDICTORS,
+    CONF_TRIGGERS,
+    DEFAULT_CAPTURE_SECS,
+    DEFAULT_FALSE_OFF_RATE,
+    DEFAULT_TOP,
+    DEFAULT_TUNE_DAYS,
     DOMAIN,
+    SERVICE_APPLY,
+    SERVICE_DAYS,
+    SERVICE_DURATION,
+    SERVICE_FALSE_OFF_RATE,
     SERVICE_HOURS,
     SERVICE_MINUTES,
     SERVICE_SECONDS,
+    SERVICE_TOP,
     ControlEntities as CE,
 )
 from .models import MotionDimmerData, external_id
+from .tracing import CallProfiler, ChromeTrace, MemoryGrowth, instrumented
+
+if TYPE_CHECKING:
+    from .autotune import Recommendation
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@instrumented("service")
 async def async_service_temporarily_disable(hass: HomeAssistant, call: ServiceCall):
     """Handle the service call."""
 
@@ -52,6 +79,7 @@ async def async_service_temporarily_disable(hass: HomeAssistant, call: ServiceCa
             )
 
 
+@instrumented("service")
 async def async_service_enable(hass: HomeAssistant, call: ServiceCall):
     """Handle the service call."""
 
@@ -76,6 +104,7 @@ async def async_service_enable(hass: HomeAssistant, call: ServiceCall):
         )
 
 
+@instrumented("service")
 def service_finish_timer(hass: HomeAssistant, call: ServiceCall):
     """Handle the service call."""
 
@@ -85,6 +114,200 @@ def service_finish_timer(hass: HomeAssistant, call: ServiceCall):
         data.motion_dimmer.adapter.cancel_timer()
 
 
+def service_get_trace(hass: HomeAssistant, call: ServiceCall) -> ServiceResponse:
+    """Handle the service call."""
+
+    return {
+        data.device_id: data.motion_dimmer.trace.as_list()
+        for data in get_data(hass, call).values()
+    }
+
+
+async def async_service_capture_trace(
+    hass: HomeAssistant, call: ServiceCall
+) -> ServiceResponse:
+    """Handle the service call."""
+
+    capture = ChromeTrace()
+    await async_record(capture, call)
+
+    path = hass.config.path(f"motion_dimmer_trace_{now():%Y%m%d_%H%M%S}.json")
+    await hass.async_add_executor_job(capture.write, path)
+    _LOGGER.info("Wrote %s spans to %s", len(capture), path)
+    return {"path": path, "spans": len(capture), "dropped": capture.dropped}
+
+
+async def async_service_profile(
+    hass: HomeAssistant, call: ServiceCall
+) -> ServiceResponse:
+    """Handle the service call."""
+
+    profiler = CallProfiler()
+    await async_record(profiler, call)
+
+    # Only executor threads are profiled, the event loop calls are counted.
+    response = {
+        "path": None,
+        "scope": "executor_threads",
+        "calls": len(profiler),
+        "skipped": profiler.skipped,
+        "loop_calls": profiler.loop_calls,
+        "top": profiler.summary(int(call.data.get(SERVICE_TOP, DEFAULT_TOP))),
+    }
+    if stats := profiler.stats():
+        path = hass.config.path(f"motion_dimmer_profile_{now():%Y%m%d_%H%M%S}.prof")
+        await hass.async_add_executor_job(stats.dump_stats, path)
+        _LOGGER.info("Wrote profile of %s calls to %s", len(profiler), path)
+        response["path"] = path
+
+    return response
+
+
+async def async_service_trace_memory(
+    hass: HomeAssistant, call: ServiceCall
+) -> ServiceResponse:
+    """Handle the service call."""
+
+    duration = float(call.data.get(SERVICE_DURATION, DEFAULT_CAPTURE_SECS))
+    growth = MemoryGrowth()
+    if not await hass.async_add_executor_job(growth.start):
+        raise HomeAssistantError("A Motion Dimmer memory trace is already running")
+
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        response = await hass.async_add_executor_job(
+            growth.stop, int(call.data.get(SERVICE_TOP, DEFAULT_TOP))
+        )
+
+    return response
+
+
+async def async_service_autotune(
+    hass: HomeAssistant, call: ServiceCall
+) -> ServiceResponse:
+    """Handle the service call."""
+    # The replay and the process pool are only loaded when tuning.
+    from .autotune import tune_history, tuning_process
+
+    target_rate = float(call.data.get(SERVICE_FALSE_OFF_RATE, DEFAULT_FALSE_OFF_RATE))
+    end = now().timestamp()
+    start = end - float(call.data.get(SERVICE_DAYS, DEFAULT_TUNE_DAYS)) * 24 * 60 * 60
+    database = recorder_database(hass)
+
+    response = {}
+    # The replays run in their own process, which keeps them from holding
+    # the GIL of the event loop.
+    process = tuning_process()
+    try:
+        for data in get_data(hass, call).values():
+            options = {
+                CONF_DIMMER: data.dimmers,
+                CONF_INPUT_SELECT: data.input_select,
+                CONF_TRIGGERS: data.triggers,
+                CONF_PREDICTORS: data.predictors,
+            }
+            recommendation = await hass.loop.run_in_executor(
+                process,
+                functools.partial(
+                    tune_history,
+                    database,
+                    data.device_id,
+                    options,
+                    current_settings(hass, data),
+                    start,
+                    end,
+                    target_rate,
+                ),
+            )
+            if recommendation is None:
+                response[data.device_id] = None
+                continue
+
+            response[data.device_id] = recommendation._asdict()
+            del response[data.device_id]["dimmer"]
+            if call.data.get(SERVICE_APPLY, False):
+                await async_apply_recommendation(hass, data, recommendation)
+    finally:
+        await hass.async_add_executor_job(process.shutdown)
+
+    return response
+
+
+def recorder_database(hass: HomeAssistant) -> str:
+    """Get the path of the recorder database."""
+    url = f"sqlite:///{hass.config.path('home-assistant_v2.db')}"
+    if "recorder" in hass.config.components:
+        from homeassistant.components.recorder import get_instance
+
+        url = get_instance(hass).db_url
+
+    if not url.startswith("sqlite:///"):
+        raise HomeAssistantError("Motion Dimmer can only be tuned from SQLite history")
+    return url.removeprefix("sqlite:///")
+
+
+def current_settings(hass: HomeAssistant, data: MotionDimmerData) -> dict:
+    """Get the settings of a Motion Dimmer for the replay."""
+    adapter = data.motion_dimmer.adapter
+    settings = {
+        "seconds": {},
+        "extension_max": adapter.extension_max,
+        "trigger_interval": adapter.trigger_interval,
+        "manual_override": adapter.manual_override,
+    }
+    if data.predictors:
+        settings["prediction_secs"] = adapter.prediction_secs
+
+    if data.input_select and (select := hass.states.get(data.input_select)):
+        for option in select.attributes.get("options", []):
+            entity_id = adapter.external_id(CE.SEG_SECONDS, slugify(option))
+            if entity_id and (state := hass.states.get(entity_id)):
+                settings["seconds"][option] = float(state.state)
+
+    return settings
+
+
+async def async_apply_recommendation(
+    hass: HomeAssistant, data: MotionDimmerData, recommendation: Recommendation
+) -> None:
+    """Write the recommended settings to the number entities."""
+    values = {
+        external_id(hass, CE.EXTENSION_MAX, data.device_id): (
+            recommendation.extension_max
+        ),
+        external_id(hass, CE.TRIGGER_INTERVAL, data.device_id): (
+            recommendation.trigger_interval
+        ),
+    }
+    for option, seconds in recommendation.segments.items():
+        values[
+            external_id(hass, CE.SEG_SECONDS, data.device_id, slugify(option))
+        ] = seconds
+
+    for entity_id, value in values.items():
+        # Options that are no longer in the dropdown have no entity.
+        if entity_id is not None:
+            await hass.services.async_call(
+                NUMBER_DOMAIN,
+                "set_value",
+                {"entity_id": entity_id, "value": value},
+                blocking=True,
+            )
+
+
+async def async_record(recorder, call: ServiceCall) -> None:
+    """Send spans to a recorder for the duration of the service call."""
+    duration = float(call.data.get(SERVICE_DURATION, DEFAULT_CAPTURE_SECS))
+    if not tracing.start(recorder):
+        raise HomeAssistantError("A Motion Dimmer capture is already running")
+
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        tracing.stop(recorder)
+
+
 def get_data(hass: HomeAssistant, call: ServiceCall) -> dict[str, MotionDimmerData]:
     """Get the ids from the call."""
 
@@ -92,14 +315,15 @@ def get_data(hass: HomeAssistant, call: ServiceCall) -> dict[str, MotionDimmerDa
     if not target.has_any_selector:
         return  # pragma: no cover
 
-    data: dict[str, MotionDimmerData] = {}
     entity_reg = er.async_get(hass)
+    entry_ids: list[str] = []
     for unique_id in target.device_ids:
         entries = er.async_entries_for_device(entity_reg, unique_id)
-        data[entries[0].config_entry_id] = hass.data[DOMAIN][entries[0].config_entry_id]
+        entry_ids.append(entries[0].config_entry_id)
 
     for entity_id in target.entity_ids:
-        entity = entity_reg.async_get(entity_id)
-        data[entity.config_entry_id] = hass.data[DOMAIN][entity.config_entry_id]
+        entry_ids.append(entity_reg.async_get(entity_id).config_entry_id)
 
-    return data
+    # Skip Motion Dimmers that are not loaded.
+    loaded = hass.data.get(DOMAIN, {})
+    return {entry_id: loaded[entry_id] for entry_id in entry_ids if entry_id in loaded}
@@ -0,0 +1,270 @@
+"""Simulate the Motion Dimmer timer for many dimmer-days at once.
+
+The simulation follows the same rules as MotionDimmer (segment seconds, the
+add_time extension, periodic trigger checks, predictions and pumping), but
+runs every dimmer in lockstep with NumPy: each step handles the next event of
+every dimmer. It is cross-checked against the replay of the real logic.
+
+Manual overrides and changes of the dropdown are not simulated. Requires
+NumPy, which is installed with Home Assistant.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from .const import (
+    DEFAULT_EXTENSION_MAX,
+    DEFAULT_PREDICTION_SECS,
+    DEFAULT_SEG_SECONDS,
+    DEFAULT_TRIGGER_INTERVAL,
+    LONG_TIME_OFF,
+    PUMP_TIME,
+    SMALL_TIME_OFF,
+)
+from .replay import ReplayResult
+
+# Columns of the next event times, in the order ties are handled: timers
+# fire before state changes at the same time.
+TIMER, PERIODIC, PUMP, TRIGGER_EDGE, PREDICTION = range(5)
+
+
+@dataclass
+class SimulationResult:
+    """What each simulated dimmer did."""
+
+    on_seconds: np.ndarray
+    commands: np.ndarray
+    activations: np.ndarray
+    # Seconds between the dimmer turning off and on again, and the index of
+    # the dimmer of each gap.
+    gaps: np.ndarray
+    gap_dimmers: np.ndarray
+
+
+def pad(rows: Sequence[Sequence[float]]) -> np.ndarray:
+    """Stack rows of times of different lengths, padding with infinity."""
+    width = max((len(row) for row in rows), default=0)
+    times = np.full((len(rows), width), np.inf)
+    for index, row in enumerate(rows):
+        times[index, : len(row)] = row
+    return times
+
+
+def simulate(
+    on: np.ndarray,
+    off: np.ndarray,
+    predictions: np.ndarray | None = None,
+    seconds: float | np.ndarray = DEFAULT_SEG_SECONDS,
+    extension_max: float | np.ndarray = DEFAULT_EXTENSION_MAX,
+    trigger_interval: float | np.ndarray = DEFAULT_TRIGGER_INTERVAL,
+    prediction_secs: float | np.ndarray = DEFAULT_PREDICTION_SECS,
+    pump: bool | np.ndarray = False,
+) -> SimulationResult:
+    """Simulate dimmers from the times their trigger turns on and off.
+
+    Each row of on and off holds the sorted times of one dimmer, padded with
+    infinity, and each trigger turns off before it turns on again. The rows
+    of predictions hold the times a predictor turns on. The settings are the
+    same for all dimmers or given per dimmer. Pump is true for dimmers that
+    are set below the minimum brightness.
+    """
+    count = on.shape[0]
+    if predictions is None:
+        predictions = np.full((count, 0), np.inf)
+
+    # The trigger edges alternate between on and off.
+    edges = np.full((count, 2 * on.shape[1] + 1), np.inf)
+    edges[:, 0:-1:2] = on
+    edges[:, 1:-1:2] = off
+    predictions = np.concatenate((predictions, np.full((count, 1), np.inf)), axis=1)
+    rows = np.arange(count)
+    edge = np.zeros(count, dtype=int)
+    prediction = np.zeros(count, dtype=int)
+
+    # The clock of each dimmer starts at its first event.
+    start = np.minimum(edges[:, 0], predictions[:, 0])
+    state = _State(np.where(np.isfinite(start), start, 0))
+    state.seconds = state.setting(seconds)
+    state.extension_max = state.setting(extension_max)
+    state.trigger_interval = state.setting(trigger_interval)
+    state.prediction_secs = state.setting(prediction_secs)
+    state.pump = state.setting(pump).astype(bool)
+    deadlines = state.deadlines
+
+    while True:
+        deadlines[:, TRIGGER_EDGE] = edges[rows, edge]
+        deadlines[:, PREDICTION] = predictions[rows, prediction]
+        kind = np.argmin(deadlines, axis=1)
+        now = deadlines[rows, kind]
+        active = np.isfinite(now)
+        if not active.any():
+            break
+
+        # Timers are removed when they fire.
+        fired = active & (kind <= PUMP)
+        deadlines[rows[fired], kind[fired]] = np.inf
+
+        state.stop(active & (kind == TIMER), now)
+
+        is_periodic = active & (kind == PERIODIC)
+        recheck = is_periodic & ~state.trigger
+        deadlines[recheck, PERIODIC] = now[recheck] + state.trigger_interval[recheck]
+        is_pump = active & (kind == PUMP)
+        state.start((is_periodic & state.trigger) | is_pump, now, False)
+
+        is_edge = active & (kind == TRIGGER_EDGE)
+        state.trigger = np.where(is_edge, edge % 2 == 0, state.trigger)
+        edge += is_edge
+        state.start(is_edge & state.trigger, now, False)
+
+        is_prediction = active & (kind == PREDICTION)
+        prediction += is_prediction
+        state.start(is_prediction & ~state.light, now, True)
+
+    gap_dimmers = np.concatenate(state.gap_dimmers or [np.zeros(0, dtype=int)])
+    gaps = np.concatenate(state.gaps or [np.zeros(0)])
+    return SimulationResult(
+        state.on_seconds, state.commands, state.activations, gaps, gap_dimmers
+    )
+
+
+class _State:
+    """The state of MotionDimmer and its timers, one element per dimmer."""
+
+    seconds: np.ndarray
+    extension_max: np.ndarray
+    trigger_interval: np.ndarray
+    prediction_secs: np.ndarray
+    pump: np.ndarray
+
+    def __init__(self, start: np.ndarray) -> None:
+        """Initialize the dimmers as off at their start time."""
+        count = len(start)
+        self.deadlines = np.full((count, 5), np.inf)
+        self.trigger = np.zeros(count, dtype=bool)
+        self.light = np.zeros(count, dtype=bool)
+        self.is_prediction = np.zeros(count, dtype=bool)
+        self.is_pumping = np.zeros(count, dtype=bool)
+        self.additional_time = np.zeros(count)
+        self.time_on = start.copy()
+        self.time_off = start.copy()
+        self.light_since = np.zeros(count)
+        self.turned_off = np.full(count, np.nan)
+        self.on_seconds = np.zeros(count)
+        self.commands = np.zeros(count, dtype=int)
+        self.activations = np.zeros(count, dtype=int)
+        self.gaps: list[np.ndarray] = []
+        self.gap_dimmers: list[np.ndarray] = []
+
+    def setting(self, value: float | np.ndarray) -> np.ndarray:
+        """A setting of every dimmer."""
+        return np.broadcast_to(np.asarray(value, dtype=float), self.light.shape).copy()
+
+    def turn_on(self, mask: np.ndarray, now: np.ndarray) -> None:
+        """Send the turn on command."""
+        self.commands += mask
+        turned_on = mask & ~self.light
+        self.activations += turned_on
+        self.light_since = np.where(turned_on, now, self.light_since)
+        # Gaps are only counted after the dimmer turned off once.
+        gap = turned_on & ~np.isnan(self.turned_off)
+        if gap.any():
+            self.gap_dimmers.append(np.flatnonzero(gap))
+            self.gaps.append(now[gap] - self.turned_off[gap])
+        self.light |= mask
+
+    def start(self, mask: np.ndarray, now: np.ndarray, is_prediction: bool) -> None:
+        """MotionDimmer.start_dimmer for the masked dimmers."""
+        if not mask.any():
+            return
+
+        deadlines = self.deadlines
+        was_on = ~self.is_prediction & ~self.is_pumping & self.light
+        self.is_prediction = np.where(mask, is_prediction, self.is_prediction)
+
+        pumping = mask & ~was_on & ~self.is_pumping & ~self.is_prediction & self.pump
+        self.is_pumping |= pumping
+        self.turn_on(pumping, now)
+        deadlines[pumping, PUMP] = now[pumping] + PUMP_TIME
+
+        predicting = mask & ~pumping & self.is_prediction
+        self.turn_on(predicting, now)
+        deadlines[predicting, TIMER] = (
+            now[predicting] + self.prediction_secs[predicting]
+        )
+
+        starting = mask & ~pumping & ~predicting
+        self.is_pumping &= ~starting
+        self.time_on = np.where(starting & ~was_on, now, self.time_on)
+        self.add_time(starting, now)
+        self.turn_on(starting, now)
+        deadlines[starting, TIMER] = (
+            now[starting] + self.seconds[starting] + self.additional_time[starting]
+        )
+        periodic = starting & (self.trigger_interval != 0)
+        deadlines[periodic, PERIODIC] = now[periodic] + self.trigger_interval[periodic]
+
+    def add_time(self, mask: np.ndarray, now: np.ndarray) -> None:
+        """MotionDimmer.add_time for the masked dimmers."""
+        total = self.additional_time
+        on_seconds = np.round(now - self.time_on)
+        off_seconds = np.where(self.light, 0, np.round(now - self.time_off))
+        total = np.select(
+            [
+                off_seconds <= 0,
+                off_seconds < SMALL_TIME_OFF,
+                off_seconds < LONG_TIME_OFF,
+            ],
+            [
+                total + np.floor(on_seconds / 5),
+                total + on_seconds,
+                total - np.floor(total / 2),
+            ],
+            0,
+        )
+        total = np.minimum(self.extension_max, np.maximum(total, 0))
+        self.additional_time = np.where(mask, total, self.additional_time)
+
+    def stop(self, mask: np.ndarray, now: np.ndarray) -> None:
+        """MotionDimmer.stop_dimmer for the masked dimmers."""
+        if not mask.any():
+            return
+
+        # Restart instead of stopping while the trigger is on.
+        self.start(mask & self.trigger, now, False)
+
+        stopping = mask & ~self.trigger
+        self.is_prediction &= ~stopping
+        self.deadlines[stopping, TIMER] = np.inf
+        self.deadlines[stopping, PERIODIC] = np.inf
+        turned_off = stopping & self.light
+        self.commands += turned_off
+        self.on_seconds += np.where(turned_off, now - self.light_since, 0)
+        self.turned_off = np.where(turned_off, now, self.turned_off)
+        self.light &= ~stopping
+        self.time_off = np.where(stopping, now, self.time_off)
+
+
+def replay_summary(result: ReplayResult) -> tuple[float, int, int, list[float]]:
+    """The on seconds, commands, activations and gaps of a replay."""
+    on_seconds = 0.0
+    activations = 0
+    gaps = []
+    light_since = None
+    turned_off = None
+    for command in result.commands:
+        if command.service == "turn_on" and light_since is None:
+            activations += 1
+            light_since = command.time
+            if turned_off is not None:
+                gaps.append(command.time - turned_off)
+        elif command.service == "turn_off":
+            on_seconds += command.time - light_since
+            light_since = None
+            turned_off = command.time
+    commands = sum(command.service != "script" for command in result.commands)
+    return on_seconds, commands, activations, gaps
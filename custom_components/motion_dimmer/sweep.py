@@ -0,0 +1,253 @@
+"""Sweep Motion Dimmer settings over recorded or synthetic motion.
+
+Every combination of settings is replayed for every dimmer, spread over a
+process pool on all cores. It does not depend on Home Assistant.
+
+    python -m custom_components.motion_dimmer.sweep events.jsonl \\
+        --seconds 30 60 120 --extension-max 0 600 3600
+
+The recorded states of the dimmer were produced by the settings in use at
+the time, which would turn the light off on that schedule for every
+combination, so they are left out.
+
+For each dimmer and combination it reports the hours the light was on, the
+false-offs (the light turned off and motion resumed within --false-off
+seconds) and the light commands per hour, in total and for each dropdown
+option, as JSON lines.
+"""
+
+from __future__ import annotations
+
+import argparse
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import os
+import sys
+from typing import NamedTuple
+
+from .const import (
+    DEFAULT_EXTENSION_MAX,
+    DEFAULT_FALSE_OFF_SECS,
+    DEFAULT_MANUAL_OVERRIDE,
+    DEFAULT_PREDICTION_SECS,
+    DEFAULT_SEG_SECONDS,
+    DEFAULT_TRIGGER_INTERVAL,
+)
+from .replay import (
+    DIMMER,
+    INPUT_SELECT,
+    TRIGGER,
+    DimmerSettings,
+    Replay,
+    ReplayEvent,
+    ReplayResult,
+    read_events,
+    segment_seconds,
+)
+
+# The settings that can be swept and their defaults.
+SWEEP_SETTINGS = {
+    "seconds": DEFAULT_SEG_SECONDS,
+    "extension_max": DEFAULT_EXTENSION_MAX,
+    "trigger_interval": DEFAULT_TRIGGER_INTERVAL,
+    "prediction_secs": DEFAULT_PREDICTION_SECS,
+    "manual_override": DEFAULT_MANUAL_OVERRIDE,
+}
+
+
+class OptionResult(NamedTuple):
+    """How a dimmer behaved while a dropdown option was selected.
+
+    Each turn off counts for the option selected when the timer last started.
+    """
+
+    on_hours: float
+    turn_offs: int
+    false_offs: int
+
+
+class SweepResult(NamedTuple):
+    """How a dimmer behaved with a combination of settings."""
+
+    dimmer: str
+    settings: dict[str, float]
+    on_hours: float
+    false_offs: int
+    commands_per_hour: float
+    turn_offs: int
+    options: dict[str, OptionResult]
+
+
+def grid(**values: Iterable[float]) -> list[dict[str, float]]:
+    """Every combination of the values of each setting."""
+    names = list(values)
+    return [
+        dict(zip(names, combination))
+        for combination in itertools.product(*(values[name] for name in names))
+    ]
+
+
+def evaluate(
+    dimmer: str,
+    events: list[ReplayEvent],
+    settings: dict[str, float],
+    false_off_secs: float = DEFAULT_FALSE_OFF_SECS,
+) -> SweepResult:
+    """Replay the events of a dimmer with a combination of settings.
+
+    The seconds are the same for every dropdown option, or given per option.
+    Recorded dimmer states are ignored.
+    """
+    events = [event for event in events if event.kind != DIMMER]
+    values = {**SWEEP_SETTINGS, **settings}
+    seconds = values.pop("seconds")
+    if not isinstance(seconds, dict):
+        seconds = segment_seconds(events, seconds)
+    result = Replay(DimmerSettings(segments=seconds, **values)).run(events)
+    return summarize(dimmer, settings, events, result, false_off_secs)
+
+
+def summarize(
+    dimmer: str,
+    settings: dict[str, float],
+    events: list[ReplayEvent],
+    result: ReplayResult,
+    false_off_secs: float,
+) -> SweepResult:
+    """Measure the replay of a dimmer."""
+    motion = sorted(
+        event.time for event in events if event.kind == TRIGGER and event.state == "on"
+    )
+    selections = [event for event in events if event.kind == INPUT_SELECT]
+    selection_times = [event.time for event in selections]
+
+    def selected(time: float) -> str:
+        """The option selected at a time."""
+        index = bisect_right(selection_times, time) - 1
+        return selections[index].state if index >= 0 else "default"
+
+    # The on seconds, turn offs and false-offs of each option. The on time
+    # is split between the options selected while the light was on.
+    options: dict[str, list] = {}
+    for since, until in result.on_intervals():
+        index = bisect_right(selection_times, since)
+        while index < len(selection_times) and selection_times[index] < until:
+            options.setdefault(selected(since), [0.0, 0, 0])[0] += (
+                selection_times[index] - since
+            )
+            since = selection_times[index]
+            index += 1
+        options.setdefault(selected(since), [0.0, 0, 0])[0] += until - since
+
+    started = None
+    for command in result.commands:
+        if command.service == "turn_on":
+            started = command.time
+        if command.service != "turn_off":
+            continue
+
+        # The light may have been turned on by hand.
+        if started is None:
+            started = command.time
+        totals = options.setdefault(selected(started), [0.0, 0, 0])
+        totals[1] += 1
+        started = None
+        # Find the first motion when or after the dimmer turned off.
+        index = bisect_left(motion, command.time)
+        if index < len(motion) and motion[index] - command.time <= false_off_secs:
+            totals[2] += 1
+
+    hours = max(events[-1].time - events[0].time, 1) / 3600
+    commands = sum(command.service != "script" for command in result.commands)
+    return SweepResult(
+        dimmer,
+        settings,
+        sum(totals[0] for totals in options.values()) / 3600,
+        sum(totals[2] for totals in options.values()),
+        commands / hours,
+        sum(totals[1] for totals in options.values()),
+        {
+            option: OptionResult(on_seconds / 3600, turn_offs, false_offs)
+            for option, (on_seconds, turn_offs, false_offs) in options.items()
+        },
+    )
+
+
+# The events of each dimmer, sent once to each worker process.
+_streams: dict[str, list[ReplayEvent]] = {}
+
+
+def _init_worker(streams: dict[str, list[ReplayEvent]]) -> None:
+    """Keep the events in the worker process."""
+    _streams.update(streams)
+
+
+def _evaluate(task: tuple[str, dict[str, float], float]) -> SweepResult:
+    """Evaluate a combination in a worker process."""
+    dimmer, settings, false_off_secs = task
+    return evaluate(dimmer, _streams[dimmer], settings, false_off_secs)
+
+
+def sweep(
+    streams: dict[str, list[ReplayEvent]],
+    combinations: list[dict[str, float]],
+    false_off_secs: float = DEFAULT_FALSE_OFF_SECS,
+    workers: int | None = None,
+) -> list[SweepResult]:
+    """Evaluate every combination for every dimmer on all cores.
+
+    With a single worker everything runs in the calling process.
+    """
+    streams = {
+        dimmer: sorted(events, key=lambda event: event.time)
+        for dimmer, events in streams.items()
+    }
+    tasks = [
+        (dimmer, settings, false_off_secs)
+        for dimmer in streams
+        for settings in combinations
+    ]
+    if workers == 1:
+        return [
+            evaluate(dimmer, streams[dimmer], settings, false_off_secs)
+            for dimmer, settings, false_off_secs in tasks
+        ]
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(streams,)
+    ) as executor:
+        chunksize = max(1, len(tasks) // (4 * workers))
+        return list(executor.map(_evaluate, tasks, chunksize=chunksize))
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Sweep the settings of the dimmers in a file of events."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("events", type=argparse.FileType("r"))
+    for name, default in SWEEP_SETTINGS.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=float, nargs="+", default=[default]
+        )
+    parser.add_argument("--false-off", type=float, default=DEFAULT_FALSE_OFF_SECS)
+    parser.add_argument("--workers", type=int, help="defaults to the number of cores")
+    args = parser.parse_args(argv)
+
+    combinations = grid(**{name: getattr(args, name) for name in SWEEP_SETTINGS})
+    results = sweep(
+        read_events(args.events), combinations, args.false_off, args.workers
+    )
+    for result in results:
+        row = result._asdict()
+        row["options"] = {
+            option: option_result._asdict()
+            for option, option_result in result.options.items()
+        }
+        sys.stdout.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
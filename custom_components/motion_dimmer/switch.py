@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 from homeassistant.components.switch import SwitchDeviceClass, SwitchEntity
 from homeassistant.config_entries import ConfigEntry
@@ -15,7 +15,10 @@ from .const import (
     DOMAIN,
     ControlEntities as CE,
 )
-from .models import MotionDimmerData, MotionDimmerEntity, internal_id
+from .entity import MotionDimmerEntity, internal_id
+
+if TYPE_CHECKING:
+    from .models import MotionDimmerData
 
 _LOGGER = logging.getLogger(__name__)
 
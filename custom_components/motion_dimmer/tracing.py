@@ -0,0 +1,400 @@
+"""Instrumentation of Motion Dimmer callbacks, adapter calls and services."""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Iterator
+from contextlib import ExitStack, contextmanager
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from .const import TRACE_MAX_EVENTS, TRACEMALLOC_FRAMES
+
+# The profilers are only imported when a recording starts.
+if TYPE_CHECKING:
+    import cProfile
+    import pstats
+    import tracemalloc
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Recorders that currently receive spans. Instrumented functions only check
+# this list when nothing is recording, so instrumentation is almost free.
+_recorders: list = []
+_lock = threading.Lock()
+
+
+def start(recorder) -> bool:
+    """Start sending spans to a recorder.
+
+    Only one recorder of each type can run at a time.
+    """
+    with _lock:
+        if any(type(active) is type(recorder) for active in _recorders):
+            return False
+        _recorders.append(recorder)
+        return True
+
+
+def stop(recorder) -> None:
+    """Stop sending spans to a recorder."""
+    with _lock:
+        if recorder in _recorders:
+            _recorders.remove(recorder)
+
+
+def _span_args(args: tuple) -> dict[str, Any]:
+    """Get the span arguments from the instrumented call."""
+    if args and (device_id := getattr(args[0], "device_id", None)):
+        return {"dimmer": device_id}
+    return {}
+
+
+def instrumented(category: str) -> Callable:
+    """Record a span for each call of the decorated function."""
+
+    def decorator(func: Callable) -> Callable:
+        name = func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+
+            async def async_wrapper(*args, **kwargs):
+                if not _recorders:
+                    return await func(*args, **kwargs)
+
+                with ExitStack() as stack:
+                    for recorder in tuple(_recorders):
+                        stack.enter_context(
+                            recorder.async_span(name, category, _span_args(args))
+                        )
+                    return await func(*args, **kwargs)
+
+            return functools.wraps(func)(async_wrapper)
+
+        def wrapper(*args, **kwargs):
+            if not _recorders:
+                return func(*args, **kwargs)
+
+            with ExitStack() as stack:
+                for recorder in tuple(_recorders):
+                    stack.enter_context(recorder.span(name, category, _span_args(args)))
+                return func(*args, **kwargs)
+
+        return functools.wraps(func)(wrapper)
+
+    return decorator
+
+
+class ChromeTrace:
+    """Collect spans in the Chrome Trace Event format."""
+
+    def __init__(self, max_events: int = TRACE_MAX_EVENTS) -> None:
+        """Initialize the trace."""
+        self._events: list[dict[str, Any]] = []
+        self._max_events = max_events
+        self._spans = 0
+        self._ids = itertools.count(1)
+        self._pid = os.getpid()
+        self._threads: dict[int, str] = {}
+        self._origin = time.perf_counter()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        """Number of recorded spans."""
+        return self._spans
+
+    @contextmanager
+    def span(self, name: str, category: str, args: dict[str, Any]) -> Iterator[None]:
+        """Record the time spent in a block of code."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            duration = (end - start) * 1_000_000
+            self._record(
+                name,
+                category,
+                args,
+                {"ph": "X", "ts": self._micros(start), "dur": duration},
+            )
+
+    @contextmanager
+    def async_span(
+        self, name: str, category: str, args: dict[str, Any]
+    ) -> Iterator[None]:
+        """Record the time a coroutine takes, including the time it waits.
+
+        The event loop runs other coroutines while one waits, so their spans
+        overlap without nesting on the loop thread. They are recorded as
+        async events, which get a track for each span.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            span_id = next(self._ids)
+            self._record(
+                name,
+                category,
+                args,
+                {"ph": "b", "id": span_id, "ts": self._micros(start)},
+                {"ph": "e", "id": span_id, "ts": self._micros(end)},
+            )
+
+    def _micros(self, timestamp: float) -> float:
+        """Microseconds since the trace started."""
+        return (timestamp - self._origin) * 1_000_000
+
+    def _record(
+        self, name: str, category: str, args: dict[str, Any], *events: dict
+    ) -> None:
+        """Add the events of a span, unless the trace is full."""
+        if self._spans >= self._max_events:
+            self.dropped += 1
+            return
+
+        thread = threading.current_thread()
+        self._threads[thread.ident] = thread.name
+        self._spans += 1
+        self._events.extend(
+            {
+                "name": name,
+                "cat": category,
+                **event,
+                "pid": self._pid,
+                "tid": thread.ident,
+                "args": args,
+            }
+            for event in events
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return the trace as a Chrome Trace Event document."""
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": ident,
+                "args": {"name": name},
+            }
+            for ident, name in self._threads.items()
+        ]
+        return {
+            "traceEvents": metadata + self._events,
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped": self.dropped},
+        }
+
+    def write(self, path: str) -> None:
+        """Write the trace to a file."""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.as_dict(), file)
+
+
+class CallProfiler:
+    """Profile the instrumented calls made by executor threads.
+
+    Only the outermost instrumented call of each thread is profiled, since
+    cProfile can not nest. Callbacks and coroutines on the event loop are
+    only counted, because the profiler would also record everything else the
+    event loop runs.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the profiler."""
+        self._profiles: list[cProfile.Profile] = []
+        self._local = threading.local()
+        self.skipped = 0
+        self.loop_calls = 0
+
+    def __len__(self) -> int:
+        """Number of profiled calls."""
+        return len(self._profiles)
+
+    @contextmanager
+    def span(self, name: str, category: str, args: dict[str, Any]) -> Iterator[None]:
+        """Profile a block of code."""
+        if _in_event_loop():
+            self.loop_calls += 1
+            yield
+            return
+
+        if getattr(self._local, "active", False):
+            yield
+            return
+
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active.
+            self.skipped += 1
+            yield
+            return
+
+        self._local.active = True
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            self._profiles.append(profile)
+
+    @contextmanager
+    def async_span(
+        self, name: str, category: str, args: dict[str, Any]
+    ) -> Iterator[None]:
+        """Count a coroutine, which runs on the event loop."""
+        self.loop_calls += 1
+        yield
+
+    def stats(self) -> pstats.Stats | None:
+        """Merge the profiles of all calls."""
+        if not self._profiles:
+            return None
+
+        import pstats
+
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def summary(self, top: int) -> list[dict[str, Any]]:
+        """Return the functions with the most cumulative time."""
+        if (stats := self.stats()) is None:
+            return []
+
+        rows = sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:top]
+        return [
+            {
+                "function": f"{file}:{line}({func})",
+                "calls": calls,
+                "total_time": round(total, 6),
+                "cumulative_time": round(cumulative, 6),
+            }
+            for (file, line, func), (_, calls, total, cumulative, _) in rows
+        ]
+
+
+def _in_event_loop() -> bool:
+    """True if called from a thread running an event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class MemoryGrowth:
+    """Compare tracemalloc snapshots of the allocations made by the integration.
+
+    Allocations are attributed to the most recent frame in this package, so
+    objects created on its behalf by Home Assistant (timer handles, jobs,
+    events) are counted against the line that asked for them.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, nframes: int = TRACEMALLOC_FRAMES) -> None:
+        """Initialize the comparison."""
+        self._nframes = nframes
+        self._stop_tracing = False
+        self._first: tracemalloc.Snapshot | None = None
+
+    def start(self) -> bool:
+        """Take the first snapshot, starting tracemalloc if needed.
+
+        Only one comparison can run at a time.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+
+        import tracemalloc
+
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self._nframes)
+                self._stop_tracing = True
+            self._first = self._snapshot()
+        except BaseException:
+            if self._stop_tracing:
+                tracemalloc.stop()
+                self._stop_tracing = False
+            self._lock.release()
+            raise
+        return True
+
+    def stop(self, top: int) -> dict[str, Any]:
+        """Take the second snapshot and return the biggest growth."""
+        import tracemalloc
+
+        try:
+            second = self._snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if self._stop_tracing:
+                tracemalloc.stop()
+            self._lock.release()
+
+        sites: dict[tuple[str, int], dict[str, Any]] = {}
+        for diff in second.compare_to(self._first, "traceback"):
+            frame = _package_frame(diff.traceback)
+            if frame is None:
+                continue
+            key = (os.path.relpath(frame.filename, _PACKAGE_DIR), frame.lineno)
+            site = sites.setdefault(
+                key,
+                {
+                    "site": f"{key[0]}:{key[1]}",
+                    "size": 0,
+                    "size_diff": 0,
+                    "count": 0,
+                    "count_diff": 0,
+                    "allocated_in": set(),
+                },
+            )
+            site["size"] += diff.size
+            site["size_diff"] += diff.size_diff
+            site["count"] += diff.count
+            site["count_diff"] += diff.count_diff
+            allocated = diff.traceback[-1]
+            site["allocated_in"].add(f"{allocated.filename}:{allocated.lineno}")
+
+        rows = sorted(
+            sites.values(),
+            key=lambda site: (site["size_diff"], site["size"]),
+            reverse=True,
+        )[:top]
+        for site in rows:
+            site["allocated_in"] = sorted(site["allocated_in"])
+        return {"traced_memory": current, "peak_memory": peak, "sites": rows}
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        """Take a snapshot of the allocations made from this package."""
+        import tracemalloc
+
+        package = tracemalloc.Filter(
+            True, os.path.join(_PACKAGE_DIR, "*"), all_frames=True
+        )
+        return tracemalloc.take_snapshot().filter_traces((package,))
+
+
+def _package_frame(traceback: tracemalloc.Traceback) -> tracemalloc.Frame | None:
+    """Get the most recent frame of the traceback in this package."""
+    for frame in reversed(traceback):
+        if frame.filename.startswith(_PACKAGE_DIR):
+            return frame
+    return None
@@ -19,9 +19,11 @@ from pytest_homeassistant_custom_component.common import (
 
 from custom_components.motion_dimmer.const import (
     DEFAULT_EXTENSION_MAX,
+    DEFAULT_EXTENSION_STRATEGY,
     DEFAULT_MIN_BRIGHTNESS,
     DEFAULT_PREDICTION_BRIGHTNESS,
     DEFAULT_PREDICTION_SECS,
+    DEFAULT_PUMP_MODE,
     DEFAULT_SEG_SECONDS,
     DEFAULT_TRIGGER_INTERVAL,
     DOMAIN,
@@ -29,11 +31,12 @@ from custom_components.motion_dimmer.const import (
     ControlEntities,
     ControlEntityData,
 )
-from custom_components.motion_dimmer.models import (
+from custom_components.motion_dimmer.core import (
+    Clock,
     MotionDimmerAdapter,
     TimerState,
-    external_id,
 )
+from custom_components.motion_dimmer.entity import external_id
 
 from .const import (
     BINARY_SENSOR_DOMAIN,
@@ -287,14 +290,21 @@ class MockAdapter(MotionDimmerAdapter):
     # Override the properties so they can be set manually.
     are_triggers_on: bool = False
     brightness_min: int = 0
+    callback_budgets: dict = {}
+    clock: Clock = None
+    dimmers: list = []
     disabled_until: datetime = now()
     extension_max: int = 0
+    extension_strategy: str = ""
     is_dimmer_on: bool = False
+    is_interval_adaptive: bool = False
     is_segment_enabled: bool = False
     is_on: bool = False
+    is_overloaded: bool = False
     manual_override = 0
     prediction_brightness: int = 0
     prediction_secs: int = 0
+    pump_mode: str = ""
     segment_id: str = ""
     trigger_interval: int = 0
     events: list = []
@@ -310,14 +320,21 @@ class MockAdapter(MotionDimmerAdapter):
         self._log: list = []
         self.are_triggers_on = False
         self.brightness_min = DEFAULT_MIN_BRIGHTNESS
+        self.callback_budgets = {}
+        self.clock = Clock()
+        self.dimmers = [MOCK_LIGHT_1_ID]
         self.disabled_until = now()
         self.extension_max = DEFAULT_EXTENSION_MAX
+        self.extension_strategy = DEFAULT_EXTENSION_STRATEGY
         self.is_dimmer_on = False
+        self.is_interval_adaptive = False
         self.is_segment_enabled = True
         self.is_on = True
+        self.is_overloaded = False
         self.manual_override = 600
         self.prediction_brightness = DEFAULT_PREDICTION_BRIGHTNESS
         self.prediction_secs = DEFAULT_PREDICTION_SECS
+        self.pump_mode = DEFAULT_PUMP_MODE
         self.segment_id = "seg_1"
         self.trigger_interval = DEFAULT_TRIGGER_INTERVAL
         self.brightness = 255
@@ -340,10 +357,19 @@ class MockAdapter(MotionDimmerAdapter):
     def cancel_timer(self) -> None:
         self._log.append({"cancel_timer": True})
 
+    def clear_slow_callback_issue(self) -> None:
+        self._log.append({"clear_slow_callback_issue": True})
+
     def dimmer_state_callback(self, *args, **kwargs) -> None:
         self._log.append({"dimmer_state_callback": kwargs})
         return self._state_change
 
+    def measure_lag(self, *args, **kwargs) -> None:
+        pass
+
+    def raise_slow_callback_issue(self, kind: str, elapsed: float, budget: float):
+        self._log.append({"raise_slow_callback_issue": {"kind": kind}})
+
     def schedule_periodic_timer(self, time, callback) -> None:
         self._log.append(
             {
@@ -392,8 +418,8 @@ class MockAdapter(MotionDimmerAdapter):
     def turn_on_dimmer(self, **kwargs) -> None:
         self._log.append({"turn_on_dimmer": kwargs})
 
-    def turn_off_dimmer(self) -> None:
-        self._log.append({"turn_off_dimmer": True})
+    def turn_off_dimmer(self, priority) -> None:
+        self._log.append({"turn_off_dimmer": {"priority": priority}})
 
     def turn_on_script(self) -> None:
         self._log.append({"turn_on_script": True})
@@ -38,7 +38,7 @@ MOCK_SCRIPT_ID = SCRIPT_DOMAIN + "." + MOCK_SCRIPT
 
 
 MOCK_OPTIONS = {
-    CONF_DIMMER: MOCK_LIGHT_1_ID,
+    CONF_DIMMER: [MOCK_LIGHT_1_ID],
     CONF_INPUT_SELECT: "input_select.test_input_select",
     CONF_TRIGGERS: [MOCK_BINARY_SENSOR_1_ID],
     CONF_PREDICTORS: [MOCK_BINARY_SENSOR_2_ID],
@@ -1,6 +1,9 @@
 """Test Motion Dimmer setup process."""
 
+import asyncio
+import functools
 import logging
+from datetime import timedelta
 
 from freezegun import freeze_time
 from homeassistant.components.datetime import DOMAIN as DATETIME_DOMAIN
@@ -8,37 +11,66 @@ from homeassistant.components.script import DOMAIN as SCRIPT_DOMAIN
 from homeassistant.components.light import (
     ColorMode,
     ATTR_COLOR_TEMP,
+    ATTR_HS_COLOR,
     ATTR_RGB_COLOR,
     ATTR_BRIGHTNESS,
+    ATTR_SUPPORTED_COLOR_MODES,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.const import ATTR_ENTITY_ID, ATTR_SUPPORTED_FEATURES
+from homeassistant.core import HomeAssistant, State
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import entity_registry as er, issue_registry as ir
+from homeassistant.setup import async_setup_component
 from homeassistant.util.dt import now, utcnow
 
 from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
     async_capture_events,
 )
 
 from custom_components.motion_dimmer.const import (
+    COMMAND_CONFIRM_TIMEOUT,
+    DATA_LOAD,
+    DATA_SCHEDULER,
     DEFAULT_EXTENSION_MAX,
     DEFAULT_MIN_BRIGHTNESS,
     DEFAULT_PREDICTION_BRIGHTNESS,
     DEFAULT_PREDICTION_SECS,
     DEFAULT_SEG_SECONDS,
     DEFAULT_TRIGGER_INTERVAL,
+    DOMAIN,
+    GROUP_INTEGRATION,
+    GROUP_MESH,
+    SENSOR_CONFIRMED,
+    SENSOR_IDLE,
+    CommandPriority,
+    ControlEntities,
 )
+from custom_components.motion_dimmer.entity import external_id
 from custom_components.motion_dimmer.models import (
+    CommandScheduler,
+    DimmerCapabilities,
+    LoadMonitor,
     MotionDimmerHA,
+    native_color,
 )
 from tests import (
     advance_time,
     event_extract,
     from_pct,
+    let_dimmer_turn_off,
     setup_integration,
+    set_number_field_to,
     set_segment_light_to,
+    trigger_motion_dimmer,
 )
 
 from .const import (
+    CONFIG_NAME,
     LIGHT_DOMAIN,
+    MOCK_INPUT_SELECT,
+    MOCK_LIGHT_1_ID,
+    MOCK_LIGHT_2_ID,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -73,6 +105,10 @@ async def test_home_assistant_adapter(hass: HomeAssistant):
         delta = (now() - timer.end_time).total_seconds()
         assert -1 < delta < 1
         assert timer.duration == "00:00:00"
+        # The end time is published in local time.
+        adapter.track_timer(utcnow(), "00:00:00", SENSOR_IDLE)
+        await hass.async_block_till_done()
+        assert adapter.timer.end_time.utcoffset() == now().utcoffset()
 
         # Change color temp to test color mode.
         await set_segment_light_to(hass, "seg_1", "turn_on", {ATTR_COLOR_TEMP: 500})
@@ -95,14 +131,14 @@ async def test_home_assistant_adapter(hass: HomeAssistant):
 
         # Test turn on dimmer.
         events.clear()
-        await adapter.async_turn_on_dimmer()
+        await adapter.async_turn_on_light(MOCK_LIGHT_1_ID)
         await hass.async_block_till_done()
         assert event_extract(events, "domain") == LIGHT_DOMAIN
         assert event_extract(events, "service") == "turn_on"
 
         # Test turn off dimmer.
         events.clear()
-        await adapter.async_turn_off_dimmer()
+        await adapter.async_turn_off_light(MOCK_LIGHT_1_ID)
         await hass.async_block_till_done()
         assert event_extract(events, "domain") == LIGHT_DOMAIN
         assert event_extract(events, "service") == "turn_off"
@@ -125,3 +161,372 @@ async def test_home_assistant_adapter(hass: HomeAssistant):
         # Change brightness to 0.
         await set_segment_light_to(hass, "seg_1", "turn_on", {ATTR_BRIGHTNESS: 0})
         assert adapter.brightness == 0
+
+
+async def test_command_latency(hass: HomeAssistant):
+    """Test matching dimmer commands with confirmed states."""
+    with freeze_time(utcnow()) as frozen_time:
+        config_entry = await setup_integration(hass)
+        data = hass.data[DOMAIN][config_entry.entry_id]
+        commands = data.motion_dimmer.adapter.commands
+        await set_number_field_to(hass, ControlEntities.TRIGGER_INTERVAL, 0)
+
+        # The dimmer confirms the command when triggered.
+        await trigger_motion_dimmer(hass, frozen_time)
+        latency = commands.latency(MOCK_LIGHT_1_ID)
+        assert latency.confirmed == 1
+        assert latency.unconfirmed == 0
+
+        # The latency sensor reports the figures.
+        await advance_time(hass, 30, frozen_time)
+        sensor = hass.states.get(
+            external_id(hass, ControlEntities.LATENCY, CONFIG_NAME)
+        )
+        assert sensor.state == "0"
+        assert sensor.attributes.get(SENSOR_CONFIRMED) == 1
+
+        # States that do not reach the target do not confirm the command.
+        commands.command_sent(MOCK_LIGHT_2_ID, True, 100)
+        frozen_time.tick(2)
+        assert commands.state_changed(MOCK_LIGHT_2_ID, False, None) is None
+        assert commands.state_changed(MOCK_LIGHT_2_ID, True, 50) is None
+        assert commands.state_changed(MOCK_LIGHT_2_ID, True, 99) == 2
+        assert commands.state_changed(MOCK_LIGHT_2_ID, True, 99) is None
+        assert commands.latency(MOCK_LIGHT_2_ID).maximum == 2
+
+        # A command replaced before it was confirmed is unconfirmed.
+        commands.command_sent(MOCK_LIGHT_2_ID, False)
+        commands.command_sent(MOCK_LIGHT_2_ID, False)
+        assert commands.latency(MOCK_LIGHT_2_ID).unconfirmed == 1
+
+        # A command confirmed too late is unconfirmed.
+        frozen_time.tick(COMMAND_CONFIRM_TIMEOUT + 1)
+        assert commands.state_changed(MOCK_LIGHT_2_ID, False, None) is None
+        assert commands.latency(MOCK_LIGHT_2_ID).unconfirmed == 2
+        assert commands.latency(MOCK_LIGHT_2_ID).confirmed == 1
+
+        await let_dimmer_turn_off(hass, frozen_time)
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
+
+
+def test_native_color():
+    """Test converting the segment colors to the color mode of the dimmer."""
+    hs_only = DimmerCapabilities.from_state(
+        State(
+            MOCK_LIGHT_1_ID,
+            "off",
+            {
+                ATTR_SUPPORTED_COLOR_MODES: [ColorMode.HS],
+                ATTR_SUPPORTED_FEATURES: 0,
+            },
+        )
+    )
+    assert not hs_only.transition
+    assert native_color(hs_only, ColorMode.RGB, None, (255, 0, 0)) == {
+        ATTR_HS_COLOR: (0, 100)
+    }
+    assert ATTR_HS_COLOR in native_color(hs_only, ColorMode.COLOR_TEMP, 370, None)
+
+    temp_only = DimmerCapabilities(
+        frozenset([ColorMode.COLOR_TEMP]), min_mireds=153, max_mireds=370
+    )
+    assert native_color(temp_only, ColorMode.COLOR_TEMP, 500, None) == {
+        ATTR_COLOR_TEMP: 370
+    }
+    assert native_color(temp_only, ColorMode.RGB, None, (255, 0, 0)) == {}
+    assert native_color(temp_only, ColorMode.WHITE, None, None) == {}
+
+    # Dimmers without known capabilities get the segment colors.
+    unknown = DimmerCapabilities.from_state(None)
+    assert native_color(unknown, ColorMode.COLOR_TEMP, 500, None) == {
+        ATTR_COLOR_TEMP: 500
+    }
+
+
+async def test_dimmer_capabilities(hass: HomeAssistant):
+    """Test only sending what the dimmer supports."""
+    config_entry = await setup_integration(hass)
+    adapter = hass.data[DOMAIN][config_entry.entry_id].motion_dimmer.adapter
+    capabilities = adapter.capabilities(MOCK_LIGHT_1_ID)
+    assert ColorMode.COLOR_TEMP in capabilities.color_modes
+    assert adapter.as_dict()["capabilities"][MOCK_LIGHT_1_ID]["transition"]
+
+    # The capabilities follow the state of the dimmer.
+    hass.states.async_set(
+        MOCK_LIGHT_1_ID,
+        "off",
+        {
+            ATTR_SUPPORTED_COLOR_MODES: [ColorMode.BRIGHTNESS],
+            ATTR_SUPPORTED_FEATURES: 0,
+        },
+    )
+    await hass.async_block_till_done()
+    assert adapter.capabilities(MOCK_LIGHT_1_ID).color_modes == {ColorMode.BRIGHTNESS}
+
+    events = async_capture_events(hass, "call_service")
+    await adapter.async_turn_on_light(
+        MOCK_LIGHT_1_ID,
+        brightness=100,
+        color_mode=ColorMode.RGB,
+        rgb_color=(255, 0, 0),
+        transition=1,
+    )
+    await hass.async_block_till_done()
+    assert event_extract(events, "service_data") == {
+        "entity_id": MOCK_LIGHT_1_ID,
+        ATTR_BRIGHTNESS: 100,
+    }
+
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()
+
+
+async def test_dispatch(hass: HomeAssistant):
+    """Test side effects are dispatched without waiting, light first."""
+    config_entry = await setup_integration(hass)
+    adapter = hass.data[DOMAIN][config_entry.entry_id].motion_dimmer.adapter
+    events = async_capture_events(hass, "call_service")
+
+    def activate() -> None:
+        adapter.turn_on_dimmer(CommandPriority.TRIGGER, brightness=100)
+        adapter.turn_on_script()
+
+    await hass.async_add_executor_job(activate)
+    await hass.async_block_till_done()
+    domains = [event.data["domain"] for event in events]
+    assert [domain for domain in domains if domain != "datetime"][:2] == [
+        LIGHT_DOMAIN,
+        SCRIPT_DOMAIN,
+    ]
+
+    # Errors are counted and logged instead of reaching the callback.
+    async def fail() -> None:
+        raise HomeAssistantError("unreachable")
+
+    await hass.async_add_executor_job(adapter.dispatch, fail())
+    await hass.async_block_till_done()
+    assert adapter.stats.dispatch_errors == 1
+    assert adapter.as_dict()["in_flight"] == 0
+
+    # So are the errors of the service calls.
+    async def failing_service(call) -> None:
+        raise HomeAssistantError("script failed")
+
+    hass.services.async_register(SCRIPT_DOMAIN, "turn_on", failing_service)
+    await hass.async_add_executor_job(adapter.turn_on_script)
+    await hass.async_block_till_done()
+    assert adapter.stats.dispatch_errors == 2
+    assert adapter.as_dict()["in_flight"] == 0
+
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()
+
+
+async def test_slow_callback_issue(hass: HomeAssistant):
+    """Test the repair issue for slow callbacks."""
+    config_entry = await setup_integration(hass)
+    adapter = hass.data[DOMAIN][config_entry.entry_id].motion_dimmer.adapter
+    issue_reg = ir.async_get(hass)
+
+    await hass.async_add_executor_job(
+        adapter.raise_slow_callback_issue, "trigger", 1.2, 0.5
+    )
+    issue = issue_reg.async_get_issue(DOMAIN, adapter.slow_callback_issue_id)
+    assert issue.translation_placeholders["elapsed"] == "1200"
+    assert issue.translation_placeholders["budget"] == "500"
+
+    await hass.async_add_executor_job(adapter.clear_slow_callback_issue)
+    assert issue_reg.async_get_issue(DOMAIN, adapter.slow_callback_issue_id) is None
+
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()
+
+
+async def test_command_scheduler(hass: HomeAssistant):
+    """Test light commands over the limit are sent the most urgent first."""
+    scheduler = CommandScheduler(hass, max_in_flight=1)
+    sent = []
+    release = asyncio.Event()
+
+    async def command(name: str) -> None:
+        sent.append(name)
+        await release.wait()
+
+    tasks = [
+        hass.async_create_task(
+            scheduler.async_run(light, priority, command(priority.name.lower()))
+        )
+        for light, priority in [
+            ("light.a", CommandPriority.TRIGGER),
+            ("light.b", CommandPriority.PUMP),
+            ("light.c", CommandPriority.PREDICTION),
+            ("light.d", CommandPriority.TURN_OFF),
+            ("light.e", CommandPriority.TRIGGER),
+            # Replaces the turn off of the same light.
+            ("light.d", CommandPriority.PREDICTION),
+        ]
+    ]
+    await asyncio.sleep(0)
+    assert sent == ["trigger"]
+    assert scheduler.as_dict()["groups"] == {"none": {"in_flight": 1, "waiting": 4}}
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert sent == ["trigger", "trigger", "prediction", "prediction", "pump"]
+    assert scheduler.sent["trigger"] == 2
+    assert scheduler.sent["turn_off"] == 0
+    assert scheduler.queued == 5
+    assert scheduler.superseded == 1
+    assert scheduler.max_waiting == 4
+    assert scheduler.as_dict()["groups"] == {"none": {"in_flight": 0, "waiting": 0}}
+
+    # The limit can be shared by the lights of an integration or a mesh.
+    registry = er.async_get(hass)
+    mesh = MockConfigEntry(domain="zwave_js")
+    mesh.add_to_hass(hass)
+    zwave = registry.async_get_or_create(
+        LIGHT_DOMAIN, "zwave_js", "1", config_entry=mesh
+    ).entity_id
+    zigbee = registry.async_get_or_create(LIGHT_DOMAIN, "zha", "1").entity_id
+    scheduler = CommandScheduler(hass, group_by=GROUP_INTEGRATION)
+    assert scheduler.group(zwave) == "zwave_js"
+    scheduler = CommandScheduler(hass, group_by=GROUP_MESH)
+    assert scheduler.group(zwave) == mesh.entry_id
+    assert scheduler.group(zigbee) == "zha"
+    assert scheduler.group("light.unknown") == "light.unknown"
+
+
+async def test_command_scheduler_pump(hass: HomeAssistant):
+    """Test the newest command of a light supersedes all but a pump."""
+    scheduler = CommandScheduler(hass, max_in_flight=1)
+    sent = []
+    release = asyncio.Event()
+
+    async def command(name: str) -> None:
+        sent.append(name)
+        await release.wait()
+
+    tasks = [
+        hass.async_create_task(
+            scheduler.async_run(
+                light,
+                priority,
+                command(f"{light} {priority.name}"),
+                turn_on=priority != CommandPriority.TURN_OFF,
+            )
+        )
+        for light, priority in [
+            ("light.a", CommandPriority.TRIGGER),
+            ("light.b", CommandPriority.PREDICTION),
+            ("light.c", CommandPriority.PUMP),
+            ("light.c", CommandPriority.TRIGGER),
+            # A turn on after a turn off replaces it, so the light stays on.
+            ("light.d", CommandPriority.TURN_OFF),
+            ("light.d", CommandPriority.TRIGGER),
+            # A turn off does not need the pump.
+            ("light.e", CommandPriority.PUMP),
+            ("light.e", CommandPriority.TURN_OFF),
+        ]
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.as_dict()["groups"] == {"none": {"in_flight": 1, "waiting": 5}}
+
+    # The pump is moved ahead of the prediction, and is not superseded.
+    release.set()
+    await asyncio.gather(*tasks)
+    assert sent == [
+        "light.a TRIGGER",
+        "light.c PUMP",
+        "light.c TRIGGER",
+        "light.d TRIGGER",
+        "light.e TURN_OFF",
+        "light.b PREDICTION",
+    ]
+    assert scheduler.sent["pump"] == 1
+    assert scheduler.superseded == 2
+    assert scheduler.as_dict()["groups"] == {"none": {"in_flight": 0, "waiting": 0}}
+
+
+async def test_command_scheduler_service(hass: HomeAssistant):
+    """Test a light command holds its place until the service call returns."""
+    config_entry = await setup_integration(hass)
+    adapter = hass.data[DOMAIN][config_entry.entry_id].motion_dimmer.adapter
+    hass.data[DATA_SCHEDULER] = scheduler = CommandScheduler(hass, max_in_flight=1)
+    called = []
+    release = asyncio.Event()
+
+    async def slow_turn_on(call) -> None:
+        called.append(call.data[ATTR_ENTITY_ID])
+        await release.wait()
+
+    hass.services.async_register(LIGHT_DOMAIN, "turn_on", slow_turn_on)
+    for brightness in (100, 50):
+        await hass.async_add_executor_job(
+            functools.partial(
+                adapter.turn_on_dimmer, CommandPriority.TRIGGER, brightness=brightness
+            )
+        )
+    await asyncio.sleep(0.01)
+    assert called == [MOCK_LIGHT_1_ID]
+    assert scheduler.as_dict()["groups"]["none"] == {"in_flight": 1, "waiting": 1}
+
+    release.set()
+    await hass.async_block_till_done()
+    assert called == [MOCK_LIGHT_1_ID, MOCK_LIGHT_1_ID]
+    assert scheduler.as_dict()["groups"]["none"] == {"in_flight": 0, "waiting": 0}
+
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()
+
+
+async def test_scheduler_config(hass: HomeAssistant):
+    """Test the scheduler is set up from configuration.yaml."""
+    # The dropdown is set up with Motion Dimmer, which depends on it.
+    assert await async_setup_component(
+        hass,
+        DOMAIN,
+        {
+            **MOCK_INPUT_SELECT,
+            DOMAIN: {"max_in_flight": 2, "group_by": GROUP_MESH},
+        },
+    )
+    with freeze_time(utcnow()) as frozen_time:
+        config_entry = await setup_integration(hass)
+        scheduler: CommandScheduler = hass.data[DATA_SCHEDULER]
+        assert scheduler.max_in_flight == 2
+        assert scheduler.group_by == GROUP_MESH
+
+        # Commands are sent through the scheduler.
+        await trigger_motion_dimmer(hass, frozen_time)
+        assert scheduler.sent["trigger"] == 1
+
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
+
+
+async def test_load_monitor(hass: HomeAssistant):
+    """Test measuring the event loop and executor lag."""
+    config_entry = await setup_integration(hass)
+    adapter = hass.data[DOMAIN][config_entry.entry_id].motion_dimmer.adapter
+    load: LoadMonitor = hass.data[DATA_LOAD]
+    assert not adapter.is_overloaded
+
+    # Late callbacks raise the executor lag.
+    old_state = hass.states.get(MOCK_LIGHT_1_ID)
+    with freeze_time(utcnow() + timedelta(seconds=30)):
+        adapter.measure_lag(MOCK_LIGHT_1_ID, None, old_state)
+    assert load.event_lag > load.threshold
+    assert adapter.is_overloaded
+    assert adapter.as_dict()["load"]["is_overloaded"]
+
+    # The executor lag decays with each probe of the event loop.
+    for _ in range(20):
+        load._async_probe()
+    assert load.loop_lag < load.threshold
+    assert not adapter.is_overloaded
+
+    # The probe stops when the last Motion Dimmer is unloaded.
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()
+    assert load._cancel_probe is None
@@ -0,0 +1,82 @@
+"""Test recommending Motion Dimmer settings."""
+
+import json
+import os
+
+from custom_components.motion_dimmer.autotune import (
+    choose,
+    main,
+    tune,
+    tuning_process,
+)
+from custom_components.motion_dimmer.replay import INPUT_SELECT, TRIGGER, ReplayEvent
+
+START = 1_700_000_000.0
+MOTION = "binary_sensor.motion"
+SELECT = "input_select.mode"
+HOUR = 60 * 60
+
+
+def visits(option: str, start: float, pulses: list[float]) -> list[ReplayEvent]:
+    """An hour of visits every 5 minutes, with pulses of motion in each."""
+    events = [ReplayEvent(start, INPUT_SELECT, SELECT, option)]
+    for visit in range(12):
+        for pulse in pulses:
+            time = start + visit * 300 + pulse
+            events.append(ReplayEvent(time, TRIGGER, MOTION, "on"))
+            events.append(ReplayEvent(time + 5, TRIGGER, MOTION, "off"))
+    return events
+
+
+# Motion comes back 20 seconds after it stops during the day and 35 seconds
+# after it stops at night.
+EVENTS = visits("Day", START, [0, 25]) + visits("Night", START + HOUR, [0, 40, 80])
+
+
+def test_choose():
+    """Test choosing the least on time within the false-off rate."""
+    candidates = [("short", 0.5, 1, 0), ("long", 0, 3, 0), ("medium", 0, 2, 0)]
+    assert choose(candidates, 0.05) == "medium"
+    assert choose(candidates, 0.5) == "short"
+    assert choose(candidates[:1], 0.05) == "short"
+
+
+def test_tune():
+    """Test recommending settings for each option."""
+    recommendation = tune("kitchen", EVENTS, workers=1)
+
+    assert recommendation.segments["Day"] == 30
+    assert recommendation.segments["Night"] == 45
+    assert recommendation.extension_max == 0
+    assert recommendation.false_off_rate == 0
+
+    # A higher false-off rate allows shorter times at night.
+    recommendation = tune("kitchen", EVENTS, target_rate=0.7, workers=1)
+    assert recommendation.segments["Night"] < 45
+
+    # The seconds of options without motion are kept.
+    recommendation = tune("kitchen", EVENTS, {"seconds": {"Evening": 600}}, workers=1)
+    assert recommendation.segments["Evening"] == 600
+
+    assert tune("kitchen", []) is None
+
+
+def test_autotune_cli(tmp_path, capsys):
+    """Test recommending settings from a file of events."""
+    path = tmp_path / "events.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps({"dimmer": "kitchen", **event._asdict()}) for event in EVENTS
+        )
+    )
+    main([str(path), "--workers", "2"])
+
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [row["dimmer"] for row in rows] == ["kitchen"]
+    assert rows[0]["segments"]["Day"] == 30
+
+
+def test_tuning_process():
+    """Test tuning runs in a process of its own."""
+    with tuning_process() as process:
+        assert process.submit(os.getpid).result() != os.getpid()
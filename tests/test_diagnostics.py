@@ -0,0 +1,70 @@
+"""Test Motion Dimmer diagnostics."""
+
+import logging
+
+from freezegun import freeze_time
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+from homeassistant.util.dt import utcnow
+
+from custom_components.motion_dimmer.const import DOMAIN, ControlEntities
+from custom_components.motion_dimmer.diagnostics import (
+    async_get_config_entry_diagnostics,
+    async_get_device_diagnostics,
+)
+from tests import (
+    let_dimmer_turn_off,
+    set_number_field_to,
+    setup_integration,
+    trigger_motion_dimmer,
+)
+
+from .const import CONFIG_NAME, MOCK_LIGHT_1_ID
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def test_diagnostics(hass: HomeAssistant):
+    """Test the diagnostics dump."""
+    with freeze_time(utcnow()) as frozen_time:
+        config_entry = await setup_integration(hass)
+        await set_number_field_to(hass, ControlEntities.TRIGGER_INTERVAL, 0)
+        await trigger_motion_dimmer(hass, frozen_time)
+
+        diag = await async_get_config_entry_diagnostics(hass, config_entry)
+        assert diag["entry"]["options"]["dimmer"] == [MOCK_LIGHT_1_ID]
+        data = diag["data"]
+        assert data["dimmers"] == [MOCK_LIGHT_1_ID]
+
+        # Internal state and counters are included.
+        state = data["motion_dimmer"]
+        assert state["additional_time"] == 0
+        assert state["is_prediction"] is False
+        assert state["stats"]["events_handled"] > 0
+        assert state["stats"]["commands_sent"] == 1
+        assert state["stats"]["timer_reschedules"] == 1
+        assert state["stats"]["state_writes"] == 1
+        assert state["stats"]["executor_wait"] >= 0
+
+        # Pending timers and cached entity ids are included.
+        adapter = data["adapter"]
+        assert adapter["timer_deadline"] is not None
+        assert adapter["periodic_deadline"] is None
+        assert "sensor.timer" in adapter["entity_ids"]
+        assert adapter["latency"][MOCK_LIGHT_1_ID]["confirmed"] == 1
+
+        await let_dimmer_turn_off(hass, frozen_time)
+
+        # Turning off an already off dimmer is still sent, and counted.
+        motion_dimmer = hass.data[DOMAIN][config_entry.entry_id].motion_dimmer
+        await motion_dimmer.adapter.async_turn_off_light(MOCK_LIGHT_1_ID)
+        assert motion_dimmer.stats.redundant_turn_offs == 1
+
+        device_reg = dr.async_get(hass)
+        device = device_reg.async_get_device(identifiers={(DOMAIN, CONFIG_NAME)})
+        diag = await async_get_device_diagnostics(hass, config_entry, device)
+        assert diag["adapter"]["timer_deadline"] is None
+        assert diag["motion_dimmer"]["stats"]["commands_sent"] == 3
+
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
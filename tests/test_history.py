@@ -0,0 +1,183 @@
+"""Test reading Motion Dimmer history from the recorder database."""
+
+import json
+import sqlite3
+
+from custom_components.motion_dimmer.const import (
+    CONF_DIMMER,
+    CONF_INPUT_SELECT,
+    CONF_PREDICTORS,
+    CONF_TRIGGERS,
+    CONF_UNIQUE_NAME,
+    DOMAIN,
+)
+from custom_components.motion_dimmer.history import (
+    NO_BRIGHTNESS,
+    connect,
+    entry_events,
+    main,
+    read_history,
+)
+from custom_components.motion_dimmer.replay import (
+    DIMMER,
+    INPUT_SELECT,
+    PREDICTOR,
+    TRIGGER,
+    Replay,
+)
+
+START = 1_700_000_000.0
+MOTION = "binary_sensor.motion"
+HALLWAY = "binary_sensor.hallway"
+LIGHT = "light.dimmer"
+SELECT = "input_select.mode"
+OPTIONS = {
+    CONF_DIMMER: [LIGHT],
+    CONF_INPUT_SELECT: SELECT,
+    CONF_TRIGGERS: [MOTION],
+    CONF_PREDICTORS: [HALLWAY],
+}
+
+# The tables of the recorder schema that are read.
+SCHEMA = """
+CREATE TABLE states_meta (metadata_id INTEGER PRIMARY KEY, entity_id TEXT);
+CREATE TABLE state_attributes (attributes_id INTEGER PRIMARY KEY, shared_attrs TEXT);
+CREATE TABLE states (
+    state_id INTEGER PRIMARY KEY,
+    state TEXT,
+    attributes_id INTEGER,
+    last_updated_ts FLOAT,
+    metadata_id INTEGER
+);
+CREATE INDEX ix_states_metadata_id_last_updated_ts
+    ON states (metadata_id, last_updated_ts);
+"""
+
+ROWS = [
+    (SELECT, 0, "Day", None),
+    (HALLWAY, 5, "on", None),
+    (MOTION, 10, "on", None),
+    (LIGHT, 10.5, "on", {"brightness": 255, "color_mode": "brightness"}),
+    # Only another attribute changed.
+    (MOTION, 11, "on", None),
+    (HALLWAY, 15, "off", None),
+    (MOTION, 40, "off", None),
+    (LIGHT, 50, "on", {"brightness": 100, "color_mode": "brightness"}),
+    (LIGHT, 70, "off", {}),
+    (MOTION, 80, "unavailable", None),
+]
+
+
+def create_database(path, rows=ROWS, start=START) -> None:
+    """Create a recorder database with some history."""
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    metadata = {}
+    for entity_id, seconds, state, attributes in rows:
+        if entity_id not in metadata:
+            metadata[entity_id] = connection.execute(
+                "INSERT INTO states_meta (entity_id) VALUES (?)", (entity_id,)
+            ).lastrowid
+        attributes_id = None
+        if attributes is not None:
+            attributes_id = connection.execute(
+                "INSERT INTO state_attributes (shared_attrs) VALUES (?)",
+                (json.dumps(attributes),),
+            ).lastrowid
+        connection.execute(
+            "INSERT INTO states (state, attributes_id, last_updated_ts, metadata_id)"
+            " VALUES (?, ?, ?, ?)",
+            (state, attributes_id, start + seconds, metadata[entity_id]),
+        )
+    connection.commit()
+    connection.close()
+
+
+def test_read_history(tmp_path):
+    """Test reading the state changes of an entity."""
+    path = tmp_path / "home-assistant_v2.db"
+    create_database(path)
+    connection = connect(str(path))
+
+    motion = read_history(connection, MOTION, chunk_size=2)
+    assert [time - START for time in motion.times] == [10, 40, 80]
+    assert [motion.state(index) for index in range(len(motion))] == [
+        "on",
+        "off",
+        "unavailable",
+    ]
+    assert motion.values == ["on", "off", "unavailable"]
+    assert motion.times.typecode == "d"
+
+    light = read_history(connection, LIGHT, with_brightness=True)
+    assert list(light.brightness) == [255, 100, NO_BRIGHTNESS]
+
+    # Only the requested time range is read.
+    motion = read_history(connection, MOTION, START + 20, START + 50)
+    assert [time - START for time in motion.times] == [40]
+
+    assert len(read_history(connection, "binary_sensor.unknown")) == 0
+    connection.close()
+
+
+def test_entry_events(tmp_path):
+    """Test merging the history of an entry for the replay."""
+    path = tmp_path / "home-assistant_v2.db"
+    create_database(path)
+    connection = connect(str(path))
+
+    events = list(entry_events(connection, OPTIONS))
+    assert [(event.time - START, event.kind) for event in events] == [
+        (0, INPUT_SELECT),
+        (5, PREDICTOR),
+        (10, TRIGGER),
+        (10.5, DIMMER),
+        (15, PREDICTOR),
+        (40, TRIGGER),
+        (50, DIMMER),
+        (70, DIMMER),
+        (80, TRIGGER),
+    ]
+    assert events[3].brightness == 255
+
+    result = Replay().run(events)
+    assert [command.service for command in result.commands][:2] == [
+        "turn_on",
+        "turn_on",
+    ]
+    connection.close()
+
+
+def test_history_cli(tmp_path, capsys):
+    """Test exporting the history of a Motion Dimmer."""
+    path = tmp_path / "home-assistant_v2.db"
+    create_database(path)
+    storage = tmp_path / ".storage"
+    storage.mkdir()
+    (storage / "core.config_entries").write_text(
+        json.dumps(
+            {
+                "data": {
+                    "entries": [
+                        {
+                            "domain": DOMAIN,
+                            "data": {CONF_UNIQUE_NAME: "kitchen"},
+                            "options": OPTIONS,
+                        }
+                    ]
+                }
+            }
+        )
+    )
+
+    main([str(path), "kitchen", "--start", str(START + 10)])
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(rows) == 7
+    assert rows[0] == {
+        "dimmer": "kitchen",
+        "time": START + 10,
+        "kind": TRIGGER,
+        "entity_id": MOTION,
+        "state": "on",
+    }
+    assert rows[1]["brightness"] == 255
@@ -1,9 +1,27 @@
 """Test Motion Dimmer setup process."""
 
 import logging
+from pathlib import Path
+import subprocess
+import sys
+
+from freezegun import freeze_time
+from homeassistant.const import (
+    EVENT_CALL_SERVICE,
+    EVENT_HOMEASSISTANT_STARTED,
+    EVENT_STATE_CHANGED,
+)
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+from homeassistant.util.dt import utcnow
+from pytest_homeassistant_custom_component.common import async_capture_events
 
 from custom_components.motion_dimmer.const import (
+    CONF_BUDGET_TRIGGER,
+    CONF_DIMMER,
+    CONF_PREDICTORS,
+    CONF_SCRIPT,
+    CONF_TRIGGERS,
     DEFAULT_EXTENSION_MAX,
     DEFAULT_MANUAL_OVERRIDE,
     DEFAULT_MIN_BRIGHTNESS,
@@ -11,16 +29,26 @@ from custom_components.motion_dimmer.const import (
     DEFAULT_PREDICTION_SECS,
     DEFAULT_SEG_SECONDS,
     DEFAULT_TRIGGER_INTERVAL,
+    DOMAIN,
     ControlEntities,
 )
-from custom_components.motion_dimmer.models import external_id, segments
+from custom_components.motion_dimmer.entity import external_id, segments
 from tests import (
     get_disable_delta,
+    let_dimmer_turn_off,
+    set_number_field_to,
     setup_integration,
+    trigger_motion_dimmer,
 )
 
 from .const import (
     CONFIG_NAME,
+    LIGHT_DOMAIN,
+    MOCK_BINARY_SENSOR_1_ID,
+    MOCK_BINARY_SENSOR_2_ID,
+    MOCK_LIGHT_1_ID,
+    MOCK_LIGHT_2_ID,
+    MOCK_OPTIONS,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -63,3 +91,229 @@ async def test_setup(hass: HomeAssistant):
     await hass.async_block_till_done()
     await hass.config_entries.async_setup(config_entry.entry_id)
     await hass.async_block_till_done()
+
+
+def bus_listener_count(hass: HomeAssistant) -> int:
+    """Count the bus listeners Motion Dimmer can register."""
+    listeners = hass.bus.async_listeners()
+    return sum(
+        listeners.get(event_type, 0)
+        for event_type in (
+            EVENT_STATE_CHANGED,
+            EVENT_HOMEASSISTANT_STARTED,
+            er.EVENT_ENTITY_REGISTRY_UPDATED,
+        )
+    )
+
+
+async def test_reload_soak(hass: HomeAssistant):
+    """Test that reloading does not leak listeners or timers."""
+    with freeze_time(utcnow()) as frozen_time:
+        config_entry = await setup_integration(hass)
+        await set_number_field_to(hass, ControlEntities.TRIGGER_INTERVAL, 0)
+        bus_listeners = bus_listener_count(hass)
+        data = hass.data[DOMAIN][config_entry.entry_id]
+        live_listeners = data.listeners.live_listeners
+        assert live_listeners > 0
+
+        for _ in range(5):
+            # Reload while the timer is running.
+            await trigger_motion_dimmer(hass, frozen_time)
+            old_data = data
+            await hass.config_entries.async_reload(config_entry.entry_id)
+            await hass.async_block_till_done()
+            data = hass.data[DOMAIN][config_entry.entry_id]
+
+            # The old Motion Dimmer has nothing left running.
+            assert old_data.listeners.live_listeners == 0
+            assert old_data.listeners.live_timers == 0
+            # The new one restored the running timer.
+            assert data.listeners.live_listeners == live_listeners
+            assert data.listeners.live_timers == 1
+            assert bus_listener_count(hass) == bus_listeners
+
+        # A trigger sends a single command.
+        await let_dimmer_turn_off(hass, frozen_time)
+        calls = async_capture_events(hass, EVENT_CALL_SERVICE)
+        await trigger_motion_dimmer(hass, frozen_time)
+        turn_on = [
+            call
+            for call in calls
+            if call.data["domain"] == LIGHT_DOMAIN
+            and call.data["service"] == "turn_on"
+            and call.data["service_data"]["entity_id"] == MOCK_LIGHT_1_ID
+        ]
+        assert len(turn_on) == 1
+
+        await let_dimmer_turn_off(hass, frozen_time)
+        assert data.listeners.live_timers == 0
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
+        assert data.listeners.live_listeners == 0
+        assert DOMAIN not in hass.data or config_entry.entry_id not in hass.data[DOMAIN]
+
+
+async def test_hot_apply_options(hass: HomeAssistant):
+    """Test applying options changes without a reload."""
+    with freeze_time(utcnow()) as frozen_time:
+        config_entry = await setup_integration(hass)
+        await set_number_field_to(hass, ControlEntities.TRIGGER_INTERVAL, 0)
+        data = hass.data[DOMAIN][config_entry.entry_id]
+        live_listeners = data.listeners.live_listeners
+        await trigger_motion_dimmer(hass, frozen_time)
+        timer_state = hass.states.get(
+            external_id(hass, ControlEntities.TIMER, CONFIG_NAME)
+        )
+
+        # Swap the trigger and the predictor.
+        hass.config_entries.async_update_entry(
+            config_entry,
+            options=MOCK_OPTIONS
+            | {
+                CONF_TRIGGERS: [MOCK_BINARY_SENSOR_2_ID],
+                CONF_PREDICTORS: [MOCK_BINARY_SENSOR_1_ID],
+                CONF_BUDGET_TRIGGER: 100,
+            },
+        )
+        await hass.async_block_till_done()
+
+        # The Motion Dimmer and its running timer are kept.
+        assert hass.data[DOMAIN][config_entry.entry_id] is data
+        assert data.triggers == [MOCK_BINARY_SENSOR_2_ID]
+        assert data.budgets["trigger"] == 0.1
+        assert data.listeners.live_listeners == live_listeners
+        assert data.listeners.live_timers == 1
+        timer_id = external_id(hass, ControlEntities.TIMER, CONFIG_NAME)
+        assert hass.states.get(timer_id) == timer_state
+
+        # The new trigger turns the dimmer on.
+        await let_dimmer_turn_off(hass, frozen_time)
+        await trigger_motion_dimmer(hass, frozen_time, prediction=True)
+        decisions = [
+            (event["kind"], event["decision"])
+            for event in data.motion_dimmer.trace.as_list()
+        ]
+        assert decisions.count(("trigger", "on")) == 2
+        assert ("predictor", "dimmer_on") not in decisions
+        await let_dimmer_turn_off(hass, frozen_time)
+
+        # Removing the predictors removes entities, so the entry is reloaded.
+        hass.config_entries.async_update_entry(
+            config_entry, options=MOCK_OPTIONS | {CONF_PREDICTORS: []}
+        )
+        await hass.async_block_till_done()
+        assert hass.data[DOMAIN][config_entry.entry_id] is not data
+        assert data.listeners.live_listeners == 0
+
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
+
+
+async def test_migrate_entry(hass: HomeAssistant):
+    """Test migrating an entry with a single dimmer."""
+    config_entry = await setup_integration(
+        hass, options=MOCK_OPTIONS | {CONF_DIMMER: MOCK_LIGHT_1_ID}
+    )
+    assert config_entry.version == 2
+    assert config_entry.options[CONF_DIMMER] == [MOCK_LIGHT_1_ID]
+    assert hass.data[DOMAIN][config_entry.entry_id].dimmers == [MOCK_LIGHT_1_ID]
+
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()
+
+
+async def test_multiple_dimmers(hass: HomeAssistant):
+    """Test controlling several dimmers with one Motion Dimmer."""
+    with freeze_time(utcnow()) as frozen_time:
+        options = MOCK_OPTIONS | {CONF_DIMMER: [MOCK_LIGHT_1_ID, MOCK_LIGHT_2_ID]}
+        del options[CONF_SCRIPT]
+        config_entry = await setup_integration(hass, options=options)
+        await set_number_field_to(hass, ControlEntities.TRIGGER_INTERVAL, 0)
+        data = hass.data[DOMAIN][config_entry.entry_id]
+        calls = async_capture_events(hass, EVENT_CALL_SERVICE)
+
+        # Every dimmer is turned on and confirms its own command.
+        await trigger_motion_dimmer(hass, frozen_time)
+        turned_on = {
+            call.data["service_data"]["entity_id"]
+            for call in calls
+            if call.data["domain"] == LIGHT_DOMAIN
+        }
+        assert turned_on == {MOCK_LIGHT_1_ID, MOCK_LIGHT_2_ID}
+        assert data.motion_dimmer.adapter.commands.combined(data.dimmers).confirmed == 2
+
+        # Dimming one of them by hand is a manual override.
+        await hass.services.async_call(
+            LIGHT_DOMAIN,
+            "turn_on",
+            {"entity_id": MOCK_LIGHT_2_ID, "brightness": 10},
+            blocking=True,
+        )
+        await hass.async_block_till_done()
+        assert get_disable_delta(hass) > 0
+
+        # Both dimmers are turned off together.
+        calls.clear()
+        await let_dimmer_turn_off(hass, frozen_time)
+        turned_off = {
+            call.data["service_data"]["entity_id"]
+            for call in calls
+            if call.data["service"] == "turn_off"
+        }
+        assert turned_off == {MOCK_LIGHT_1_ID, MOCK_LIGHT_2_ID}
+
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
+
+
+# Modules only needed by services, scripts or recordings.
+LAZY_MODULES = (
+    "custom_components.motion_dimmer.services",
+    "homeassistant.components.script",
+    "cProfile",
+    "pstats",
+    "tracemalloc",
+)
+
+
+def import_times(modules: str) -> dict[str, int]:
+    """The cumulative microseconds to import each module imported by modules."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modules}"],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+    # Each line is "import time: self [us] | cumulative | module".
+    times = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time():
+    """Test setting up the integration only imports what it needs."""
+    setup_modules = ", ".join(
+        f"custom_components.motion_dimmer.{module}"
+        for module in ("models", "datetime", "light", "number", "sensor", "switch")
+    )
+    times = import_times(setup_modules)
+    logging.info(
+        "Motion Dimmer import time: %s us",
+        sum(times[module] for module in setup_modules.split(", ")),
+    )
+
+    assert "custom_components.motion_dimmer.entity" in times
+    for module in LAZY_MODULES:
+        assert module not in times
+
+
+def test_services_import():
+    """Test the services only import the tuning modules when tuning."""
+    times = import_times("custom_components.motion_dimmer.services")
+    assert "custom_components.motion_dimmer.services" in times
+    for module in ("autotune", "history", "replay", "sweep"):
+        assert f"custom_components.motion_dimmer.{module}" not in times
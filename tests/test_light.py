@@ -20,7 +20,7 @@ from custom_components.motion_dimmer.const import (
     DEFAULT_SEG_SECONDS,
     ControlEntities,
 )
-from custom_components.motion_dimmer.models import external_id
+from custom_components.motion_dimmer.entity import external_id
 from tests import (
     advance_time,
     dimmer_is_set_to,
@@ -93,14 +93,14 @@ async def test_light_settings(hass: HomeAssistant):
         events.clear()
         await trigger_motion_dimmer(hass, frozen_time)
 
-        # Dimmer is set to brightness 90, 3508K.
+        # Dimmer is set to brightness 90 and its warmest color temp.
         await dimmer_is_set_to(
             events,
             {
                 ATTR_BRIGHTNESS: 90,
                 ATTR_TRANSITION: 1,
                 ATTR_RGB_COLOR: None,
-                ATTR_COLOR_TEMP: 3508,
+                ATTR_COLOR_TEMP: 500,
             },
         )
 
@@ -1,7 +1,10 @@
 """Test Motion Dimmer models."""
 
 import logging
+import subprocess
+import sys
 from datetime import timedelta
+from pathlib import Path
 from unittest.mock import PropertyMock, patch
 
 from homeassistant.components.light import (
@@ -14,24 +17,35 @@ from homeassistant.components.light import (
 from homeassistant.util.dt import now
 
 from custom_components.motion_dimmer.const import (
+    COMMAND_CONFIRM_TIMEOUT,
     DEFAULT_PREDICTION_BRIGHTNESS,
     DEFAULT_PREDICTION_SECS,
     DEFAULT_SEG_SECONDS,
+    DEFAULT_TRIGGER_INTERVAL,
+    EXTENSION_HEURISTIC,
+    EXTENSION_LEARNED,
     LONG_TIME_OFF,
+    PUMP_LEARNED,
     PUMP_TIME,
     SENSOR_ACTIVE,
+    SLOW_CALLBACK_STREAK,
     SMALL_TIME_OFF,
+    CommandPriority,
 )
-from custom_components.motion_dimmer.models import (
+from custom_components.motion_dimmer.core import (
+    CommandTracker,
     DimmerStateChange,
+    EventTrace,
     MotionDimmer,
     TimerState,
+    VirtualClock,
 )
 from tests import (
     MockAdapter,
     entry_keys,
     get_entry_value,
 )
+from tests.const import MOCK_LIGHT_1_ID, MOCK_LIGHT_2_ID
 
 _LOGGER = logging.getLogger(__name__)
 logging.basicConfig(level=logging.ERROR, force=True)
@@ -268,6 +282,129 @@ async def test_pump():
     assert get_entry_value(events, "schedule_timer", "secs") == DEFAULT_SEG_SECONDS
 
 
+def test_learned_pump():
+    """Test skipping the pump once the dimmer turned on without it."""
+    mock_adapter = MockAdapter()
+    mock_adapter.pump_mode = PUMP_LEARNED
+    mock_adapter.brightness = 10
+    mock_adapter.brightness_min = 20
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # The brightness is tried without pumping and checked after the pump time.
+    motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events) == ["schedule_pump_timer", *TRIGGER_EVENTS]
+    assert get_entry_value(events, "turn_on_dimmer", "brightness") == 10
+
+    # The dimmer stayed off, so it is pumped.
+    motion_dimmer.pump_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events) == ["turn_on_dimmer", "schedule_pump_timer"]
+    assert get_entry_value(events, "turn_on_dimmer", "brightness") == 20
+    assert motion_dimmer.threshold(MOCK_LIGHT_1_ID).highest_off == 10
+
+    # And pumped right away from then on.
+    motion_dimmer.pump_callback()
+    motion_dimmer.stop_dimmer()
+    mock_adapter.flush_entries()
+    motion_dimmer.triggered_callback()
+    assert entry_keys(mock_adapter.flush_entries()) == [
+        "turn_on_dimmer",
+        "schedule_pump_timer",
+    ]
+
+    # A brighter level turns the dimmer on, so it needs a single command.
+    motion_dimmer.pump_callback()
+    motion_dimmer.stop_dimmer()
+    mock_adapter.brightness = 15
+    motion_dimmer.triggered_callback()
+    mock_adapter._state_change = DimmerStateChange(
+        False, True, None, 15, MOCK_LIGHT_1_ID
+    )
+    motion_dimmer.dimmer_state_callback()
+    motion_dimmer.pump_callback()
+    assert motion_dimmer.threshold(MOCK_LIGHT_1_ID).as_dict() == {
+        "lowest_on": 15,
+        "highest_off": 10,
+    }
+
+    motion_dimmer.stop_dimmer()
+    mock_adapter.flush_entries()
+    motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events) == TRIGGER_EVENTS
+    assert get_entry_value(events, "turn_on_dimmer", "brightness") == 15
+
+
+def test_learned_pump_disabled():
+    """Test a probe is dropped when the dimmer changes while disabled."""
+    mock_adapter = MockAdapter()
+    mock_adapter.pump_mode = PUMP_LEARNED
+    mock_adapter.brightness = 10
+    mock_adapter.brightness_min = 20
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    motion_dimmer.triggered_callback()
+    mock_adapter.is_on = False
+    mock_adapter._state_change = DimmerStateChange(
+        False, True, None, 10, MOCK_LIGHT_1_ID
+    )
+    motion_dimmer.dimmer_state_callback()
+    mock_adapter.flush_entries()
+
+    # Nothing is learned and the dimmer is left alone.
+    motion_dimmer.pump_callback()
+    assert mock_adapter.flush_entries() == []
+    assert motion_dimmer.threshold(MOCK_LIGHT_1_ID).as_dict() == {
+        "lowest_on": None,
+        "highest_off": None,
+    }
+
+
+def test_learned_pump_dimmers():
+    """Test that each dimmer learns its own threshold."""
+    mock_adapter = MockAdapter()
+    mock_adapter.dimmers = [MOCK_LIGHT_1_ID, MOCK_LIGHT_2_ID]
+    mock_adapter.pump_mode = PUMP_LEARNED
+    mock_adapter.brightness = 10
+    mock_adapter.brightness_min = 20
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # Only the first dimmer turns on without pumping.
+    motion_dimmer.triggered_callback()
+    mock_adapter._state_change = DimmerStateChange(
+        False, True, None, 10, MOCK_LIGHT_1_ID
+    )
+    motion_dimmer.dimmer_state_callback()
+    mock_adapter.is_dimmer_on = True
+    mock_adapter.flush_entries()
+
+    # Only the second dimmer is pumped, without starting the timer again.
+    motion_dimmer.pump_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events) == ["turn_on_dimmer", "schedule_pump_timer"]
+    assert get_entry_value(events, "turn_on_dimmer", "brightness") == 20
+    assert get_entry_value(events, "turn_on_dimmer", "dimmers") == [MOCK_LIGHT_2_ID]
+    assert motion_dimmer.threshold(MOCK_LIGHT_1_ID).lowest_on == 10
+    assert motion_dimmer.threshold(MOCK_LIGHT_2_ID).highest_off == 10
+
+    # And then set to the brightness.
+    motion_dimmer.pump_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events) == ["turn_on_dimmer"]
+    assert get_entry_value(events, "turn_on_dimmer", "brightness") == 10
+    assert get_entry_value(events, "turn_on_dimmer", "dimmers") == [MOCK_LIGHT_2_ID]
+
+    # The second dimmer still needs the pump.
+    motion_dimmer.stop_dimmer()
+    mock_adapter.is_dimmer_on = False
+    mock_adapter.flush_entries()
+    motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events) == ["turn_on_dimmer", "schedule_pump_timer"]
+    assert get_entry_value(events, "turn_on_dimmer", "dimmers") is None
+
+
 async def test_disable():
     """Test disable settings."""
 
@@ -388,6 +525,88 @@ async def test_cause_temp_disable():
     assert entry_keys(events) == []
 
 
+async def test_command_priority():
+    """Test the priority each light command is sent with."""
+    mock_adapter = MockAdapter()
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # A prediction.
+    motion_dimmer.predictor_callback()
+    events = mock_adapter.flush_entries()
+    assert (
+        get_entry_value(events, "turn_on_dimmer", "priority")
+        == CommandPriority.PREDICTION
+    )
+
+    # A trigger.
+    mock_adapter.is_dimmer_on = True
+    motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert get_entry_value(events, "turn_on_dimmer", "priority") == (
+        CommandPriority.TRIGGER
+    )
+
+    # The timer runs out.
+    motion_dimmer.timer_callback()
+    events = mock_adapter.flush_entries()
+    assert get_entry_value(events, "turn_off_dimmer", "priority") == (
+        CommandPriority.TURN_OFF
+    )
+
+    # A pump.
+    mock_adapter.is_dimmer_on = False
+    mock_adapter.brightness = 10
+    mock_adapter.brightness_min = 50
+    motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert get_entry_value(events, "turn_on_dimmer", "priority") == (
+        CommandPriority.PUMP
+    )
+
+    # The timer runs out after a manual override.
+    mock_adapter._state_change = DimmerStateChange(True, False, 255, 0)
+    mock_adapter.are_triggers_on = True
+    motion_dimmer.dimmer_state_callback()
+    mock_adapter.are_triggers_on = False
+    mock_adapter.is_dimmer_on = True
+    mock_adapter.flush_entries()
+    motion_dimmer.timer_callback()
+    events = mock_adapter.flush_entries()
+    assert get_entry_value(events, "turn_off_dimmer", "priority") == (
+        CommandPriority.RECOVERY
+    )
+
+    # Only the first time.
+    motion_dimmer.timer_callback()
+    events = mock_adapter.flush_entries()
+    assert get_entry_value(events, "turn_off_dimmer", "priority") == (
+        CommandPriority.TURN_OFF
+    )
+
+
+async def test_command_timeout():
+    """Test commands that are never confirmed are counted as unconfirmed."""
+    clock = VirtualClock()
+    commands = CommandTracker(clock=clock)
+    commands.command_sent("light.one", True, 100)
+    commands.command_sent("light.two", False)
+
+    clock.advance(2)
+    assert commands.state_changed("light.one", True, 100) == 2
+
+    # The other light never reports back.
+    clock.advance(COMMAND_CONFIRM_TIMEOUT)
+    assert commands.combined(["light.one", "light.two"]).unconfirmed == 1
+    assert "light.two" not in commands.pending
+
+    # Sending another command also sweeps them.
+    commands.command_sent("light.two", True)
+    clock.advance(COMMAND_CONFIRM_TIMEOUT + 1)
+    commands.command_sent("light.one", True)
+    assert commands.latency("light.two").unconfirmed == 2
+    assert list(commands.pending) == ["light.one"]
+
+
 async def test_extension():
     """Test extending timer."""
 
@@ -411,7 +630,7 @@ async def test_extension():
         "schedule_periodic_timer",
     ]
     with patch(
-        "custom_components.motion_dimmer.models.MotionDimmer.dimmer_on_seconds",
+        "custom_components.motion_dimmer.core.MotionDimmer.dimmer_on_seconds",
         return_value=200,
         new_callable=PropertyMock,
     ):
@@ -443,7 +662,7 @@ async def test_extension():
     mock_adapter.is_dimmer_on = False
 
     with patch(
-        "custom_components.motion_dimmer.models.MotionDimmer.dimmer_off_seconds",
+        "custom_components.motion_dimmer.core.MotionDimmer.dimmer_off_seconds",
         return_value=SMALL_TIME_OFF - 1,
         new_callable=PropertyMock,
     ):
@@ -459,7 +678,7 @@ async def test_extension():
 
     # Turn off dimmer for a medium time.
     with patch(
-        "custom_components.motion_dimmer.models.MotionDimmer.dimmer_off_seconds",
+        "custom_components.motion_dimmer.core.MotionDimmer.dimmer_off_seconds",
         return_value=LONG_TIME_OFF - 1,
         new_callable=PropertyMock,
     ):
@@ -474,7 +693,7 @@ async def test_extension():
 
     # Turn off for a long time.
     with patch(
-        "custom_components.motion_dimmer.models.MotionDimmer.dimmer_off_seconds",
+        "custom_components.motion_dimmer.core.MotionDimmer.dimmer_off_seconds",
         return_value=LONG_TIME_OFF + 1,
         new_callable=PropertyMock,
     ):
@@ -526,6 +745,126 @@ async def test_periodic_timer():
     ]
 
 
+def test_learned_extension():
+    """Test extending the timer by the learned pauses in motion."""
+    mock_adapter = MockAdapter()
+    clock = VirtualClock()
+    mock_adapter.clock = clock
+    mock_adapter.extension_strategy = EXTENSION_LEARNED
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    def motion(is_on: bool) -> None:
+        mock_adapter.are_triggers_on = is_on
+        motion_dimmer.trigger_state_callback("binary_sensor.motion", is_on)
+        if is_on:
+            motion_dimmer.triggered_callback()
+
+    # Nothing is learned before motion pauses.
+    motion(True)
+    assert motion_dimmer.additional_time == 0
+
+    # Motion keeps pausing for 20 seconds longer than the segment seconds.
+    for _ in range(5):
+        motion(False)
+        clock.advance(DEFAULT_SEG_SECONDS + 20)
+        motion(True)
+    assert motion_dimmer.additional_time == 20
+    assert motion_dimmer.end_time == clock.now() + timedelta(
+        seconds=DEFAULT_SEG_SECONDS + 20
+    )
+
+    # Leaving the room counts as needing no extension.
+    motion(False)
+    clock.advance(LONG_TIME_OFF)
+    motion(True)
+    segments = motion_dimmer.as_dict()["extension"]["segments"]
+    assert segments["seg_1"]["mean"] == 16
+
+    # Each segment learns on its own.
+    mock_adapter.segment_id = "seg_2"
+    motion_dimmer.triggered_callback()
+    assert motion_dimmer.additional_time == 0
+    assert list(segments) == ["seg_1"]
+
+    # The fixed rules can be chosen again.
+    mock_adapter.extension_strategy = EXTENSION_HEURISTIC
+    assert motion_dimmer.extension.name == EXTENSION_HEURISTIC
+
+
+def test_learned_extension_restart():
+    """Test pauses are measured against the timer, not motion stopping."""
+    mock_adapter = MockAdapter()
+    clock = VirtualClock()
+    mock_adapter.clock = clock
+    mock_adapter.are_triggers_on = True
+    mock_adapter.extension_strategy = EXTENSION_LEARNED
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # The periodic check restarts the timer 10 seconds before motion stops.
+    motion_dimmer.trigger_state_callback("binary_sensor.motion", True)
+    motion_dimmer.triggered_callback()
+    clock.advance(50)
+    motion_dimmer.periodic_callback()
+    clock.advance(10)
+    mock_adapter.are_triggers_on = False
+    motion_dimmer.trigger_state_callback("binary_sensor.motion", False)
+
+    # Motion comes back 10 seconds after the segment seconds, which is 20
+    # seconds after the timer ran out.
+    clock.advance(DEFAULT_SEG_SECONDS + 10)
+    mock_adapter.are_triggers_on = True
+    motion_dimmer.trigger_state_callback("binary_sensor.motion", True)
+    segments = motion_dimmer.as_dict()["extension"]["segments"]
+    assert segments["seg_1"]["mean"] == 20
+
+    # A pause while the timer is not running is not learned.
+    mock_adapter.are_triggers_on = False
+    motion_dimmer.timer_callback()
+    motion_dimmer.trigger_state_callback("binary_sensor.motion", False)
+    clock.advance(5)
+    mock_adapter.are_triggers_on = True
+    motion_dimmer.trigger_state_callback("binary_sensor.motion", True)
+    assert motion_dimmer.as_dict()["extension"]["segments"] == segments
+
+
+def test_adaptive_interval():
+    """Test learning the trigger test interval from the trigger hold times."""
+    mock_adapter = MockAdapter()
+    clock = VirtualClock()
+    mock_adapter.clock = clock
+    mock_adapter.is_interval_adaptive = True
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # The configured interval is used until a trigger turned off.
+    assert motion_dimmer.trigger_interval == DEFAULT_TRIGGER_INTERVAL
+    for _ in range(5):
+        motion_dimmer.trigger_state_callback("binary_sensor.pir", True)
+        clock.advance(4)
+        motion_dimmer.trigger_state_callback("binary_sensor.pir", False)
+        clock.advance(100)
+
+    # The trigger reliably turns off, so the timer checks it.
+    assert motion_dimmer.holds.longest() == 4
+    assert motion_dimmer.trigger_interval == DEFAULT_SEG_SECONDS
+    mock_adapter.seconds = 300
+    assert motion_dimmer.trigger_interval == 300
+
+    # A trigger that stays on needs the periodic check.
+    motion_dimmer.trigger_state_callback("binary_sensor.mmwave", True)
+    clock.advance(DEFAULT_TRIGGER_INTERVAL)
+    assert motion_dimmer.trigger_interval == DEFAULT_TRIGGER_INTERVAL
+    motion_dimmer.trigger_state_callback("binary_sensor.mmwave", False)
+    assert motion_dimmer.holds.as_dict()["binary_sensor.mmwave"]["mean"] == 59
+
+    # The interval is not learned unless asked, and 0 still disables it.
+    mock_adapter.is_interval_adaptive = False
+    mock_adapter.trigger_interval = 10
+    assert motion_dimmer.trigger_interval == 10
+    mock_adapter.is_interval_adaptive = True
+    mock_adapter.trigger_interval = 0
+    assert motion_dimmer.trigger_interval == 0
+
+
 async def test_init_timer():
     """Test initialize timer on restart."""
 
@@ -562,3 +901,136 @@ async def test_init_timer():
 
     # Dimmer stopped after restart.
     assert entry_keys(events) == TURN_OFF_EVENTS
+
+
+async def test_trace():
+    """Test the event trace."""
+
+    mock_adapter = MockAdapter()
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # Decisions are recorded for each callback.
+    motion_dimmer.triggered_callback()
+    motion_dimmer.periodic_callback()
+    mock_adapter.is_on = False
+    motion_dimmer.predictor_callback()
+    motion_dimmer.timer_callback()
+    trace = motion_dimmer.trace.as_list()
+    assert [(event["kind"], event["decision"]) for event in trace] == [
+        ("trigger", "on"),
+        ("periodic", "reschedule"),
+        ("predictor", "disabled"),
+        ("timer", "idle"),
+    ]
+    assert trace[0]["deadline"] is not None
+
+    # The buffer keeps only the most recent events.
+    trace = EventTrace(3)
+    for i in range(5):
+        trace.record("trigger", str(i), None)
+    assert len(trace) == 3
+    assert [event["decision"] for event in trace.as_list()] == ["2", "3", "4"]
+
+
+async def test_callback_budget():
+    """Test the slow callback detector."""
+
+    mock_adapter = MockAdapter()
+    motion_dimmer = MotionDimmer(mock_adapter)
+
+    # Callbacks are not checked without a budget.
+    motion_dimmer.triggered_callback()
+    assert motion_dimmer.stats.slow_callbacks == 0
+
+    # Every callback is slow with a tiny budget.
+    mock_adapter.callback_budgets = {"trigger": 1e-9}
+    mock_adapter.flush_entries()
+    for _ in range(SLOW_CALLBACK_STREAK):
+        motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events).count("raise_slow_callback_issue") == 1
+    assert get_entry_value(events, "raise_slow_callback_issue", "kind") == "trigger"
+    assert motion_dimmer.stats.slow_callbacks == SLOW_CALLBACK_STREAK
+    assert motion_dimmer.budget.slow == {"trigger": SLOW_CALLBACK_STREAK}
+    assert motion_dimmer.budget.worst["trigger"] > 0
+
+    # The issue is removed once the callbacks are fast again.
+    mock_adapter.callback_budgets = {"trigger": 60}
+    for _ in range(SLOW_CALLBACK_STREAK):
+        motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert entry_keys(events).count("clear_slow_callback_issue") == 1
+    assert motion_dimmer.budget.as_dict()["issue_raised"] is False
+
+
+async def test_load_shedding():
+    """Test dropping non-essential work when Home Assistant is busy."""
+
+    mock_adapter = MockAdapter()
+    motion_dimmer = MotionDimmer(mock_adapter)
+    mock_adapter.is_overloaded = True
+
+    # Predictions are dropped.
+    motion_dimmer.predictor_callback()
+    assert entry_keys(mock_adapter.flush_entries()) == []
+    assert motion_dimmer.stats.predictions_shed == 1
+
+    # Triggers are always served.
+    motion_dimmer.triggered_callback()
+    assert entry_keys(mock_adapter.flush_entries()) == TRIGGER_EVENTS
+
+    # Extending a running timer does not update the timer sensor.
+    mock_adapter.is_dimmer_on = True
+    motion_dimmer.triggered_callback()
+    events = mock_adapter.flush_entries()
+    assert "track_timer" not in entry_keys(events)
+    assert "schedule_timer" in entry_keys(events)
+    assert motion_dimmer.stats.timer_writes_shed == 1
+
+    # Stopping the timer is always written.
+    mock_adapter.are_triggers_on = False
+    motion_dimmer.timer_callback()
+    assert entry_keys(mock_adapter.flush_entries()) == TURN_OFF_EVENTS
+
+
+def test_core_without_home_assistant():
+    """Test the core logic imports without Home Assistant."""
+    check = (
+        "import sys; import custom_components.motion_dimmer.core; "
+        "assert not [m for m in sys.modules if m.startswith('homeassistant')]"
+    )
+    subprocess.run(
+        [sys.executable, "-c", check],
+        cwd=Path(__file__).parents[1],
+        check=True,
+    )
+
+
+def test_virtual_clock():
+    """Test running the Motion Dimmer on a virtual clock."""
+    mock_adapter = MockAdapter()
+    clock = VirtualClock()
+    mock_adapter.clock = clock
+    motion_dimmer = MotionDimmer(mock_adapter)
+    start = clock.now()
+
+    mock_adapter.are_triggers_on = True
+    motion_dimmer.triggered_callback()
+    assert motion_dimmer.end_time == start + timedelta(seconds=DEFAULT_SEG_SECONDS)
+
+    # Hours pass without waiting for them.
+    mock_adapter.is_dimmer_on = True
+    clock.advance(2 * 60 * 60)
+    assert motion_dimmer.dimmer_on_seconds == 2 * 60 * 60
+    assert motion_dimmer.dimmer_off_seconds == 0
+
+    # The extension is a fifth of the time the dimmer was on.
+    motion_dimmer.periodic_callback()
+    assert motion_dimmer.end_time == clock.now() + timedelta(
+        seconds=DEFAULT_SEG_SECONDS + 2 * 60 * 60 / 5
+    )
+
+    # The trace uses the same clock.
+    trace = motion_dimmer.trace.as_list()
+    assert trace[0]["time"] == start.isoformat()
+    assert trace[-1]["time"] == clock.now().isoformat()
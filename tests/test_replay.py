@@ -0,0 +1,192 @@
+"""Test replaying recorded events through a Motion Dimmer."""
+
+import json
+
+from custom_components.motion_dimmer.const import (
+    DEFAULT_MANUAL_OVERRIDE,
+    DEFAULT_PREDICTION_BRIGHTNESS,
+    DEFAULT_SEG_SECONDS,
+    PERIODIC_TIMER,
+    PUMP_LEARNED,
+    SENSOR_ACTIVE,
+    SENSOR_IDLE,
+)
+from custom_components.motion_dimmer.replay import (
+    DIMMER,
+    PREDICTOR,
+    TRIGGER,
+    Command,
+    DimmerSettings,
+    Replay,
+    ReplayEvent,
+    main,
+)
+
+START = 1_700_000_000.0
+MOTION = "binary_sensor.motion"
+HALLWAY = "binary_sensor.hallway"
+
+
+def event(seconds: float, kind: str, entity_id: str, state: str) -> ReplayEvent:
+    """Create an event some seconds after the start."""
+    return ReplayEvent(START + seconds, kind, entity_id, state)
+
+
+def test_replay():
+    """Test the commands and timers of a replay."""
+    events = [
+        event(0, TRIGGER, MOTION, "on"),
+        event(10, TRIGGER, MOTION, "off"),
+        event(200, PREDICTOR, HALLWAY, "on"),
+        event(202, TRIGGER, MOTION, "on"),
+        # The dimmer is turned off by hand while there is motion.
+        event(230, DIMMER, "light.dimmer", "off"),
+        event(235, TRIGGER, MOTION, "off"),
+        event(240, TRIGGER, MOTION, "on"),
+        event(245, TRIGGER, MOTION, "off"),
+    ]
+    result = Replay().run(events)
+
+    assert [
+        (command.time - START, command.service, command.brightness)
+        for command in result.commands
+    ] == [
+        (0, "turn_on", 255),
+        (DEFAULT_SEG_SECONDS, "turn_off", None),
+        (200, "turn_on", DEFAULT_PREDICTION_BRIGHTNESS),
+        (202, "turn_on", 255),
+        # Motion is ignored while manually overridden. The light is turned
+        # off once the override ends, although it is off already.
+        (235 + DEFAULT_MANUAL_OVERRIDE, "turn_off", None),
+    ]
+    assert result.redundant_turn_offs == 1
+    assert [
+        (timer.time - START, timer.end_time - START, timer.state)
+        for timer in result.timers
+    ] == [
+        (0, DEFAULT_SEG_SECONDS, SENSOR_ACTIVE),
+        (DEFAULT_SEG_SECONDS, DEFAULT_SEG_SECONDS, SENSOR_IDLE),
+        (200, 210, SENSOR_ACTIVE),
+        (202, 202 + DEFAULT_SEG_SECONDS, SENSOR_ACTIVE),
+        # The override ends 5 seconds after it expires.
+        (235 + DEFAULT_MANUAL_OVERRIDE, 235 + DEFAULT_MANUAL_OVERRIDE, SENSOR_IDLE),
+    ]
+
+    # The same events always give the same result.
+    assert Replay().run(reversed(events)) == result
+
+
+def test_replay_extension():
+    """Test motion that keeps going extends the timer."""
+    events = [
+        event(0, TRIGGER, MOTION, "on"),
+        event(1000, TRIGGER, MOTION, "off"),
+    ]
+    result = Replay(DimmerSettings(trigger_interval=50)).run(events)
+
+    # Each periodic check while there is motion turns the dimmer on again.
+    times = [command.time - START for command in result.commands]
+    assert times[:-1] == list(range(0, 1001, 50))
+    assert result.commands[-1].service == "turn_off"
+    assert result.timers[-1].state == SENSOR_IDLE
+
+    # The timer was extended while the dimmer was on.
+    last = result.timers[-2]
+    assert last.end_time - last.time > DEFAULT_SEG_SECONDS
+    assert result.timers[-1].time == last.end_time
+
+
+def test_replay_on_intervals():
+    """Test the on time is measured from the dimmer turning on and off."""
+    events = [event(0, TRIGGER, MOTION, "on"), event(5, TRIGGER, MOTION, "off")]
+    result = Replay().run(events)
+    assert [
+        (since - START, until - START) for since, until in result.on_intervals()
+    ] == [(0, DEFAULT_SEG_SECONDS)]
+
+    # A dimmer still on when the replay ends is on until the end.
+    result = Replay().run(events, until=START + 30)
+    assert [
+        (since - START, until - START) for since, until in result.on_intervals()
+    ] == [(0, 30)]
+
+    # A dimmer turned off from outside counts until then.
+    events.append(event(20, DIMMER, "light.dimmer", "off"))
+    result = Replay().run(events)
+    assert [
+        (since - START, until - START) for since, until in result.on_intervals()
+    ] == [(0, 20)]
+
+
+def test_replay_cli(tmp_path, capsys):
+    """Test replaying a file of events."""
+    path = tmp_path / "events.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps(
+                {
+                    "time": START + seconds,
+                    "dimmer": "kitchen",
+                    "kind": TRIGGER,
+                    "entity_id": MOTION,
+                    "state": state,
+                }
+            )
+            for seconds, state in ((0, "on"), (5, "off"))
+        )
+    )
+    main([str(path), "--seconds", "30"])
+
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(row["type"], row["time"] - START) for row in rows] == [
+        ("command", 0),
+        ("timer", 0),
+        ("command", 30),
+        ("timer", 30),
+    ]
+    assert Command(**{key: rows[0][key] for key in Command._fields}) == Command(
+        START, "turn_on", 255
+    )
+
+
+def test_replay_adaptive_interval():
+    """Test the adaptive interval skips the checks of short motion."""
+    events = [
+        event(seconds + pulse, TRIGGER, MOTION, state)
+        for seconds in range(0, 3600, 90)
+        for pulse, state in ((0, "on"), (5, "off"))
+    ]
+    fixed = Replay(DimmerSettings(segments={"default": 120})).run(events)
+    adaptive = Replay(
+        DimmerSettings(segments={"default": 120}, adaptive_interval=True)
+    ).run(events)
+
+    # The light does the same, only checking the triggers in between until
+    # the first time motion stops.
+    assert adaptive.commands == fixed.commands
+    assert fixed.wakeups[PERIODIC_TIMER] > 100
+    assert adaptive.wakeups[PERIODIC_TIMER] == 1
+
+
+def test_replay_learned_pump():
+    """Test the learned pump mode sends one command per dim activation."""
+    events = [
+        event(seconds + pulse, TRIGGER, MOTION, state)
+        for seconds in range(0, 3600, 600)
+        for pulse, state in ((0, "on"), (5, "off"))
+    ]
+    settings = {"segments": {"default": 60}, "brightness": 10, "brightness_min": 50}
+
+    def turn_ons(**kwargs) -> list:
+        result = Replay(DimmerSettings(**settings, **kwargs)).run(events)
+        return [
+            command.brightness
+            for command in result.commands
+            if command.service == "turn_on"
+        ]
+
+    assert turn_ons() == [50, 10] * 6
+    assert turn_ons(pump_mode=PUMP_LEARNED) == [10] * 6
+
+    # A dimmer that stays off at the brightness is pumped after the first try.
+    assert turn_ons(pump_mode=PUMP_LEARNED, turn_on_level=20) == [10] + [50, 10] * 6
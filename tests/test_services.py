@@ -1,6 +1,7 @@
 """Test Motion Dimmer services."""
 
 import logging
+import time
 
 from freezegun import freeze_time
 from homeassistant.core import HomeAssistant
@@ -9,17 +10,22 @@ from homeassistant.helpers import entity_registry as er
 
 from custom_components.motion_dimmer.const import (
     DEFAULT_MANUAL_OVERRIDE,
+    DOMAIN,
     SENSOR_DURATION,
     SENSOR_END_TIME,
+    SERVICE_APPLY,
+    SERVICE_AUTOTUNE,
     SERVICE_DISABLE,
     SERVICE_ENABLE,
     SERVICE_FINISH_TIMER,
+    SERVICE_GET_TRACE,
     SERVICE_HOURS,
     ControlEntities,
 )
-from custom_components.motion_dimmer.models import external_id
+from custom_components.motion_dimmer.entity import external_id
 from tests import (
     get_disable_delta,
+    get_field_state,
     setup_integration,
     turn_off_trigger,
     turn_on_segment,
@@ -30,7 +36,10 @@ from tests import (
 
 from .const import (
     CONFIG_NAME,
+    MOCK_BINARY_SENSOR_1_ID,
+    MOCK_OPTIONS,
 )
+from .test_history import create_database
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -87,3 +96,51 @@ async def test_services(hass: HomeAssistant):
 
         # Timer is no longer running.
         assert await get_timer_duration(hass) <= 1
+
+        # Get the trace of the events handled.
+        response = await hass.services.async_call(
+            DOMAIN,
+            SERVICE_GET_TRACE,
+            {"entity_id": timer_id},
+            blocking=True,
+            return_response=True,
+        )
+        decisions = [(e["kind"], e["decision"]) for e in response[CONFIG_NAME]]
+        assert decisions.index(("trigger", "on")) < decisions.index(("timer", "off"))
+
+
+async def test_autotune(hass: HomeAssistant, tmp_path):
+    """Test recommending and applying settings from the recorder history."""
+    await setup_integration(hass)
+    hass.config.config_dir = str(tmp_path)
+
+    # Motion comes back 20 seconds after it stops, every 5 minutes.
+    rows = [(MOCK_OPTIONS["input_select"], 0, "Seg 1", None)]
+    for visit in range(12):
+        for pulse in (0, 25):
+            seconds = visit * 300 + pulse
+            rows.append((MOCK_BINARY_SENSOR_1_ID, seconds, "on", None))
+            rows.append((MOCK_BINARY_SENSOR_1_ID, seconds + 5, "off", None))
+    database = hass.config.path("home-assistant_v2.db")
+    create_database(database, rows, time.time() - 3600)
+
+    timer_id = external_id(hass, ControlEntities.TIMER, CONFIG_NAME)
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_AUTOTUNE,
+        {"entity_id": timer_id},
+        blocking=True,
+        return_response=True,
+    )
+    assert response[CONFIG_NAME]["segments"]["Seg 1"] == 30
+    assert response[CONFIG_NAME]["false_off_rate"] == 0
+
+    # Nothing is applied unless asked.
+    seconds = ControlEntities.SEG_SECONDS
+    assert get_field_state(hass, seconds, "seg_1") != "30"
+
+    await call_service(
+        hass, SERVICE_AUTOTUNE, {"entity_id": timer_id, SERVICE_APPLY: True}
+    )
+    assert get_field_state(hass, seconds, "seg_1") == "30"
+    assert get_field_state(hass, ControlEntities.EXTENSION_MAX) == "0"
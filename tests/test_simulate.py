@@ -0,0 +1,100 @@
+"""Test the vectorized Motion Dimmer simulation."""
+
+import random
+
+import pytest
+
+from custom_components.motion_dimmer.const import DEFAULT_SEG_SECONDS
+from custom_components.motion_dimmer.replay import (
+    PREDICTOR,
+    TRIGGER,
+    DimmerSettings,
+    Replay,
+    ReplayEvent,
+)
+
+np = pytest.importorskip("numpy")
+
+from custom_components.motion_dimmer.simulate import (  # noqa: E402
+    pad,
+    replay_summary,
+    simulate,
+)
+
+START = 1_700_000_000.0
+
+
+def random_day(rng: random.Random, hours: int = 6) -> tuple[list, list, list]:
+    """Random trigger and predictor times."""
+    on, off, predictions = [], [], []
+    time = START
+    rate = rng.choice([60, 300, 900])
+    while (time := time + rng.expovariate(1 / rate)) < START + hours * 3600:
+        on.append(time)
+        if rng.random() < 0.3:
+            predictions.append(time - rng.uniform(1, 5))
+        time += rng.uniform(2, 150)
+        off.append(time)
+    return on, off, sorted(predictions)
+
+
+def test_simulate():
+    """Test the simulation of a single trigger."""
+    result = simulate(pad([[START]]), pad([[START + 10]]))
+
+    assert list(result.on_seconds) == [DEFAULT_SEG_SECONDS]
+    assert list(result.commands) == [2]
+    assert list(result.activations) == [1]
+    assert len(result.gaps) == 0
+
+
+@pytest.mark.parametrize(
+    ("seconds", "trigger_interval", "extension_max", "pump"),
+    [
+        (60, 59, 3600, False),
+        (10, 20, 300, True),
+        (120, 0, 0, False),
+        (30, 59, 3600, True),
+    ],
+)
+def test_simulate_matches_replay(seconds, trigger_interval, extension_max, pump):
+    """Test the simulation agrees with the Motion Dimmer logic."""
+    rng = random.Random(seconds + trigger_interval)
+    days = [random_day(rng) for _ in range(8)]
+    result = simulate(
+        pad([day[0] for day in days]),
+        pad([day[1] for day in days]),
+        pad([day[2] for day in days]),
+        seconds=seconds,
+        trigger_interval=trigger_interval,
+        extension_max=extension_max,
+        pump=pump,
+    )
+
+    settings = DimmerSettings(
+        segments={"default": seconds},
+        trigger_interval=trigger_interval,
+        extension_max=extension_max,
+        brightness=10 if pump else 255,
+        brightness_min=50 if pump else 1,
+    )
+    for index, (on, off, predictions) in enumerate(days):
+        events = (
+            [ReplayEvent(time, TRIGGER, "motion", "on") for time in on]
+            + [ReplayEvent(time, TRIGGER, "motion", "off") for time in off]
+            + [ReplayEvent(time, PREDICTOR, "hallway", "on") for time in predictions]
+            + [
+                ReplayEvent(time + 0.5, PREDICTOR, "hallway", "off")
+                for time in predictions
+            ]
+        )
+        on_seconds, commands, activations, gaps = replay_summary(
+            Replay(settings).run(events)
+        )
+
+        assert result.on_seconds[index] == pytest.approx(on_seconds)
+        assert result.commands[index] == commands
+        assert result.activations[index] == activations
+        assert sorted(result.gaps[result.gap_dimmers == index]) == pytest.approx(
+            sorted(gaps)
+        )
@@ -0,0 +1,139 @@
+"""Test sweeping Motion Dimmer settings."""
+
+import json
+import random
+
+from custom_components.motion_dimmer.const import EXTENSION_HEURISTIC, EXTENSION_LEARNED
+from custom_components.motion_dimmer.replay import (
+    DIMMER,
+    TRIGGER,
+    DimmerSettings,
+    Replay,
+    ReplayEvent,
+)
+from custom_components.motion_dimmer.sweep import evaluate, grid, main, sweep
+
+START = 1_700_000_000.0
+MOTION = "binary_sensor.motion"
+LIGHT = "light.dimmer"
+
+
+def motion(*pulses: tuple[float, float]) -> list[ReplayEvent]:
+    """Motion events from pulses of seconds after the start."""
+    return [
+        ReplayEvent(START + seconds, TRIGGER, MOTION, state)
+        for pulse in pulses
+        for seconds, state in zip(pulse, ("on", "off"))
+    ]
+
+
+def test_grid():
+    """Test the combinations of settings."""
+    assert grid(seconds=[30, 60], extension_max=[0]) == [
+        {"seconds": 30, "extension_max": 0},
+        {"seconds": 60, "extension_max": 0},
+    ]
+
+
+def test_evaluate():
+    """Test measuring false-offs, on time and commands."""
+    # Motion comes back 10 seconds after a 60 second timer runs out.
+    events = motion((0, 5), (70, 75))
+
+    short = evaluate("kitchen", events, {"seconds": 60, "trigger_interval": 0})
+    assert short.false_offs == 1
+    assert short.on_hours == 120 / 3600
+    assert short.commands_per_hour == 4 / (75 / 3600)
+
+    # A longer timer keeps the light on.
+    long = evaluate("kitchen", events, {"seconds": 90, "trigger_interval": 0})
+    assert long.false_offs == 0
+    assert long.commands_per_hour == 3 / (75 / 3600)
+
+    # Motion that comes back later is not a false-off.
+    later = evaluate("kitchen", events, {"seconds": 60}, false_off_secs=5)
+    assert later.false_offs == 0
+
+
+def test_recorded_dimmer_ignored():
+    """Test the dimmer states recorded with other settings are not replayed."""
+    # History recorded with a 60 second timer.
+    pulses = [(visit * 300, visit * 300 + 5) for visit in range(12)]
+    events = motion(*pulses)
+    recorded = Replay(DimmerSettings(trigger_interval=0)).run(events)
+    history = sorted(
+        events
+        + [
+            ReplayEvent(time, DIMMER, LIGHT, "on" if is_on else "off", None)
+            for time, is_on in recorded.transitions
+        ],
+        key=lambda event: event.time,
+    )
+
+    # A longer timer keeps the light on for longer, and still turns it off.
+    for seconds in (90, 120):
+        result = evaluate("kitchen", history, {"seconds": seconds})
+        expected = evaluate("kitchen", events, {"seconds": seconds})
+        assert result.on_hours == expected.on_hours
+        assert result.on_hours == 12 * seconds / 3600
+        assert result.turn_offs == 12
+
+
+def test_learned_extension():
+    """Test the learned extension turns the light off on fewer people."""
+    rng = random.Random(1)
+    pulses = []
+    time = 0.0
+    for _ in range(40):
+        # Someone sits still for up to a few minutes, then leaves.
+        for _ in range(rng.randint(3, 15)):
+            pulses.append((time, time + 4))
+            time += 4 + rng.uniform(20, 150)
+        time += rng.uniform(1800, 7200)
+    events = motion(*pulses)
+
+    heuristic = evaluate(
+        "office", events, {"seconds": 60, "extension_strategy": EXTENSION_HEURISTIC}
+    )
+    learned = evaluate(
+        "office", events, {"seconds": 60, "extension_strategy": EXTENSION_LEARNED}
+    )
+    assert learned.false_offs < heuristic.false_offs
+    assert learned.commands_per_hour < heuristic.commands_per_hour
+
+
+def test_sweep():
+    """Test sweeping settings in worker processes."""
+    streams = {
+        "kitchen": motion((0, 5), (70, 75)),
+        "hallway": motion((0, 100)),
+    }
+    combinations = grid(seconds=[60, 90], trigger_interval=[0, 59])
+    results = sweep(streams, combinations, workers=2)
+
+    assert [(result.dimmer, result.settings) for result in results] == [
+        (dimmer, settings) for dimmer in streams for settings in combinations
+    ]
+    assert results == [
+        evaluate(dimmer, streams[dimmer], settings)
+        for dimmer in streams
+        for settings in combinations
+    ]
+
+
+def test_sweep_cli(tmp_path, capsys):
+    """Test sweeping a file of events."""
+    path = tmp_path / "events.jsonl"
+    path.write_text(
+        "\n".join(
+            json.dumps({"dimmer": "kitchen", **event._asdict()})
+            for event in motion((0, 5), (70, 75))
+        )
+    )
+    main([str(path), "--seconds", "60", "90", "--workers", "1"])
+
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(row["settings"]["seconds"], row["false_offs"]) for row in rows] == [
+        (60, 1),
+        (90, 0),
+    ]
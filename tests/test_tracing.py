@@ -0,0 +1,201 @@
+"""Test Motion Dimmer tracing."""
+
+import asyncio
+import json
+import logging
+import tracemalloc
+from unittest.mock import patch
+
+from homeassistant.core import HomeAssistant
+import pytest
+
+from custom_components.motion_dimmer import tracing
+from custom_components.motion_dimmer.const import (
+    DOMAIN,
+    SERVICE_CAPTURE_TRACE,
+    SERVICE_DURATION,
+    SERVICE_FINISH_TIMER,
+    ControlEntities,
+)
+from custom_components.motion_dimmer.core import EventTrace
+from custom_components.motion_dimmer.entity import external_id
+from custom_components.motion_dimmer.tracing import (
+    CallProfiler,
+    ChromeTrace,
+    MemoryGrowth,
+    instrumented,
+)
+from tests import call_service, setup_integration
+
+from .const import CONFIG_NAME, MOCK_BINARY_SENSOR_1_ID
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Traced:
+    """Class with instrumented methods."""
+
+    device_id = "traced"
+
+    @instrumented("callback")
+    def run(self, value):
+        """Run synchronously."""
+        return value
+
+    @instrumented("adapter")
+    async def async_run(self, value):
+        """Run asynchronously."""
+        return value
+
+
+async def test_chrome_trace():
+    """Test recording spans."""
+    traced = Traced()
+
+    # Nothing is recorded without a capture.
+    capture = ChromeTrace(max_events=2)
+    assert traced.run(1) == 1
+    assert len(capture) == 0
+
+    assert tracing.start(capture)
+    # Only one capture of each type can run.
+    assert not tracing.start(ChromeTrace())
+    assert traced.run(2) == 2
+    assert await traced.async_run(3) == 3
+    assert traced.run(4) == 4
+    tracing.stop(capture)
+    assert traced.run(5) == 5
+
+    assert len(capture) == 2
+    assert capture.dropped == 1
+    events = capture.as_dict()["traceEvents"]
+    spans = [event for event in events if event["ph"] != "M"]
+    assert [span["ph"] for span in spans] == ["X", "b", "e"]
+    assert [span["name"] for span in spans] == [
+        "Traced.run",
+        "Traced.async_run",
+        "Traced.async_run",
+    ]
+    assert [span["cat"] for span in spans] == ["callback", "adapter", "adapter"]
+    assert spans[0]["args"] == {"dimmer": "traced"}
+    # Coroutine spans are async events matched by their id.
+    assert spans[1]["id"] == spans[2]["id"]
+    assert spans[1]["ts"] <= spans[2]["ts"]
+    assert [event["ph"] for event in events].count("M") == 1
+
+
+async def test_chrome_trace_overlap():
+    """Test coroutines that wait at the same time get their own spans."""
+    capture = ChromeTrace()
+
+    @instrumented("service")
+    async def wait(delay):
+        await asyncio.sleep(delay)
+
+    assert tracing.start(capture)
+    await asyncio.gather(wait(0.02), wait(0.01))
+    tracing.stop(capture)
+
+    events = capture.as_dict()["traceEvents"]
+    begins = {event["id"]: event["ts"] for event in events if event["ph"] == "b"}
+    ends = {event["id"]: event["ts"] for event in events if event["ph"] == "e"}
+    assert len(capture) == 2
+    assert begins.keys() == ends.keys()
+    # The second coroutine ends inside the first one without nesting in it.
+    first, second = sorted(begins, key=begins.get)
+    assert begins[first] <= begins[second] < ends[second] < ends[first]
+
+
+async def test_call_profiler(tmp_path):
+    """Test profiling instrumented calls."""
+    traced = Traced()
+    profiler = CallProfiler()
+    assert profiler.stats() is None
+    assert profiler.summary(5) == []
+
+    assert tracing.start(profiler)
+    # Calls on the event loop are not profiled.
+    assert traced.run(1) == 1
+    assert await traced.async_run(2) == 2
+    assert await asyncio.to_thread(traced.run, 3) == 3
+    assert await asyncio.to_thread(traced.run, 4) == 4
+    tracing.stop(profiler)
+
+    assert len(profiler) == 2
+    assert profiler.loop_calls == 2
+    summary = profiler.summary(50)
+    assert len(summary) <= 50
+    run = next(row for row in summary if row["function"].endswith("(run)"))
+    assert run["calls"] == 2
+
+    path = tmp_path / "profile.prof"
+    profiler.stats().dump_stats(path)
+    assert path.stat().st_size > 0
+
+
+async def test_memory_growth():
+    """Test comparing memory snapshots."""
+    growth = MemoryGrowth()
+    assert growth.start()
+    # Only one comparison can run.
+    assert not MemoryGrowth().start()
+    trace = EventTrace(50)
+    for index in range(50):
+        trace.record("trigger", f"decision {index}", None)
+    unrelated = [[index] * 100 for index in range(100)]
+    response = growth.stop(5)
+
+    assert response["traced_memory"] > 0
+    sites = response["sites"]
+    assert 0 < len(sites) <= 5
+    assert any(site["site"].startswith("core.py:") for site in sites)
+    # Allocations outside the package are left out.
+    assert not any("test_tracing" in site["site"] for site in sites)
+    assert len(unrelated) == 100
+    assert not tracemalloc.is_tracing()
+
+    # A failed snapshot does not keep later comparisons from running.
+    with patch.object(MemoryGrowth, "_snapshot", side_effect=MemoryError):
+        with pytest.raises(MemoryError):
+            MemoryGrowth().start()
+    assert not tracemalloc.is_tracing()
+    growth = MemoryGrowth()
+    assert growth.start()
+    growth.stop(5)
+
+
+async def test_capture_service(hass: HomeAssistant, tmp_path):
+    """Test the capture service."""
+    config_entry = await setup_integration(hass)
+    hass.config.config_dir = str(tmp_path)
+
+    capture = hass.async_create_task(
+        hass.services.async_call(
+            DOMAIN,
+            SERVICE_CAPTURE_TRACE,
+            {SERVICE_DURATION: 0.5},
+            blocking=True,
+            return_response=True,
+        )
+    )
+    await asyncio.sleep(0)
+    hass.states.async_set(MOCK_BINARY_SENSOR_1_ID, "on")
+    response = await capture
+    await hass.async_block_till_done()
+
+    with open(response["path"], encoding="utf-8") as file:
+        trace = json.load(file)
+
+    names = {event["name"] for event in trace["traceEvents"]}
+    assert "MotionDimmer.triggered_callback" in names
+    assert "MotionDimmerHA.async_turn_on_light" in names
+    assert "MotionDimmerHA.async_run_dispatched" in names
+    assert response["spans"] > 0
+
+    # Stop the timers started by the trigger.
+    hass.states.async_set(MOCK_BINARY_SENSOR_1_ID, "off")
+    timer_id = external_id(hass, ControlEntities.TIMER, CONFIG_NAME)
+    await call_service(hass, SERVICE_FINISH_TIMER, {"entity_id": timer_id})
+
+    assert await config_entry.async_unload(hass)
+    await hass.async_block_till_done()